@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import time
+
+from furiosacli import consts
+from furiosacli.aio import AsyncSession
+from furiosacli.clidriver import Session
+from furiosacli.commands import Optimize
+from furiosacli.fakeserver import FakeApiServer
+
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 50))
+LATENCY = float(os.environ.get('BENCH_LATENCY', 0.05))
+MODEL = b'\0' * 1024 * 1024
+
+
+def bench_sync(session) -> float:
+    start = time.perf_counter()
+    for _ in range(CONCURRENCY):
+        Optimize.optimize(session, MODEL)
+    return time.perf_counter() - start
+
+
+async def bench_async(session) -> float:
+    async with AsyncSession(session, pool_size=CONCURRENCY) as aio_session:
+        start = time.perf_counter()
+        await asyncio.gather(*[aio_session.optimize(MODEL) for _ in range(CONCURRENCY)])
+        return time.perf_counter() - start
+
+
+def main():
+    with FakeApiServer(latency=LATENCY) as server:
+        os.environ[consts.FURIOSA_API_ENDPOINT_ENV] = server.endpoint
+        os.environ.setdefault(consts.FURIOSA_ACCESS_KEY_ID_ENV, 'bench')
+        os.environ.setdefault(consts.SECRET_ACCESS_KEY_ENV, 'bench')
+
+        with Session() as session:
+            sync_secs = bench_sync(session)
+            async_secs = asyncio.run(bench_async(session))
+
+    print('{} optimize calls of a 1 MiB model, {:.0f} ms server latency'.format(CONCURRENCY, LATENCY * 1000))
+    print('sync (sequential):      {:8.3f} s  {:8.1f} calls/s'.format(sync_secs, CONCURRENCY / sync_secs))
+    print('async (asyncio.gather): {:8.3f} s  {:8.1f} calls/s'.format(async_secs, CONCURRENCY / async_secs))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from furiosacli import consts
+from furiosacli.cache import format_size, parse_size
+from furiosacli.clidriver import Session
+from furiosacli.commands import BuildCalibrationModel, Optimize, Perf, Quantize
+from furiosacli.fakeserver import FakeApiServer
+from furiosacli.tasks import TaskPoller, submit_compile
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 100))
+CONCURRENCY = int(os.environ.get('BENCH_CONCURRENCY', 16))
+LATENCY = float(os.environ.get('BENCH_LATENCY', 0.01))
+FAILURE_RATE = float(os.environ.get('BENCH_FAILURE_RATE', 0.0))
+MODEL_SIZE = parse_size(os.environ.get('BENCH_MODEL_SIZE', '4M'))
+PAYLOAD_SIZE = parse_size(os.environ.get('BENCH_PAYLOAD_SIZE', '1M'))
+COMPILE_TIME = float(os.environ.get('BENCH_COMPILE_TIME', 0.05))
+POLL_INTERVAL = 0.01
+
+
+def compile_task(session, model, output_path):
+    task = submit_compile(session, model, '~', '~', 'enf')
+    TaskPoller(interval=POLL_INTERVAL, backoff=1.0, quiet=True).wait([task])
+    assert task.is_succeeded(), task.get_error_message()
+    return task.save_artifact('ir', output_path)
+
+
+def get_json(session, api_path):
+    r = session.http.get('{}/{}'.format(session.api_endpoint, api_path))
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+COMMANDS = {
+    'version': lambda session, model, output_path: get_json(session, 'version'),
+    'toolchain list': lambda session, model, output_path: get_json(session, 'api/v1/compiler'),
+    'perf': lambda session, model, output_path:
+        Perf.perf_to_file(session, model, output_path, api_path='api/v1/perf'),
+    'perfeye': lambda session, model, output_path: Perf.perf_to_file(session, model, output_path),
+    'optimize': lambda session, model, output_path: Optimize.optimize_to_file(session, model, output_path),
+    'build_calibration_model': lambda session, model, output_path:
+        BuildCalibrationModel.build_calibration_model_to_file(session, model, output_path),
+    'quantize': lambda session, model, output_path:
+        Quantize.quantize_to_file(session, model, {'input': (0.0, 1.0)}, output_path),
+    'compile': compile_task,
+}
+
+
+def run(session, command, model, output_dir, concurrency):
+    def call(idx):
+        start = time.perf_counter()
+        try:
+            COMMANDS[command](session, model, os.path.join(output_dir, 'output.{}'.format(idx % concurrency)))
+            return (time.perf_counter() - start) * 1000, None
+        except Exception as e:
+            return (time.perf_counter() - start) * 1000, e
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if concurrency == 1:
+            results = [call(idx) for idx in range(ITERATIONS)]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(call, range(ITERATIONS)))
+        wall_clock_secs = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies = sorted(elapsed for elapsed, error in results)
+    errors = sum(1 for elapsed, error in results if error is not None)
+    print('{:<24} {:>5} {:>7} {:>9.1f} {:>10.2f} {:>10.2f} {:>10.2f} {:>11}'
+          .format(command, concurrency, errors, ITERATIONS / wall_clock_secs,
+                  latencies[len(latencies) // 2],
+                  latencies[max(int(len(latencies) * 0.99) - 1, 0)],
+                  statistics.mean(latencies),
+                  format_size(peak)))
+
+
+def main():
+    commands = sys.argv[1:] or list(COMMANDS)
+    unknown = [command for command in commands if command not in COMMANDS]
+    if unknown:
+        print('unknown commands: {} (available: {})'.format(', '.join(unknown), ', '.join(COMMANDS)))
+        return 1
+
+    with FakeApiServer(latency=LATENCY,
+                       failure_rate=FAILURE_RATE,
+                       payload_size=PAYLOAD_SIZE,
+                       compile_time=COMPILE_TIME) as server, tempfile.TemporaryDirectory() as output_dir:
+        os.environ[consts.FURIOSA_API_ENDPOINT_ENV] = server.endpoint
+        os.environ.setdefault(consts.FURIOSA_ACCESS_KEY_ID_ENV, 'bench')
+        os.environ.setdefault(consts.SECRET_ACCESS_KEY_ENV, 'bench')
+        os.environ.setdefault(consts.FURIOSA_HTTP_POOL_SIZE_ENV, str(CONCURRENCY))
+        model = b'\0' * MODEL_SIZE
+
+        print('{} calls per command, {} model, {} results, {:.0f} ms server latency, {:.1%} failure rate'
+              .format(ITERATIONS, format_size(MODEL_SIZE), format_size(PAYLOAD_SIZE), LATENCY * 1000,
+                      FAILURE_RATE))
+        print('{:<24} {:>5} {:>7} {:>9} {:>10} {:>10} {:>10} {:>11}'
+              .format('command', 'conc', 'errors', 'calls/s', 'p50 ms', 'p99 ms', 'mean ms', 'peak mem'))
+        with Session() as session:
+            for command in commands:
+                for concurrency in (1, CONCURRENCY):
+                    run(session, command, model, output_dir, concurrency)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from furiosacli import compression, consts
+from furiosacli.cache import format_size, parse_size
+from furiosacli.clidriver import Session
+from furiosacli.commands import Perf
+from furiosacli.fakeserver import FakeApiServer
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 3))
+MODEL_SIZE = parse_size(os.environ.get('BENCH_MODEL_SIZE', '32M'))
+BANDWIDTH = parse_size(os.environ.get('BENCH_BANDWIDTH', '10M'))
+# the size of the perfeye html downloaded back, well above the size the fake server starts compressing at
+PAYLOAD_SIZE = parse_size(os.environ.get('BENCH_PAYLOAD_SIZE', '4M'))
+
+
+def synthetic_model(size: int) -> bytes:
+    # int8 weights of a normal distribution, which compress about as well as a quantized model
+    distribution = statistics.NormalDist(0, 16)
+    table = bytes(int(round(distribution.inv_cdf((idx + 0.5) / 256))) & 0xff for idx in range(256))
+    return random.Random(0).randbytes(size).translate(table)
+
+
+def run(server, model_path, output_path, mode):
+    os.environ[consts.FURIOSA_COMPRESSION_ENV] = mode
+    elapsed = []
+    uploaded = downloaded = 0
+    for _ in range(ITERATIONS):
+        received = server.received_bytes
+        with Session() as session:
+            # a response advertising the accepted encodings, as the first request of a command would get
+            session.http.get('{}/version'.format(session.api_endpoint))
+            start = time.perf_counter()
+            Perf.perf_to_file(session, model_path, output_path)
+            elapsed.append(time.perf_counter() - start)
+            download = next(phase for phase in session.metrics.phases if phase['phase'] == 'download')
+        uploaded = server.received_bytes - received
+        downloaded = download.get('wire_bytes', download['bytes'])
+    print('{:<6} {:>14} {:>14} {:>10.2f} {:>10.2f}'
+          .format(mode, format_size(uploaded), format_size(downloaded), min(elapsed), statistics.mean(elapsed)))
+
+
+def main():
+    modes = ['none', 'gzip'] + (['zstd'] if compression.zstd_available() else [])
+    with FakeApiServer(bandwidth=BANDWIDTH, payload_size=PAYLOAD_SIZE) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ[consts.FURIOSA_API_ENDPOINT_ENV] = server.endpoint
+        os.environ.setdefault(consts.FURIOSA_ACCESS_KEY_ID_ENV, 'bench')
+        os.environ.setdefault(consts.SECRET_ACCESS_KEY_ENV, 'bench')
+        # every iteration uploads the model
+        os.environ[consts.FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV] = 'off'
+        model_path = os.path.join(tmp_dir, 'model.tflite')
+        with open(model_path, 'wb') as model_file:
+            model_file.write(synthetic_model(MODEL_SIZE))
+
+        print('model: {}, result: {}, link: {}/s, {} iteration(s)'
+              .format(format_size(MODEL_SIZE), format_size(PAYLOAD_SIZE), format_size(BANDWIDTH), ITERATIONS))
+        print('{:<6} {:>14} {:>14} {:>10} {:>10}'.format('MODE', 'UPLOADED', 'DOWNLOADED', 'BEST (s)', 'MEAN (s)'))
+        for mode in modes:
+            run(server, model_path, os.path.join(tmp_dir, 'output.html'), mode)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+from furiosacli import consts, http
+from furiosacli.clidriver import Session
+from furiosacli.fakeserver import FakeApiServer
+
+ITERATIONS = int(os.environ.get('BENCH_ITERATIONS', 500))
+
+
+def measure(name, call):
+    latencies = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        r = call()
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert r.status_code == 200, r.text
+    latencies.sort()
+    print('{:<24} p50: {:7.3f} ms  p99: {:7.3f} ms  mean: {:7.3f} ms'
+          .format(name, latencies[len(latencies) // 2],
+                  latencies[int(len(latencies) * 0.99) - 1],
+                  statistics.mean(latencies)))
+    return statistics.mean(latencies)
+
+
+def main():
+    with FakeApiServer() as server:
+        os.environ[consts.FURIOSA_API_ENDPOINT_ENV] = server.endpoint
+        os.environ.setdefault(consts.FURIOSA_ACCESS_KEY_ID_ENV, 'bench')
+        os.environ.setdefault(consts.SECRET_ACCESS_KEY_ENV, 'bench')
+        url = '{}/version'.format(server.endpoint)
+
+        with Session() as session:
+            auth = http.ApiKeyAuth(session)
+            connections = server.connections
+            unpooled = measure('requests.get (no pool)',
+                               lambda: requests.get(url, headers=http.DEFAULT_HEADERS, auth=auth))
+            unpooled_connections = server.connections - connections
+
+            connections = server.connections
+            pooled = measure('Session.http.get (pool)', lambda: session.http.get(url))
+            pooled_connections = server.connections - connections
+
+        print('TCP connections opened: {} without pool, {} with pool'
+              .format(unpooled_connections, pooled_connections))
+        print('per-request latency: {:.1f}% lower with the pooled session'
+              .format((1 - pooled / unpooled) * 100))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,29 @@
+import statistics
+import subprocess
+import sys
+import time
+
+from test import importtime
+
+RUNS = 10
+
+
+def main():
+    wall_times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'furiosacli', '--help'], capture_output=True)
+        wall_times.append((time.perf_counter() - start) * 1000)
+    print('furiosa --help: median {:.1f} ms, min {:.1f} ms over {} runs'
+          .format(statistics.median(wall_times), min(wall_times), RUNS))
+
+    imports = importtime.measure_imports()
+    print('furiosacli import time: {:.1f} ms'.format(importtime.package_import_time(imports) / 1000))
+    print('heavy modules on startup: {}'.format(importtime.heavy_imports(imports) or 'none'))
+    print('slowest imports (cumulative):')
+    for name, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:10]:
+        print('  {:<40} {:8.1f} ms'.format(name, cumulative / 1000))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,5 +2,15 @@ __version__ = '0.2.1'
 
 __all__ = ['consts', 'commands', 'clidriver']
 
-from . import commands
-from .clidriver import Session
+
+def __getattr__(name):
+    # commands and clidriver are imported on first access, so importing furiosacli stays cheap
+    if name in __all__:
+        import importlib
+
+        return importlib.import_module('.{}'.format(name), __name__)
+    if name == 'Session':
+        from .clidriver import Session
+
+        return Session
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
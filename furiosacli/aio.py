@@ -0,0 +1,390 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from furiosacli import consts, http
+from furiosacli.exceptions import ApiError, CliError
+from furiosacli.http import ModelSource, model_name
+from furiosacli.tasks import DEFAULT_MAX_POLL_INTERVAL, DEFAULT_POLL_BACKOFF, DEFAULT_POLL_INTERVAL, CompileTask, \
+    TaskPoller
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class BufferedResponse(object):
+    # The minimal response interface ApiError expects, built from a fully read aiohttp response
+    def __init__(self, status_code: int, body: bytes):
+        self.status_code = status_code
+        self.content = body
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class SourceReader(io.RawIOBase):
+    # A file object of the caller as an aiohttp payload: every attempt reads it again from the position it had,
+    # and aiohttp closing the payload after sending it leaves the file of the caller open
+    def __init__(self, model, position: int = None):
+        super().__init__()
+        self.model = model
+        if position is not None:
+            model.seek(position)
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self.model.read(size)
+
+    def readinto(self, buffer) -> int:
+        chunk = self.model.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def seekable(self) -> bool:
+        return hasattr(self.model, 'seek')
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.model.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.model.tell()
+
+    def fileno(self) -> int:
+        return self.model.fileno()
+
+    def close(self):
+        pass
+
+
+class AsyncCompileTask(CompileTask):
+    # A compile task of the compile task api, polled and fetched on the event loop of its AsyncSession
+    async def refresh(self) -> Dict:
+        self.status = await self.session.get_json(self.url, 'get the compile task {}'.format(self.task_id))
+        return self.status
+
+    async def cancel(self):
+        async with await self.session.send('DELETE', self.url) as r:
+            body = await r.read()
+            if r.status != 200:
+                raise ApiError('fail to cancel the compile task {}'.format(self.task_id),
+                               BufferedResponse(r.status, body))
+            self.status = json.loads(body)
+
+    async def artifact(self, artifact: str, target_ir: str = None, output_path: str = None):
+        # the artifact, or its size once it has been written into output_path
+        url = '{}/{}'.format(self.url, artifact)
+        if target_ir is not None:
+            url += '?target_ir={}'.format(target_ir)
+        async with await self.session.send('GET', url) as r:
+            if r.status != 200:
+                raise ApiError('fail to get the {} of the compile task {}'.format(artifact, self.task_id),
+                               BufferedResponse(r.status, await r.read()))
+            if output_path is None:
+                return await r.read()
+            return await AsyncSession.save_response(r, output_path)
+
+    async def save_artifact(self, artifact: str, output_path: str, target_ir: str = None) -> int:
+        return await self.artifact(artifact, target_ir, output_path)
+
+    async def get_ir(self, target_ir: str = None) -> bytes:
+        return await self.artifact('ir', target_ir)
+
+    async def get_compiler_report(self) -> str:
+        return (await self.artifact('compiler-report')).decode('utf-8', errors='replace')
+
+    async def get_memory_alloc_report(self) -> str:
+        return (await self.artifact('memory-alloc-report')).decode('utf-8', errors='replace')
+
+
+class ExecutorCompileTask(object):
+    # A finished compile task of furiosa.client behind the interface of AsyncCompileTask. The client only
+    # blocks, so its calls run in the default executor.
+    def __init__(self, task: CompileTask):
+        self.task = task
+        self.task_id = task.task_id
+
+    def __getattr__(self, name: str):
+        return getattr(self.task, name)
+
+    async def call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def refresh(self) -> Dict:
+        return await self.call(self.task.refresh)
+
+    async def cancel(self):
+        await self.call(self.task.cancel)
+
+    async def save_artifact(self, artifact: str, output_path: str, target_ir: str = None) -> int:
+        return await self.call(self.task.save_artifact, artifact, output_path, target_ir)
+
+    async def get_ir(self, target_ir: str = None) -> bytes:
+        return await self.call(self.task.get_ir, target_ir)
+
+    async def get_compiler_report(self) -> str:
+        return await self.call(self.task.get_compiler_report)
+
+    async def get_memory_alloc_report(self) -> str:
+        return await self.call(self.task.get_memory_alloc_report)
+
+
+class AsyncSession(object):
+    # An asyncio counterpart of the blocking commands, sharing one pooled aiohttp.ClientSession.
+    # It takes the endpoint and credentials of a clidriver.Session and is safe to use concurrently from one loop.
+    def __init__(self, session,
+                 pool_size: int = consts.DEFAULT_HTTP_POOL_SIZE,
+                 connect_timeout: float = consts.DEFAULT_HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = consts.DEFAULT_HTTP_READ_TIMEOUT,
+                 retry_policy: http.RetryPolicy = None):
+        if aiohttp is None:
+            raise CliError('furiosacli.aio requires aiohttp (pip install furiosacli[aio])', 1)
+
+        self.session = session
+        self.api_endpoint = session.api_endpoint
+        # the same retries as the blocking commands, from FURIOSA_HTTP_MAX_RETRIES and FURIOSA_HTTP_RETRY_*
+        options = getattr(session, 'http_options', {})
+        self.retry_policy = retry_policy or http.RetryPolicy(
+            options.get('max_retries', consts.DEFAULT_HTTP_MAX_RETRIES),
+            options.get('backoff_factor', consts.DEFAULT_HTTP_BACKOFF_FACTOR),
+            options.get('max_backoff', consts.DEFAULT_HTTP_MAX_BACKOFF))
+        # whether the server has the compile task api, probed on the first compile
+        self.compile_tasks_api = None
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout),
+            headers={
+                **http.DEFAULT_HEADERS,
+                consts.ACCESS_KEY_ID_HTTP_HEADER: session.access_key_id,
+                consts.SECRET_ACCESS_KEY_HTTP_HEADER: session.secret_key_access,
+            })
+
+    async def close(self):
+        await self.http.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def send(self, method: str, url: str, make_data=None):
+        # Sends a request as http.RetryPolicy.send does: make_data() builds the body of every attempt,
+        # and every attempt carries the same X-Request-Id
+        policy = self.retry_policy
+        request_id = str(uuid.uuid4())
+        metrics = getattr(self.session, 'metrics', None)
+        retry = 0
+        while True:
+            try:
+                r = await self.http.request(method, url, data=make_data() if make_data is not None else None,
+                                            headers={consts.REQUEST_ID_HTTP_HEADER: request_id})
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if retry >= policy.max_retries:
+                    raise
+                r, reason = None, type(e).__name__
+            else:
+                if r.status not in policy.status_codes or retry >= policy.max_retries:
+                    return r
+                reason = str(r.status)
+
+            retry += 1
+            delay = policy.backoff(retry, r)
+            if r is not None:
+                r.release()
+            logging.warning('retrying {} {} in {:.1f} s after {} (retry {} of {}, request id: {})'
+                            .format(method, url, delay, reason, retry, policy.max_retries, request_id))
+            if metrics is not None:
+                metrics.add_retry(method, url, request_id, reason, delay)
+            await asyncio.sleep(delay)
+
+    async def get_json(self, api_path: str, description: str):
+        # api_path may also be a full url
+        url = api_path if '://' in api_path else '{}/{}'.format(self.api_endpoint, api_path)
+        async with await self.send('GET', url) as r:
+            body = await r.read()
+            if r.status != 200:
+                raise ApiError('fail to {}'.format(description), BufferedResponse(r.status, body))
+            return json.loads(body)
+
+    async def post(self, api_path: str, model: ModelSource, model_path: str, description: str,
+                   fields: Dict[str, str] = None, output_path: str = None):
+        model_path = model_path or model_name(model)
+        request_url = '{}/{}'.format(self.api_endpoint, api_path)
+        logging.debug("submitting the {} request to {}".format(description, request_url))
+        logging.debug("source path: {}".format(model_path))
+
+        # aiohttp closes a file payload once it has been sent, so every attempt opens the path again, and the
+        # file object of a caller is only lent to aiohttp through a SourceReader
+        opened = []
+        position = None
+        if hasattr(model, 'read'):
+            position = model.tell() if hasattr(model, 'seek') else None
+        elif not isinstance(model, (str, os.PathLike)):
+            # aiohttp streams bytes-like payloads through a memoryview without copying them
+            model = memoryview(model).cast('B')
+
+        def make_form():
+            if isinstance(model, (str, os.PathLike)):
+                source = open(model, 'rb')
+                opened.append(source)
+            elif hasattr(model, 'read'):
+                source = SourceReader(model, position)
+            else:
+                source = model
+            form = aiohttp.FormData()
+            for name, value in (fields or {}).items():
+                form.add_field(name, value)
+            form.add_field('source', source, filename=os.path.basename(model_path),
+                           content_type='application/octet-stream')
+            return form
+
+        try:
+            async with await self.send('POST', request_url, make_form) as r:
+                if r.status != 200:
+                    raise ApiError('fail to {} {}'.format(description, model_path),
+                                   BufferedResponse(r.status, await r.read()))
+                if output_path is None:
+                    return await r.read()
+                return await self.save_response(r, output_path)
+        finally:
+            for source in opened:
+                source.close()
+
+    @staticmethod
+    async def save_response(r, output_path: str) -> int:
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        tmp_path = os.path.join(output_dir, '.{}.{}.part'.format(os.path.basename(output_path), uuid.uuid4().hex))
+        written = 0
+        try:
+            with open(tmp_path, 'xb') as tmp_file:
+                async for chunk in r.content.iter_chunked(http.DOWNLOAD_CHUNK_SIZE):
+                    tmp_file.write(chunk)
+                    written += len(chunk)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    async def version(self) -> Dict:
+        return await self.get_json('version', 'get version')
+
+    async def toolchain_list(self) -> List[Dict]:
+        return await self.get_json('api/v1/compiler', 'get toolchains')
+
+    async def perf(self, model: ModelSource,
+                   target_npu_spec: str = '{}',
+                   compiler_config: str = '{}',
+                   api_path: str = 'perfeye',
+                   model_path: str = None,
+                   output_path: str = None,
+                   toolchain: str = None):
+        fields = {'target_npu_spec': target_npu_spec, 'compiler_config': compiler_config}
+        # without a toolchain, the server estimates with its default toolchain
+        if toolchain is not None:
+            fields['toolchain'] = toolchain
+        return await self.post('api/v1/{}'.format(api_path), model, model_path, 'estimate the performance',
+                               fields=fields, output_path=output_path)
+
+    async def optimize(self, model: ModelSource, model_path: str = None, output_path: str = None):
+        return await self.post('api/v1/dss/optimize', model, model_path, 'optimize',
+                               output_path=output_path)
+
+    async def build_calibration_model(self, model: ModelSource, model_path: str = None, output_path: str = None):
+        return await self.post('api/v1/dss/build-calibration-model', model, model_path, 'build calibration model',
+                               output_path=output_path)
+
+    async def quantize(self, model: ModelSource,
+                       dynamic_ranges: Dict[str, Tuple[float, float]],
+                       model_path: str = None,
+                       output_path: str = None):
+        return await self.post('api/v1/dss/quantize', model, model_path, 'quantize the model',
+                               fields={'dynamic_ranges': json.dumps(dynamic_ranges)},
+                               output_path=output_path)
+
+    async def has_compile_tasks_api(self) -> bool:
+        if self.compile_tasks_api is None:
+            async with await self.send('GET', '{}/{}'.format(self.api_endpoint, consts.COMPILE_TASKS_API_PATH)) as r:
+                self.compile_tasks_api = r.status == 200
+            logging.debug('the server {} the compile task api'.format('has' if self.compile_tasks_api
+                                                                      else 'does not have'))
+        return self.compile_tasks_api
+
+    async def submit_compile(self, source: ModelSource,
+                             compiler_config: str = '~',
+                             target_npu_spec: str = '~',
+                             target_ir: str = 'enf',
+                             model_path: str = None) -> AsyncCompileTask:
+        status = await self.post(consts.COMPILE_TASKS_API_PATH, source, model_path, 'submit the compile task',
+                                 fields={
+                                     'compiler_config': compiler_config,
+                                     'target_npu_spec': target_npu_spec,
+                                     'target_ir': target_ir,
+                                 })
+        task = AsyncCompileTask(self, json.loads(status))
+        logging.debug('compile task {} has been submitted'.format(task.task_id))
+        return task
+
+    @staticmethod
+    async def wait(task: AsyncCompileTask,
+                   interval: float = DEFAULT_POLL_INTERVAL,
+                   max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                   backoff: float = DEFAULT_POLL_BACKOFF,
+                   timeout: float = None) -> AsyncCompileTask:
+        # Polls the task as TaskPoller does, without blocking the event loop. The task is cancelled on the server
+        # when the timeout expires or the coroutine is cancelled.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = interval
+        try:
+            while not task.is_finished():
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise CliError('the compile task {} did not finish in {} s and has been cancelled'
+                                   .format(task.task_id, timeout))
+                await asyncio.sleep(delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0)))
+                progress = task.progress
+                await task.refresh()
+                delay = interval if task.progress > progress else min(delay * backoff, max_interval)
+        except BaseException:
+            if not task.is_finished():
+                try:
+                    await asyncio.shield(task.cancel())
+                    logging.warning('compile task {} has been cancelled'.format(task.task_id))
+                except Exception as e:
+                    logging.error('fail to cancel the compile task {}: {}'.format(task.task_id, e))
+            raise
+        logging.debug('compile task {} is {}'.format(task.task_id, task.phase))
+        return task
+
+    async def compile(self, source: ModelSource,
+                      compiler_config: str = '~',
+                      target_npu_spec: str = '~',
+                      target_ir: str = 'enf',
+                      model_path: str = None,
+                      timeout: float = None):
+        # Submits a compile task and waits until it finishes, returning the task with async accessors of its
+        # artifacts. Servers without the compile task api compile through furiosa.client, whose blocking calls
+        # run in the default executor.
+        if await self.has_compile_tasks_api():
+            task = await self.submit_compile(source, compiler_config, target_npu_spec, target_ir, model_path)
+            return await self.wait(task, timeout=timeout)
+
+        from furiosacli.commands import Compile
+
+        loop = asyncio.get_running_loop()
+        return ExecutorCompileTask(await loop.run_in_executor(None, Compile.submit_and_wait, self.session, source,
+                                                              compiler_config, target_npu_spec, target_ir,
+                                                              TaskPoller(timeout=timeout, quiet=True)))
@@ -1,4 +1,5 @@
 import argparse
+import os
 
 
 def create_argparser():
@@ -9,31 +10,108 @@ def create_argparser():
                         help="Dnable debug mode")
     parser.add_argument("-v", "--verbose", action="store_true",
                         help="increase output verbosity")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Neither read from nor write to the local result cache (~/.furiosa/cache)")
+    parser.add_argument("--compression", type=str, choices=['auto', 'zstd', 'gzip', 'none'],
+                        help="Compression of model uploads and result downloads (default: FURIOSA_COMPRESSION or "
+                             "auto, which compresses uploads for a server advertising that it accepts them)")
+    parser.add_argument("--metrics-json", type=str, metavar='PATH',
+                        help="Write the per-phase timings, byte counts and request ids of the command as JSON")
+    parser.add_argument("--metrics-openmetrics", type=str, metavar='PATH',
+                        help="Write the metrics of the command in the OpenMetrics text format")
 
     subparsers = parser.add_subparsers(dest='command')
 
     subparsers.add_parser("version", help='Print out the version')
 
     compile_cmd = subparsers.add_parser("compile", help='Compile your model and generate a binary for Furiosa NPU')
-    compile_cmd.add_argument('source', type=str,
+    compile_cmd.add_argument('source', type=str, nargs='?',
                              help='Path to Model file (tflite, onnx, other renegade internal formats are supported)')
     compile_cmd.add_argument('-o', type=str,
-                             help='Path to Output file')
+                             help='Path to Output file (an output directory with --batch)')
     compile_cmd.add_argument('--target-ir', type=str, default='enf',
-                             help='Target IR (available IRs: dfg, cdfg, gir, lir, enf)')
+                             help='Target IR, or comma-separated IRs compiled from one upload, e.g. lir,enf '
+                                  '(available IRs: dfg, cdfg, gir, lir, enf)')
     compile_cmd.add_argument('--config', type=str,
                              help='Path to Compiler Config file (yaml)')
     compile_cmd.add_argument('--target-npu-spec', type=str,
                              help='Path to Target NPU Specification (yaml)')
     compile_cmd.add_argument('--compiler-report', type=str,
-                             help='Path to the compiler report')
+                             help='Path to the compiler report (a report directory with --batch)')
     compile_cmd.add_argument('--mem-alloc-report', type=str,
-                             help='Path to the memory allocation report')
+                             help='Path to the memory allocation report (a report directory with --batch)')
+    compile_cmd.add_argument('--batch', type=str,
+                             help='Compile many models at once: a manifest file listing one model path per line '
+                                  'or a glob pattern (e.g. "models/**/*.tflite")')
+    compile_cmd.add_argument('-j', '--jobs', type=int, default=4,
+                             help='Max number of models uploaded or downloaded at once with --batch (default: 4)')
+    compile_cmd.add_argument('--detach', action='store_true',
+                             help='Submit the compile task, print its job id and exit without waiting (see jobs)')
+    add_polling_opts(compile_cmd)
+    add_watch_opts(compile_cmd)
+
+    perf_cmd = subparsers.add_parser("perf",
+                                     help='Estimate the per-operator performance as csv '
+                                          '(or json if -o ends with .json)')
+    add_perf_opts(perf_cmd, 'csv')
+    perf_cmd.add_argument('--top', type=int,
+                          help='Print out the total latency and the given number of the slowest operators')
+
+    perf_diff_cmd = subparsers.add_parser("perf-diff",
+                                          help='Compare the performance estimation of two toolchains')
+    perf_diff_cmd.add_argument('source', type=str,
+                               help='Path to Model file (tflite, onnx, other renegade internal formats are supported)')
+    perf_diff_cmd.add_argument('--baseline-toolchain', type=str,
+                               help='Version of the baseline toolchain (see toolchain list)')
+    perf_diff_cmd.add_argument('--candidate-toolchain', type=str,
+                               help='Version of the candidate toolchain (default: the latest)')
+    perf_diff_cmd.add_argument('--baseline-file', type=str,
+                               help='Path to the stored baseline (json): read if it exists, written otherwise')
+    perf_diff_cmd.add_argument('--threshold', type=float, default=5.0,
+                               help='Percent by which the total latency or memory figures may grow before '
+                                    'the command exits with 1 (default: 5.0)')
+    perf_diff_cmd.add_argument('--metric', type=str,
+                               help='Latency column to compare (default: the first of latency_us, latency_ms, '
+                                    'latency and cycles)')
+    perf_diff_cmd.add_argument('--top', type=int, default=10,
+                               help='Number of the most changed operators to print out (default: 10)')
+    perf_diff_cmd.add_argument('-o', type=str,
+                               help='Path to write the whole diff to (json)')
+    perf_diff_cmd.add_argument('--config', type=str,
+                               help='Path to Compiler Config file (yaml)')
+    perf_diff_cmd.add_argument('--target-npu-spec', type=str,
+                               help='Path to Target NPU Specification (yaml)')
 
     perfeye_cmd = subparsers.add_parser("perfeye",
                                         help='Generate a visialized view of the static performance estimation')
     add_perf_opts(perfeye_cmd, 'html')
 
+    sweep_cmd = subparsers.add_parser("sweep",
+                                      help='Estimate the performance over a grid of compiler configs and NPU specs')
+    sweep_cmd.add_argument('source', type=str,
+                           help='Path to Model file (tflite, onnx, other renegade internal formats are supported)')
+    sweep_cmd.add_argument('--grid', type=str, required=True,
+                           help='Path to the grid (yaml) of the compiler_config and target_npu_spec values to try')
+    sweep_cmd.add_argument('-o', type=str, default='sweep.csv',
+                           help='Path to the ranked results, in json if it ends with .json (default: sweep.csv)')
+    sweep_cmd.add_argument('--config', type=str,
+                           help='Path to the base Compiler Config file (yaml)')
+    sweep_cmd.add_argument('--target-npu-spec', type=str,
+                           help='Path to the base Target NPU Specification (yaml)')
+    sweep_cmd.add_argument('-j', '--jobs', type=int, default=4,
+                           help='Number of concurrent performance estimations (default: 4)')
+    sweep_cmd.add_argument('--metric', type=str,
+                           help='Column of the perf result to minimize (default: the first of latency_us, '
+                                'latency_ms, latency and cycles)')
+    sweep_cmd.add_argument('--search', type=str, default='grid', choices=['grid', 'greedy'],
+                           help='grid: every point (or --samples random points) of the grid (default), '
+                                'greedy: one parameter at a time, keeping the best value of the others')
+    sweep_cmd.add_argument('--samples', type=int,
+                           help='Number of random points of the grid to estimate instead of all of them')
+    sweep_cmd.add_argument('--seed', type=int, help='Seed of --samples')
+    sweep_cmd.add_argument('--patience', type=int,
+                           help='Stop after this many results in a row do not improve the best latency')
+
     optimize_cmd = subparsers.add_parser("optimize",
                                          help='Optimize a model to calibrate & quantize.')
     optimize_cmd.add_argument('source', type=str,
@@ -56,9 +134,125 @@ def create_argparser():
     quantize_cmd.add_argument('--dynamic-ranges', type=str,
                               help='path of the dynamic ranges')
 
+    calibrate_cmd = subparsers.add_parser("calibrate",
+                                          help='Compute the dynamic ranges of a calibration model over a dataset '
+                                               'on CPU')
+    calibrate_cmd.add_argument('source', type=str,
+                               help='Path to the calibration model (onnx) built by build_calibration_model')
+    calibrate_cmd.add_argument('--dataset', type=str, required=True,
+                               help='Directory of .npy/.npz files (one sample or batch per file), '
+                                    'or a .npy/.npz file whose first axis indexes the samples')
+    calibrate_cmd.add_argument('-o', type=str, default='dynamic_ranges.json',
+                               help='Path to Output file (default: dynamic_ranges.json)')
+    calibrate_cmd.add_argument('--batch-size', type=int, default=32,
+                               help='Number of samples per chunk of a single-file dataset (default: 32)')
+    calibrate_cmd.add_argument('-j', '--workers', type=int, default=1,
+                               help='Number of worker processes (default: 1)')
+    calibrate_cmd.add_argument('--histograms', type=str,
+                               help='Path to write the per-tensor histograms to, for percentile-based ranges merge')
+    calibrate_cmd.add_argument('--bins', type=int, default=2048,
+                               help='Number of histogram bins per tensor (default: 2048)')
+
+    ranges_cmd = subparsers.add_parser("ranges", help='Manipulate dynamic ranges files')
+    ranges_subcmd = ranges_cmd.add_subparsers(dest="subcmd")
+    ranges_merge_cmd = ranges_subcmd.add_parser("merge",
+                                                help='Merge dynamic ranges (or histograms) calibrated on shards')
+    ranges_merge_cmd.add_argument('sources', type=str, nargs='+',
+                                  help='Paths to dynamic ranges or histograms files')
+    ranges_merge_cmd.add_argument('-o', type=str, default='dynamic_ranges.json',
+                                  help='Path to Output file (default: dynamic_ranges.json)')
+    ranges_merge_cmd.add_argument('--method', type=str, default='minmax', choices=['minmax', 'percentile'],
+                                  help='minmax: min of mins and max of maxes (default), '
+                                       'percentile: clip the tails of the merged histograms')
+    ranges_merge_cmd.add_argument('--percentile', type=float, default=99.99,
+                                  help='Percentile kept by --method percentile (default: 99.99)')
+    ranges_merge_cmd.add_argument('--histograms', type=str,
+                                  help='Path to write the merged histograms to')
+
+    pipeline_cmd = subparsers.add_parser("pipeline",
+                                         help='Optimize, quantize and compile an onnx model in one go')
+    pipeline_cmd.add_argument('source', type=str,
+                              help='Path to onnx file')
+    pipeline_cmd.add_argument('--dynamic-ranges', type=str, required=True,
+                              help='path of the dynamic ranges')
+    pipeline_cmd.add_argument('-o', type=str,
+                              help='Path to Output file (default: output.<target-ir>)')
+    pipeline_cmd.add_argument('--target-ir', type=str, default='enf',
+                              help='Target IR (available IRs: dfg, cdfg, gir, lir, enf)')
+    pipeline_cmd.add_argument('--config', type=str,
+                              help='Path to Compiler Config file (yaml)')
+    pipeline_cmd.add_argument('--target-npu-spec', type=str,
+                              help='Path to Target NPU Specification (yaml)')
+    pipeline_cmd.add_argument('--compiler-report', type=str,
+                              help='Path to the compiler report')
+    pipeline_cmd.add_argument('--mem-alloc-report', type=str,
+                              help='Path to the memory allocation report')
+    pipeline_cmd.add_argument('--perfeye', type=str,
+                              help='Path to the perfeye html of the optimized model, generated concurrently')
+    pipeline_cmd.add_argument('--calibration-model', type=str,
+                              help='Path to the calibration model of the optimized model, generated concurrently')
+    pipeline_cmd.add_argument('--work-dir', type=str,
+                              help='Directory to keep the intermediate models (default: a temporary directory)')
+    add_polling_opts(pipeline_cmd)
+
     toolchain_cmd = subparsers.add_parser("toolchain", help='Compile your model and generate a binary for Furiosa NPU')
     toolchain_subcmd = toolchain_cmd.add_subparsers(dest="subcmd")
     toolchain_subcmd.add_parser("list", help='List all toolchains')
+
+    jobs_cmd = subparsers.add_parser("jobs", help='Track compile tasks submitted with compile --detach')
+    jobs_subcmd = jobs_cmd.add_subparsers(dest="subcmd")
+    jobs_subcmd.add_parser("list", help='List the detached jobs recorded in ~/.furiosa/jobs.jsonl')
+    jobs_status_cmd = jobs_subcmd.add_parser("status", help='Print out the current status of a job')
+    jobs_status_cmd.add_argument('job_id', type=str, help='Job id (or a unique prefix of it)')
+    jobs_wait_cmd = jobs_subcmd.add_parser("wait", help='Wait until jobs finish')
+    jobs_wait_cmd.add_argument('job_ids', type=str, nargs='+', help='Job ids (or unique prefixes of them)')
+    add_polling_opts(jobs_wait_cmd)
+    jobs_fetch_cmd = jobs_subcmd.add_parser("fetch",
+                                            help='Download the IR, the compiler report and the memory allocation '
+                                                 'report of a finished job')
+    jobs_fetch_cmd.add_argument('job_id', type=str, help='Job id (or a unique prefix of it)')
+    jobs_fetch_cmd.add_argument('-o', type=str,
+                                help='Path to Output file (default: the path given to compile --detach)')
+    jobs_fetch_cmd.add_argument('--compiler-report', type=str,
+                                help='Path to the compiler report (default: <output>.compiler_report.txt)')
+    jobs_fetch_cmd.add_argument('--mem-alloc-report', type=str,
+                                help='Path to the memory allocation report (default: <output>.mem_alloc_report.html)')
+    jobs_prune_cmd = jobs_subcmd.add_parser("prune", help='Remove the oldest finished jobs from the ledger')
+    jobs_prune_cmd.add_argument('--keep', type=int,
+                                help='Number of the most recently submitted jobs to keep, besides the unfinished '
+                                     'ones (default: FURIOSA_JOBS_MAX)')
+
+    run_batch_cmd = subparsers.add_parser("run-batch", aliases=['shell'],
+                                          help='Run many commands in one process, sharing the configs and '
+                                               'the connection pool, and print one json result line per command')
+    run_batch_cmd.add_argument('input', type=str, nargs='?', default='-',
+                               help='File of command lines (e.g. "perfeye model.onnx -o out.html") or json lines '
+                                    '({"id": ..., "args": [...]}), one per line (default: - for stdin)')
+    run_batch_cmd.add_argument('-j', '--jobs', type=int, default=1,
+                               help='Max number of commands running at once (default: 1)')
+
+    report_cmd = subparsers.add_parser("report", help='Analyze compiler and memory allocation reports')
+    report_subcmd = report_cmd.add_subparsers(dest="subcmd")
+    report_summarize_cmd = report_subcmd.add_parser("summarize",
+                                                    help='Summarize the peak memory usage, fragmentation, largest '
+                                                         'buffers and slowest compiler passes of many reports')
+    report_summarize_cmd.add_argument('reports', type=str, nargs='+',
+                                      help='Paths (or glob patterns) of compiler and memory allocation reports')
+    report_summarize_cmd.add_argument('-o', type=str,
+                                      help='Path to write the summary to, as csv (one row per report) when it ends '
+                                           'with .csv and as json otherwise (default: print out a table)')
+    report_summarize_cmd.add_argument('-k', '--top', type=int, default=10,
+                                      help='Number of the largest buffers and slowest passes (default: 10)')
+    report_summarize_cmd.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                                      help='Number of processes parsing the reports (default: number of cpus)')
+
+    cache_cmd = subparsers.add_parser("cache", help='Manage the local cache of compile, perfeye and DSS results')
+    cache_subcmd = cache_cmd.add_subparsers(dest="subcmd")
+    cache_subcmd.add_parser("stats", help='Print out the cache statistics')
+    cache_prune_cmd = cache_subcmd.add_parser("prune", help='Evict least recently used results')
+    cache_prune_cmd.add_argument('--max-size', type=str,
+                                 help='Size to shrink the cache to (e.g. 512M, 2G; default: FURIOSA_CACHE_MAX_SIZE)')
+    cache_subcmd.add_parser("clear", help='Remove all cached results')
     return parser
 
 
@@ -71,3 +265,25 @@ def add_perf_opts(parser, content_type):
                         help='Path to Compiler Config file (yaml)')
     parser.add_argument('--target-npu-spec', type=str,
                         help='Path to Target NPU Specification (yaml)')
+    parser.add_argument('--toolchain', type=str,
+                        help='Version of the toolchain to estimate with (see toolchain list; default: the latest)')
+    add_watch_opts(parser)
+
+
+def add_polling_opts(parser):
+    parser.add_argument('--timeout', type=float,
+                        help='Seconds to wait for the compile task(s) before cancelling them (default: no timeout)')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='Seconds between the first status polls of a compile task (default: 1.0)')
+    parser.add_argument('--max-poll-interval', type=float, default=30.0,
+                        help='Upper bound of the poll interval (default: 30.0)')
+    parser.add_argument('--poll-backoff', type=float, default=1.5,
+                        help='Factor growing the poll interval while a compile task makes no progress (default: 1.5)')
+
+
+def add_watch_opts(parser):
+    parser.add_argument('--watch', action='store_true',
+                        help='Run again whenever the model, --config or --target-npu-spec changes, cancelling '
+                             'the compile task of an older version')
+    parser.add_argument('--debounce', type=float, default=0.3,
+                        help='Seconds without further writes before --watch runs again (default: 0.3)')
@@ -0,0 +1,84 @@
+import io
+import json
+import shlex
+import threading
+from typing import List, Optional, Tuple
+
+from furiosacli.exceptions import CliError
+
+# commands which cannot run inside a batch
+NESTED_COMMANDS = ('run-batch', 'shell')
+
+
+class ThreadOutput(io.TextIOBase):
+    # Stands for sys.stdout (or sys.stderr) while a batch runs. What a command prints goes to the buffer of the
+    # thread running it; output of any other thread goes to the fallback stream.
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._local = threading.local()
+
+    def capture(self) -> io.StringIO:
+        self._local.buffer = io.StringIO()
+        return self._local.buffer
+
+    def release(self) -> str:
+        buffer = getattr(self._local, 'buffer', None)
+        self._local.buffer = None
+        return '' if buffer is None else buffer.getvalue()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self._local, 'buffer', None)
+        (self.fallback if buffer is None else buffer).write(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self._local, 'buffer', None) is None:
+            self.fallback.flush()
+
+
+def parse_request(line: str, line_no: int) -> Optional[Tuple[object, List[str]]]:
+    # A request is either a command line (e.g. 'perfeye model.onnx -o out.html', optionally starting with
+    # 'furiosa') or a json object {"id": ..., "args": [...]} or {"id": ..., "command": "..."}.
+    # Returns (id, argv), or None for blank and comment lines.
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    if line.startswith('{'):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            raise CliError('invalid json request at line {}: {}'.format(line_no, e))
+        request_id = request.get('id', line_no)
+        if isinstance(request.get('args'), list):
+            argv = [str(arg) for arg in request['args']]
+        elif isinstance(request.get('command'), str):
+            argv = shlex.split(request['command'])
+        else:
+            raise CliError('the json request at line {} has neither args (a list) nor command (a string)'
+                           .format(line_no))
+    else:
+        request_id = line_no
+        try:
+            argv = shlex.split(line)
+        except ValueError as e:
+            raise CliError('invalid command line at line {}: {}'.format(line_no, e))
+
+    if argv and argv[0] == 'furiosa':
+        argv = argv[1:]
+    return request_id, argv
+
+
+def format_result(request_id, argv: List[str], exit_code: int, error: Optional[str], output: str,
+                  elapsed_secs: float) -> str:
+    return json.dumps({
+        'id': request_id,
+        'args': argv,
+        'exit_code': exit_code,
+        'error': error,
+        'output': output,
+        'elapsed_secs': elapsed_secs,
+    })
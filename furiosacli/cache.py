@@ -0,0 +1,194 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from furiosacli.exceptions import CliError
+
+HASH_CHUNK_SIZE = 1024 * 1024
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value: str) -> int:
+    matched = re.fullmatch(r'\s*(\d+)\s*([KMGT]?)i?B?\s*', str(value), re.IGNORECASE)
+    if matched is None:
+        raise CliError('invalid size: {} (e.g. 512M, 2G)'.format(value))
+    return int(matched.group(1)) * SIZE_UNITS[matched.group(2).upper()]
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return '{} B'.format(size)
+    for unit in ('KiB', 'MiB', 'GiB', 'TiB'):
+        size /= 1024
+        if size < 1024 or unit == 'TiB':
+            return '{:.1f} {}'.format(size, unit)
+
+
+# the digests of the files hashed last by (path, size, mtime), as a command hashes its model both for the cache key
+# and for the upload; bounded, as run-batch and --watch keep hashing new versions of the models in one process
+FILE_DIGESTS_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=FILE_DIGESTS_CACHE_SIZE)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    stat = os.stat(path)
+    return _file_digest(os.path.realpath(path), stat.st_size, stat.st_mtime_ns)
+
+
+class ResultCache(object):
+    # Each entry is a directory named after its key, holding one file per artifact (e.g. ir, compiler_report).
+    # An entry's mtime is refreshed on every hit, so eviction removes the least recently used entries first.
+    def __init__(self, root: str, max_size: int):
+        self.root = root
+        self.max_size = max_size
+
+    @staticmethod
+    def make_key(command: str, model_path: str, *params) -> str:
+        digest = hashlib.sha256()
+        digest.update(command.encode())
+        digest.update(b'\0')
+        digest.update(file_digest(model_path).encode())
+        for param in params:
+            digest.update(b'\0')
+            digest.update(str(param).encode())
+        return digest.hexdigest()
+
+    def server_versions_path(self) -> str:
+        return os.path.join(self.root, 'server_versions.json')
+
+    def server_version(self, api_endpoint: str) -> Optional[Dict]:
+        # the toolchain version an endpoint reported last, with the time (time.time()) it was fetched at
+        try:
+            with open(self.server_versions_path(), 'r') as versions_file:
+                stored = json.load(versions_file).get(api_endpoint)
+        except (OSError, ValueError, AttributeError):
+            return None
+        if not isinstance(stored, dict) or 'version' not in stored or 'fetched_at' not in stored:
+            return None
+        return stored
+
+    def store_server_version(self, api_endpoint: str, version: str, fetched_at: float):
+        path = self.server_versions_path()
+        try:
+            with open(path, 'r') as versions_file:
+                versions = json.load(versions_file)
+        except (OSError, ValueError):
+            versions = {}
+        if not isinstance(versions, dict):
+            versions = {}
+        versions[api_endpoint] = {'version': version, 'fetched_at': fetched_at}
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, 'w') as versions_file:
+                json.dump(versions, versions_file)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, names: List[str]) -> Optional[Dict[str, str]]:
+        entry = self.entry_path(key)
+        artifacts = {name: os.path.join(entry, name) for name in names}
+        if not all(os.path.isfile(path) for path in artifacts.values()):
+            logging.debug('cache miss: {}'.format(key))
+            return None
+
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        logging.debug('cache hit: {}'.format(key))
+        return artifacts
+
+    def put(self, key: str, artifacts: Dict[str, str]):
+        entry = self.entry_path(key)
+        tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(entry, exist_ok=True)
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        for name, path in artifacts.items():
+            tmp_path = os.path.join(tmp_dir, str(uuid.uuid4()))
+            try:
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, os.path.join(entry, name))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        os.utime(entry)
+
+        self.prune()
+
+    def entries(self) -> List[Dict]:
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix == 'tmp' or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+                    entries.append({'key': key, 'path': entry, 'size': size, 'last_used': os.path.getmtime(entry)})
+                except OSError:
+                    continue
+        return entries
+
+    def stats(self) -> Dict:
+        entries = self.entries()
+        return {
+            'root': self.root,
+            'entries': len(entries),
+            'size': sum(entry['size'] for entry in entries),
+            'max_size': self.max_size,
+            'oldest': min((entry['last_used'] for entry in entries), default=None),
+            'newest': max((entry['last_used'] for entry in entries), default=None),
+        }
+
+    def prune(self, max_size: int = None) -> int:
+        max_size = self.max_size if max_size is None else max_size
+        entries = sorted(self.entries(), key=lambda entry: entry['last_used'])
+        total_size = sum(entry['size'] for entry in entries)
+
+        removed = 0
+        for entry in entries:
+            if total_size <= max_size:
+                break
+            shutil.rmtree(entry['path'], ignore_errors=True)
+            total_size -= entry['size']
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        removed = len(self.entries())
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root, ignore_errors=True)
+        return removed
+
+
+def format_timestamp(timestamp: float) -> str:
+    if timestamp is None:
+        return '-'
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
@@ -0,0 +1,215 @@
+import logging
+import multiprocessing
+import os
+import zipfile
+from typing import Dict, Iterator, List, Tuple
+
+from furiosacli.exceptions import CliError
+from furiosacli.ranges import DynamicRanges, Histograms, merge_histograms, merge_ranges
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+# (path, start, stop): a whole .npy/.npz file of a dataset directory when start is None,
+# otherwise the samples [start, stop) of a single .npy/.npz dataset file
+DatasetChunk = Tuple[str, int, int]
+
+ORT_TENSOR_TYPES = {
+    'tensor(float)': 'float32',
+    'tensor(float16)': 'float16',
+    'tensor(double)': 'float64',
+    'tensor(int8)': 'int8',
+    'tensor(uint8)': 'uint8',
+    'tensor(int32)': 'int32',
+    'tensor(int64)': 'int64',
+    'tensor(bool)': 'bool',
+}
+
+
+def require_dependencies():
+    if np is None or onnxruntime is None:
+        raise CliError('calibrate requires numpy and onnxruntime (pip install furiosacli[calibrate])', 1)
+
+
+def read_npy_header(member) -> Tuple[tuple, bool, 'np.dtype']:
+    # the shape, order and dtype of an .npy array, leaving member at its data
+    version = np.lib.format.read_magic(member)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(member)
+    return np.lib.format.read_array_header_2_0(member)
+
+
+def read_num_samples(path: str) -> int:
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r').shape[0]
+
+    with zipfile.ZipFile(path) as npz:
+        with npz.open(npz.namelist()[0]) as member:
+            shape, _, _ = read_npy_header(member)
+            return shape[0]
+
+
+def read_npz_samples(npz: zipfile.ZipFile, member_name: str, start: int, stop: int) -> 'np.ndarray':
+    # The samples [start, stop) of an array of a .npz file, reading only them: the member is skipped up to the
+    # first sample (a compressed member is decompressed on the way, but never held in memory)
+    with npz.open(member_name) as member:
+        shape, fortran_order, dtype = read_npy_header(member)
+        if fortran_order or dtype.hasobject:
+            # the samples of such arrays are not contiguous, so the whole array is read
+            with npz.open(member_name) as whole:
+                return np.load(whole)[start:stop]
+        sample_shape = tuple(shape[1:])
+        sample_size = dtype.itemsize * int(np.prod(sample_shape, dtype=np.int64))
+        stop = min(stop, shape[0])
+        member.seek(start * sample_size, os.SEEK_CUR)
+        data = member.read((stop - start) * sample_size)
+        return np.frombuffer(data, dtype=dtype).reshape((stop - start,) + sample_shape)
+
+
+def dataset_chunks(dataset: str, batch_size: int) -> Iterator[DatasetChunk]:
+    if os.path.isdir(dataset):
+        for name in sorted(os.listdir(dataset)):
+            if name.endswith('.npy') or name.endswith('.npz'):
+                yield os.path.join(dataset, name), None, None
+    elif os.path.isfile(dataset) and (dataset.endswith('.npy') or dataset.endswith('.npz')):
+        num_samples = read_num_samples(dataset)
+        for start in range(0, num_samples, batch_size):
+            yield dataset, start, min(start + batch_size, num_samples)
+    else:
+        raise CliError('dataset must be a directory of .npy/.npz files, or a .npy/.npz file: {}'.format(dataset))
+
+
+def load_chunk(chunk: DatasetChunk, input_names: List[str]) -> Dict[str, 'np.ndarray']:
+    path, start, stop = chunk
+    if path.endswith('.npy'):
+        # memory-mapped, so only the requested samples are read from disk
+        arrays = {input_names[0]: np.load(path, mmap_mode='r')}
+        if start is not None:
+            arrays = {name: array[start:stop] for name, array in arrays.items()}
+        return arrays
+
+    if start is None:
+        # a file of a dataset directory holds one sample or batch
+        with np.load(path) as npz:
+            return {name: npz[member] for name, member in npz_members(path, npz.files, input_names).items()}
+
+    # a chunk of a single .npz dataset file reads only its samples, so the workers never hold the whole dataset
+    with zipfile.ZipFile(path) as npz:
+        files = [name[:-len('.npy')] for name in npz.namelist() if name.endswith('.npy')]
+        return {name: read_npz_samples(npz, member + '.npy', start, stop)
+                for name, member in npz_members(path, files, input_names).items()}
+
+
+def npz_members(path: str, files: List[str], input_names: List[str]) -> Dict[str, str]:
+    # the array of a .npz file for every model input
+    if len(input_names) == 1 and len(files) == 1:
+        return {input_names[0]: files[0]}
+    missing = [name for name in input_names if name not in files]
+    if missing:
+        raise CliError('{} has no arrays for the model inputs {}'.format(path, missing))
+    return {name: name for name in input_names}
+
+
+def model_batches(arrays: Dict[str, 'np.ndarray'], inputs) -> Iterator[Dict[str, 'np.ndarray']]:
+    # Adds a batch axis to single samples, and splits the samples into batches of the model
+    # when its batch size is fixed
+    feeds = {}
+    model_batch_size = None
+    for model_input in inputs:
+        array = arrays[model_input.name]
+        if array.ndim == len(model_input.shape) - 1:
+            array = array[np.newaxis]
+        feeds[model_input.name] = np.ascontiguousarray(array, dtype=ORT_TENSOR_TYPES.get(model_input.type))
+        if isinstance(model_input.shape[0], int):
+            model_batch_size = model_input.shape[0]
+
+    if model_batch_size is None:
+        yield feeds
+        return
+
+    num_samples = min(array.shape[0] for array in feeds.values())
+    if num_samples % model_batch_size != 0:
+        logging.warning('the last {} samples are skipped because the model batch size is fixed to {}'
+                        .format(num_samples % model_batch_size, model_batch_size))
+    for start in range(0, num_samples - model_batch_size + 1, model_batch_size):
+        yield {name: array[start:start + model_batch_size] for name, array in feeds.items()}
+
+
+def observe(ranges: DynamicRanges, histograms: Histograms, bins: int, name: str, array: 'np.ndarray'):
+    if array.size == 0:
+        return
+    low = float(np.min(array))
+    high = float(np.max(array))
+    merge_ranges(ranges, {name: (low, high)})
+
+    if bins > 0:
+        counts, _ = np.histogram(array, bins=bins, range=(low, high))
+        merge_histograms(histograms, {name: {'range': [low, high], 'counts': counts.tolist()}})
+
+
+_session = None
+_histogram_bins = 0
+
+
+def _init_worker(model_path: str, num_threads: int, histogram_bins: int):
+    global _session, _histogram_bins
+    _histogram_bins = histogram_bins
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = num_threads
+    _session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+
+def _calibrate_chunk(chunk: DatasetChunk) -> Tuple[DynamicRanges, Histograms, int]:
+    inputs = _session.get_inputs()
+    output_names = [output.name for output in _session.get_outputs()]
+    arrays = load_chunk(chunk, [model_input.name for model_input in inputs])
+
+    ranges = {}
+    histograms = {}
+    num_samples = 0
+    for feeds in model_batches(arrays, inputs):
+        for name, array in feeds.items():
+            observe(ranges, histograms, _histogram_bins, name, array)
+        for name, array in zip(output_names, _session.run(output_names, feeds)):
+            observe(ranges, histograms, _histogram_bins, name, array)
+        num_samples += next(iter(feeds.values())).shape[0]
+    return ranges, histograms, num_samples
+
+
+def calibrate(model_path: str,
+              dataset: str,
+              batch_size: int = 32,
+              workers: int = 1,
+              histogram_bins: int = 0) -> Tuple[DynamicRanges, Histograms, int]:
+    require_dependencies()
+    chunks = dataset_chunks(dataset, batch_size)
+    ranges = {}
+    histograms = {}
+    num_samples = 0
+
+    if workers <= 1:
+        _init_worker(model_path, 0, histogram_bins)
+        for partial_ranges, partial_histograms, count in map(_calibrate_chunk, chunks):
+            merge_ranges(ranges, partial_ranges)
+            merge_histograms(histograms, partial_histograms)
+            num_samples += count
+    else:
+        # each worker owns one single-threaded InferenceSession and reduces its chunks to partial ranges
+        with multiprocessing.get_context('spawn').Pool(workers,
+                                                       initializer=_init_worker,
+                                                       initargs=(model_path, 1, histogram_bins)) as pool:
+            for partial_ranges, partial_histograms, count in pool.imap_unordered(_calibrate_chunk, chunks):
+                merge_ranges(ranges, partial_ranges)
+                merge_histograms(histograms, partial_histograms)
+                num_samples += count
+
+    if num_samples == 0:
+        raise CliError('dataset {} has no samples'.format(dataset))
+    return ranges, histograms, num_samples
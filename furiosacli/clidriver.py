@@ -1,19 +1,43 @@
+import copy
 import logging
 import os
 import sys
-from pathlib import Path
+import threading
+import time
+from typing import Optional
 
-from dotenv import load_dotenv
-
-from furiosacli import argparser, consts, commands
+# Only light modules are imported here. requests, yaml and requests_toolbelt are imported
+# by furiosacli.commands and furiosacli.http on the first command that needs them.
+from furiosacli import argparser, consts
 from furiosacli.exceptions import NoCommandException, CliError
 
+_config_loaded = False
+
+
+def load_config_files():
+    # ~/.furiosa/config and ~/.furiosa/credential are read once per process, however many sessions are created
+    global _config_loaded
+    if _config_loaded:
+        return
+
+    home = os.path.expanduser('~')
+    config_files = ['{}/.furiosa/config'.format(home), '{}/.furiosa/credential'.format(home)]
+    if any(os.path.isfile(path) for path in config_files):
+        from dotenv import load_dotenv
+
+        for path in config_files:
+            load_dotenv(path, verbose=False, override=False)
+    _config_loaded = True
+
 
 class Session(object):
-    def __init__(self):
-        home = str(Path.home())
-        load_dotenv('{}/.furiosa/config'.format(home), verbose=False, override=False)
-        load_dotenv('{}/.furiosa/credential'.format(home), verbose=False, override=False)
+    def __init__(self, require_credentials: bool = True):
+        from furiosacli.cache import ResultCache, parse_size
+        from furiosacli.jobs import JobLedger
+        from furiosacli.metrics import Metrics
+
+        home = os.path.expanduser('~')
+        load_config_files()
 
         self.api_endpoint = os.environ.get(consts.FURIOSA_API_ENDPOINT_ENV)
         self.access_key_id = os.environ.get(consts.FURIOSA_ACCESS_KEY_ID_ENV)
@@ -22,8 +46,148 @@ class Session(object):
         if self.api_endpoint is None:
             self.api_endpoint = consts.DEFAULT_API_ENDPOINT
 
-        if self.access_key_id is None or self.secret_key_access is None:
+        if require_credentials and (self.access_key_id is None or self.secret_key_access is None):
+            raise CliError('FURIOSA_ACCESS_KEY_ID, FURIOSA_SECRET_ACCESS_KEY must be set', 1)
+
+        self.http_options = {
+            'pool_size': env_int(consts.FURIOSA_HTTP_POOL_SIZE_ENV, consts.DEFAULT_HTTP_POOL_SIZE),
+            'connect_timeout': env_float(consts.FURIOSA_HTTP_CONNECT_TIMEOUT_ENV, consts.DEFAULT_HTTP_CONNECT_TIMEOUT),
+            'read_timeout': env_float(consts.FURIOSA_HTTP_READ_TIMEOUT_ENV, consts.DEFAULT_HTTP_READ_TIMEOUT),
+            'max_retries': env_int(consts.FURIOSA_HTTP_MAX_RETRIES_ENV, consts.DEFAULT_HTTP_MAX_RETRIES),
+            'backoff_factor': env_float(consts.FURIOSA_HTTP_RETRY_BACKOFF_ENV, consts.DEFAULT_HTTP_BACKOFF_FACTOR),
+            'max_backoff': env_float(consts.FURIOSA_HTTP_RETRY_MAX_BACKOFF_ENV, consts.DEFAULT_HTTP_MAX_BACKOFF),
+        }
+        # models from this size on are uploaded by their digest when the server already has them ('off' disables)
+        dedup_min_size = os.environ.get(consts.FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV, consts.DEFAULT_UPLOAD_DEDUP_MIN_SIZE)
+        self.upload_dedup_min_size = None if dedup_min_size.lower() == 'off' else parse_size(dedup_min_size)
+        self.compression = os.environ.get(consts.FURIOSA_COMPRESSION_ENV, consts.DEFAULT_COMPRESSION).lower()
+        if self.compression not in consts.COMPRESSION_CHOICES:
+            raise CliError('{} must be one of {}, but got {}'.format(consts.FURIOSA_COMPRESSION_ENV,
+                                                                    ', '.join(consts.COMPRESSION_CHOICES),
+                                                                    self.compression), 1)
+        if self.compression == 'zstd':
+            from furiosacli.compression import check_compression
+
+            check_compression(self.compression)
+        # models from this size on are uploaded in parts of upload_part_size, resumable from a checkpoint
+        chunked_min_size = os.environ.get(consts.FURIOSA_UPLOAD_CHUNKED_MIN_SIZE_ENV,
+                                          consts.DEFAULT_UPLOAD_CHUNKED_MIN_SIZE)
+        self.upload_chunked_min_size = None if chunked_min_size.lower() == 'off' else parse_size(chunked_min_size)
+        self.upload_part_size = parse_size(os.environ.get(consts.FURIOSA_UPLOAD_PART_SIZE_ENV,
+                                                          consts.DEFAULT_UPLOAD_PART_SIZE))
+        self.upload_parallel_parts = env_int(consts.FURIOSA_UPLOAD_PARALLEL_PARTS_ENV,
+                                             consts.DEFAULT_UPLOAD_PARALLEL_PARTS)
+        if self.upload_part_size <= 0 or self.upload_parallel_parts <= 0:
+            raise CliError('{} and {} must be positive'.format(consts.FURIOSA_UPLOAD_PART_SIZE_ENV,
+                                                               consts.FURIOSA_UPLOAD_PARALLEL_PARTS_ENV), 1)
+        self.uploads_dir = os.environ.get(consts.FURIOSA_UPLOADS_DIR_ENV,
+                                          '{}/{}'.format(home, consts.DEFAULT_UPLOADS_DIR_NAME))
+        # digests of the models the server is known to have
+        self.known_blobs = set()
+        # the server's toolchain version and when it was fetched, shared with the forks
+        self.server_version_ttl = env_float(consts.FURIOSA_SERVER_VERSION_TTL_ENV, consts.DEFAULT_SERVER_VERSION_TTL)
+        self._server_version = {}
+        self._server_version_lock = threading.Lock()
+        self._parent = None
+        self._http = None
+        self._http_lock = threading.Lock()
+        self.metrics = Metrics()
+
+        self.cache = ResultCache(
+            os.environ.get(consts.FURIOSA_CACHE_DIR_ENV, '{}/{}'.format(home, consts.DEFAULT_CACHE_DIR_NAME)),
+            parse_size(os.environ.get(consts.FURIOSA_CACHE_MAX_SIZE_ENV, consts.DEFAULT_CACHE_MAX_SIZE)))
+        self.jobs = JobLedger(
+            os.environ.get(consts.FURIOSA_JOBS_FILE_ENV, '{}/{}'.format(home, consts.DEFAULT_JOBS_FILE_NAME)),
+            env_int(consts.FURIOSA_JOBS_MAX_ENV, consts.DEFAULT_JOBS_MAX))
+
+    def fork(self, require_credentials: bool = True) -> 'Session':
+        # A session for one command of a batch. It shares the connection pool, the cache, the ledger and the known
+        # blobs of this session and records its own metrics; the requests are still recorded here, by the hook
+        # of the shared pool.
+        from furiosacli.metrics import Metrics
+
+        if require_credentials and (self.access_key_id is None or self.secret_key_access is None):
             raise CliError('FURIOSA_ACCESS_KEY_ID, FURIOSA_SECRET_ACCESS_KEY must be set', 1)
+        session = copy.copy(self)
+        session._parent = self
+        session.metrics = Metrics()
+        return session
+
+    @property
+    def http(self):
+        if self._parent is not None:
+            return self._parent.http
+        # created on first use, so local commands never import requests
+        with self._http_lock:
+            if self._http is None:
+                from furiosacli.http import create_http_session
+
+                self._http = create_http_session(self, **self.http_options)
+            return self._http
+
+    def server_version(self) -> Optional[str]:
+        # The toolchain the server compiles and estimates with by default; None when the server does not tell.
+        # The version is kept in the cache for the TTL, so a later command finding its result cached sends no
+        # request, and the version fetched last is kept while the server cannot be reached.
+        with self._server_version_lock:
+            fetched_at = self._server_version.get('fetched_at')
+            if fetched_at is None or time.monotonic() - fetched_at >= self.server_version_ttl:
+                stored = self.cache.server_version(self.api_endpoint)
+                age = time.time() - stored['fetched_at'] if stored is not None else None
+                if age is not None and 0 <= age < self.server_version_ttl:
+                    version, fetched_at = stored['version'], time.monotonic() - age
+                else:
+                    version, fetched_at = self.fetch_server_version(), time.monotonic()
+                    if version is not None:
+                        try:
+                            self.cache.store_server_version(self.api_endpoint, version, time.time())
+                        except OSError as e:
+                            logging.debug('fail to store the server version into {}: {}'.format(self.cache.root, e))
+                    elif stored is not None:
+                        version = stored['version']
+                self._server_version.update(version=version, fetched_at=fetched_at)
+            return self._server_version['version']
+
+    def fetch_server_version(self) -> Optional[str]:
+        try:
+            r = self.http.get('{}/version'.format(self.api_endpoint))
+            if r.status_code == 200:
+                content = r.json()
+                return '{} (rev: {})'.format(content['version'], content.get('revision'))
+            logging.debug('fail to get the server version: {}'.format(r.status_code))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.debug('fail to get the server version: {}'.format(e))
+        return None
+
+    def close(self):
+        if self._parent is None and self._http is not None:
+            self._http.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise CliError('{} must be an integer, but got {}'.format(name, value), 1)
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise CliError('{} must be a number, but got {}'.format(name, value), 1)
 
 
 class CLIDriver(object):
@@ -31,13 +195,25 @@ class CLIDriver(object):
     debug = False
     quiet = False
 
-    commands = {'compile', 'perfeye', 'version'}
+    commands = {'compile', 'perf', 'perfeye', 'version'}
+    # commands running without any API call, so they need no credentials
+    local_commands = {'cache', 'calibrate', 'ranges', 'report', 'run-batch', 'shell'}
+    local_subcommands = {('jobs', 'list'), ('jobs', 'prune')}
 
-    def __init__(self, args, args_map):
+    def __init__(self, args, args_map, session: Session = None):
         self.args = args
         self.args_map = args_map
         self.check_args()
-        self.session = Session()
+        # a command of a batch runs on a fork of the batch's session
+        if session is None:
+            self.session = Session(require_credentials=not self.is_local())
+        else:
+            self.session = session.fork(require_credentials=not self.is_local())
+        if getattr(self.args, 'compression', None) is not None:
+            from furiosacli.compression import check_compression
+
+            check_compression(self.args.compression)
+            self.session.compression = self.args.compression
 
     def check_args(self):
         self.quiet = self.args.quiet
@@ -46,17 +222,43 @@ class CLIDriver(object):
         if self.args.command is None:
             raise NoCommandException()
 
+    def is_local(self) -> bool:
+        return (self.args.command in self.local_commands
+                or (self.args.command, getattr(self.args, 'subcmd', None)) in self.local_subcommands)
+
     def run(self) -> int:
+        from furiosacli import commands
+
         if self.args.command == 'compile':
             cmd = commands.Compile(self.session, self.args, self.args_map)
+        elif self.args.command == 'perf':
+            cmd = commands.Perf(self.session, self.args, self.args_map)
+        elif self.args.command == 'perf-diff':
+            cmd = commands.PerfDiff(self.session, self.args, self.args_map)
         elif self.args.command == 'perfeye':
             cmd = commands.Perfeye(self.session, self.args, self.args_map)
+        elif self.args.command == 'sweep':
+            cmd = commands.Sweep(self.session, self.args, self.args_map)
         elif self.args.command == 'optimize':
             cmd = commands.Optimize(self.session, self.args, self.args_map)
         elif self.args.command == 'build_calibration_model':
             cmd = commands.BuildCalibrationModel(self.session, self.args, self.args_map)
         elif self.args.command == 'quantize':
             cmd = commands.Quantize(self.session, self.args, self.args_map)
+        elif self.args.command == 'calibrate':
+            cmd = commands.Calibrate(self.session, self.args, self.args_map)
+        elif self.args.command == 'ranges':
+            if self.args.subcmd == 'merge':
+                cmd = commands.RangesMerge(self.session, self.args, self.args_map)
+            else:
+                raise CliError('ranges requires one of following subcommands: merge')
+        elif self.args.command == 'report':
+            if self.args.subcmd == 'summarize':
+                cmd = commands.ReportSummarize(self.session, self.args, self.args_map)
+            else:
+                raise CliError('report requires one of following subcommands: summarize')
+        elif self.args.command == 'pipeline':
+            cmd = commands.Pipeline(self.session, self.args, self.args_map)
         elif self.args.command == 'version':
             cmd = commands.Version(self.session, self.args, self.args_map)
         elif self.args.command == 'toolchain':
@@ -64,10 +266,48 @@ class CLIDriver(object):
                 cmd = commands.ToolchainList(self.session, self.args, self.args_map)
             else:
                 raise CliError('toolchain requires one of following subcommands: list')
+        elif self.args.command == 'cache':
+            if self.args.subcmd in ('stats', 'prune', 'clear'):
+                cmd = commands.CacheCommand(self.session, self.args, self.args_map)
+            else:
+                raise CliError('cache requires one of following subcommands: stats, prune, clear')
+        elif self.args.command in ('run-batch', 'shell'):
+            cmd = commands.RunBatch(self.session, self.args, self.args_map)
+        elif self.args.command == 'jobs':
+            if self.args.subcmd in ('list', 'status', 'wait', 'fetch', 'prune'):
+                cmd = commands.Jobs(self.session, self.args, self.args_map)
+            else:
+                raise CliError('jobs requires one of following subcommands: list, status, wait, fetch, prune')
         else:
             raise CliError('Unknown command: {}'.format(self.args.command), 2)
 
-        return cmd.run()
+        exit_code = None
+        error = None
+        try:
+            exit_code = cmd.run() or 0
+            return exit_code
+        except CliError as e:
+            exit_code, error = e.exit_code, e.message
+            raise
+        except BaseException as e:
+            exit_code, error = 1, str(e) or type(e).__name__
+            raise
+        finally:
+            self.session.close()
+            if self.session.metrics.retries:
+                logging.warning('{} request attempt(s) failed and were retried'
+                                .format(len(self.session.metrics.retries)))
+            self.write_metrics(exit_code, error)
+
+    def write_metrics(self, exit_code: int, error: str = None):
+        command = ' '.join(filter(None, [self.args.command, getattr(self.args, 'subcmd', None)]))
+        try:
+            if self.args.metrics_json is not None:
+                self.session.metrics.write_json(self.args.metrics_json, command, exit_code, error)
+            if self.args.metrics_openmetrics is not None:
+                self.session.metrics.write_openmetrics(self.args.metrics_openmetrics, command, exit_code)
+        except OSError as e:
+            logging.warning('fail to write the metrics: {}'.format(e))
 
 
 def eprint(*args, **kwargs):
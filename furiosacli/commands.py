@@ -1,27 +1,19 @@
-import base64
+import glob
 import json
 import logging
-import uuid
-from typing import Dict, Tuple
-
-import requests
-import yaml
-from furiosa.client import CompilerClient, CompileTask
-from requests_toolbelt.multipart.encoder import MultipartEncoder
-
-from furiosacli import consts, __version__
-from furiosacli import http
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait as wait_futures
+from typing import Callable, Dict, List, Tuple
+
+from furiosacli import consts, http, __version__
+from furiosacli.cache import ResultCache, file_digest, format_size, format_timestamp, parse_size
 from furiosacli.exceptions import CliError, ApiError
-
-
-class ApiKeyAuth(requests.auth.AuthBase):
-    def __init__(self, session):
-        self.session = session
-
-    def __call__(self, r):
-        r.headers[consts.ACCESS_KEY_ID_HTTP_HEADER] = self.session.access_key_id
-        r.headers[consts.SECRET_ACCESS_KEY_HTTP_HEADER] = self.session.secret_key_access
-        return r
+from furiosacli.http import ModelSource, post_model
 
 
 class Command(object):
@@ -29,6 +21,8 @@ class Command(object):
         self.session = session
         self.args = args
         self.args_map = args_map
+        # set by --watch while a build runs, to stop it once a newer version of its inputs appears
+        self.stop = None
 
     def print_message(self, msg):
         if not self.args.quiet:
@@ -37,14 +31,78 @@ class Command(object):
     def run(self) -> int:
         pass
 
+    def result_cache(self):
+        if getattr(self.args, 'no_cache', False):
+            return None
+        return self.session.cache
+
+    def cache_key(self, command: str, source_path: str, *params) -> str:
+        # a result is only reused while the server runs the same toolchain, which is not asked without a cache
+        server_version = self.session.server_version() if self.result_cache() is not None else None
+        return ResultCache.make_key(command, source_path, self.session.api_endpoint, server_version, __version__,
+                                    *params)
+
+    def restore_cached(self, key: str, outputs: Dict[str, str]) -> bool:
+        cache = self.result_cache()
+        if cache is None:
+            return False
+
+        artifacts = cache.get(key, list(outputs))
+        if artifacts is None:
+            return False
+
+        with self.session.metrics.phase('write', cache='restore') as phase:
+            for name, output_path in outputs.items():
+                shutil.copyfile(artifacts[name], output_path)
+                phase['bytes'] += os.path.getsize(output_path)
+        return True
+
+    def store_cached(self, key: str, outputs: Dict[str, str]):
+        cache = self.result_cache()
+        if cache is None:
+            return
+
+        try:
+            with self.session.metrics.phase('write', cache='store'):
+                cache.put(key, outputs)
+        except OSError as e:
+            logging.warning('fail to store the result into the cache {}: {}'.format(cache.root, e))
+
+    def poller(self) -> 'TaskPoller':
+        from furiosacli.tasks import TaskPoller
+
+        return TaskPoller(interval=self.args.poll_interval,
+                          max_interval=self.args.max_poll_interval,
+                          backoff=self.args.poll_backoff,
+                          timeout=self.args.timeout,
+                          quiet=self.args.quiet,
+                          stop=self.stop)
+
+    def watch(self, build: Callable[[], None]) -> int:
+        # runs build() again whenever the model, --config or --target-npu-spec changes
+        from furiosacli.watch import WatchLoop
+
+        paths = [self.args_map['source']] + [path for path in (self.args.config, self.args.target_npu_spec)
+                                             if path is not None]
+
+        def run_build(stop):
+            self.stop = stop
+            build()
+
+        return WatchLoop(paths, run_build, debounce=self.args.debounce, quiet=self.args.quiet).run()
+
 
 def read_config_file(path: str):
     with open(path, 'r') as yaml_file:
+        import yaml
+
         yaml_obj = yaml.safe_load(yaml_file)
-        return json.dumps(yaml_obj)
+        return json.dumps(yaml_obj, sort_keys=True)
 
 
 def pretty_yaml(json) -> str:
+    import yaml
+
     return yaml.dump(json, default_flow_style=False)
 
 
@@ -64,10 +122,15 @@ def handle_compiler_config(args) -> str:
 
 
 def handle_target_ir(args_map) -> str:
-    if args_map['target_ir'] not in consts.SUPPORT_TARGET_IRS:
-        raise CliError('target-ir must be one of {}'.format(consts.SUPPORT_TARGET_IRS))
-    else:
-        return args_map['target_ir']
+    # several IRs may be given comma-separated (e.g. lir,enf) to get all of them from a single compile
+    target_irs = []
+    for target_ir in args_map['target_ir'].split(','):
+        target_ir = target_ir.strip()
+        if target_ir not in consts.SUPPORT_TARGET_IRS:
+            raise CliError('target-ir must be one of {}'.format(consts.SUPPORT_TARGET_IRS))
+        if target_ir not in target_irs:
+            target_irs.append(target_ir)
+    return ','.join(target_irs)
 
 
 class Version(Command):
@@ -77,9 +140,7 @@ class Version(Command):
     def run(self) -> int:
         request_url = '{}/version'.format(self.session.api_endpoint)
 
-        r = requests.get(request_url,
-                         headers=http.DEFAULT_HEADERS,
-                         auth=ApiKeyAuth(self.session))
+        r = self.session.http.get(request_url)
 
         if r.status_code == 200:
             content = r.json()
@@ -97,57 +158,333 @@ class Version(Command):
 def read_yaml_config(path) -> str:
     if path is not None:
         with open(path, 'r') as yaml_file:
+            import yaml
+
             obj = yaml.safe_load(yaml_file)
             return yaml.dump(obj)
     else:
         return '~'
 
 
+def resolve_batch_sources(batch: str) -> List[str]:
+    # A batch is either a manifest file listing one model path per line or a glob pattern
+    if os.path.isfile(batch) and not glob.has_magic(batch):
+        base_dir = os.path.dirname(batch)
+        with open(batch, 'r') as manifest:
+            sources = [os.path.join(base_dir, line.strip()) for line in manifest
+                       if line.strip() and not line.strip().startswith('#')]
+    else:
+        sources = sorted(path for path in glob.glob(batch, recursive=True) if os.path.isfile(path))
+
+    if not sources:
+        raise CliError('no model matches the batch {}'.format(batch))
+    return sources
+
+
+def batch_output_names(sources: List[str]) -> List[str]:
+    names = []
+    seen = set()
+    for source in sources:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        name = stem
+        idx = 1
+        while name in seen:
+            name = '{}-{}'.format(stem, idx)
+            idx += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
 class Compile(Command):
     def __init__(self, session, args, args_map):
         super().__init__(session, args, args_map)
 
+    @staticmethod
+    def submit_and_wait(session,
+                        source_path: str,
+                        compiler_config: str,
+                        target_npu_spec: str,
+                        target_ir: str,
+                        poller: 'TaskPoller' = None) -> 'CompileTask':
+        from furiosacli.tasks import TaskPoller, submit_compile
+
+        task = submit_compile(session, source_path, compiler_config, target_npu_spec, target_ir)
+        with session.metrics.phase('server', task_id=task.task_id):
+            (poller or TaskPoller()).wait([task])
+        return task
+
+    @staticmethod
+    def ir_paths(target_ir: str, output_path: str) -> Dict[str, str]:
+        # a single IR is written to output_path, and several IRs next to it with each IR as the extension
+        target_irs = target_ir.split(',')
+        if len(target_irs) == 1:
+            return {target_ir: output_path}
+        stem = os.path.splitext(output_path)[0]
+        return {ir: '{}.{}'.format(stem, ir) for ir in target_irs}
+
+    @staticmethod
+    def write_outputs(task: 'CompileTask',
+                      ir_paths: Dict[str, str],
+                      compiler_report_path: str = None,
+                      mem_alloc_report_path: str = None):
+        if not task.is_succeeded():
+            raise CliError('fail to compile: \n{}'.format(task.get_error_message()))
+
+        downloads = [('ir', path, target_ir) for target_ir, path in ir_paths.items()]
+        if compiler_report_path is not None:
+            downloads.append(('compiler-report', compiler_report_path, None))
+        if mem_alloc_report_path is not None:
+            downloads.append(('memory-alloc-report', mem_alloc_report_path, None))
+        # the artifacts are independent of each other, so they are downloaded at once
+        with ThreadPoolExecutor(max_workers=len(downloads)) as executor:
+            for future in [executor.submit(task.save_artifact, artifact, path, target_ir)
+                           for artifact, path, target_ir in downloads]:
+                future.result()
+
+    @staticmethod
+    def output_map(ir_paths: Dict[str, str], compiler_report_path: str = None, mem_alloc_report_path: str = None):
+        outputs = {'ir.{}'.format(target_ir): path for target_ir, path in ir_paths.items()}
+        if compiler_report_path is not None:
+            outputs['compiler_report'] = compiler_report_path
+        if mem_alloc_report_path is not None:
+            outputs['mem_alloc_report'] = mem_alloc_report_path
+        return outputs
+
+    def compile(self,
+                source_path: str,
+                compiler_config: str,
+                target_npu_spec: str,
+                target_ir: str,
+                output_path: str,
+                compiler_report_path: str = None,
+                mem_alloc_report_path: str = None) -> bool:
+        ir_paths = Compile.ir_paths(target_ir, output_path)
+        outputs = Compile.output_map(ir_paths, compiler_report_path, mem_alloc_report_path)
+        key = self.cache_key('compile', source_path, compiler_config, target_npu_spec, target_ir)
+        if self.restore_cached(key, outputs):
+            return True
+
+        task = Compile.submit_and_wait(self.session, source_path, compiler_config, target_npu_spec, target_ir,
+                                       poller=self.poller())
+        if not task.is_succeeded():
+            raise CliError('fail to compile {}: \n{}'.format(source_path, task.get_error_message()))
+
+        Compile.write_outputs(task, ir_paths, compiler_report_path, mem_alloc_report_path)
+        self.store_cached(key, outputs)
+        return False
+
     def run(self) -> int:
+        if self.args.batch is not None:
+            if self.args.detach or self.args.watch:
+                raise CliError('--detach and --watch cannot be used with --batch')
+            return self.run_batch()
+
+        if self.args_map['source'] is None:
+            raise CliError('compile requires a source model or --batch')
+        if self.args.watch:
+            if self.args.detach:
+                raise CliError('--detach cannot be used with --watch')
+            return self.watch(self.run_once)
+        return self.run_once()
+
+    def run_once(self) -> int:
+        start = time.perf_counter()
         source_path = self.args_map['source']
-        compiler_config = read_yaml_config(self.args.config)
-        target_npu_spec = read_yaml_config(self.args.target_npu_spec)
-        target_ir = handle_target_ir(self.args_map)
+        with self.session.metrics.phase('config'):
+            compiler_config = read_yaml_config(self.args.config)
+            target_npu_spec = read_yaml_config(self.args.target_npu_spec)
+            target_ir = handle_target_ir(self.args_map)
 
-        client = CompilerClient()
-        with open(source_path, 'rb') as file:
-            task = client.submit_compile(source=file,
-                                         compiler_config=compiler_config,
-                                         target_npu_spec=target_npu_spec)
-            task.wait_for_complete()
-
-        if task.is_succeeded():
-            if 'o' in self.args and self.args_map['o'] is not None:
-                output_path = self.args_map['o']
-            else:
-                output_path = 'output.{}'.format(target_ir)
+        if 'o' in self.args and self.args_map['o'] is not None:
+            output_path = self.args_map['o']
+        else:
+            output_path = 'output.{}'.format(target_ir.split(',')[0])
 
-            with open(output_path, 'wb') as output_file:
-                output_file.write(task.get_ir())
-                ms_elapsed = 100
-                self.print_message('{} has been generated (elapsed: {} ms)'.format(output_path, ms_elapsed))
+        if self.args.detach:
+            return self.run_detached(source_path, compiler_config, target_npu_spec, target_ir, output_path)
 
+        cached = self.compile(source_path, compiler_config, target_npu_spec, target_ir, output_path,
+                              compiler_report_path=self.args.compiler_report,
+                              mem_alloc_report_path=self.args.mem_alloc_report)
+        for path in Compile.ir_paths(target_ir, output_path).values():
+            if cached:
+                self.print_message('{} has been generated (cached)'.format(path))
+            else:
+                self.print_message('{} has been generated (elapsed: {:.3f} ms)'
+                                   .format(path, (time.perf_counter() - start) * 1000))
+
+        if self.args.compiler_report is not None:
+            self.print_message('the compiler report has been written to {}'
+                               .format(self.args.compiler_report))
+        if self.args.mem_alloc_report is not None:
+            self.print_message('the memory allocation report has been written to {}'
+                               .format(self.args.mem_alloc_report))
+
+    def run_detached(self,
+                     source_path: str,
+                     compiler_config: str,
+                     target_npu_spec: str,
+                     target_ir: str,
+                     output_path: str) -> int:
+        from furiosacli.tasks import require_compile_tasks_api, submit_compile
+
+        # a detached job is looked up by its id later, which furiosa.client cannot do
+        require_compile_tasks_api(self.session, 'compile --detach')
+        task = submit_compile(self.session, source_path, compiler_config, target_npu_spec, target_ir)
+        key = None
+        if self.result_cache() is not None:
+            key = self.cache_key('compile', source_path, compiler_config, target_npu_spec, target_ir)
+        self.session.jobs.record(task.task_id,
+                                 phase=task.phase,
+                                 source=source_path,
+                                 target_ir=target_ir,
+                                 endpoint=self.session.api_endpoint,
+                                 submitted_at=time.time(),
+                                 cache_key=key,
+                                 outputs=Compile.output_map(Compile.ir_paths(target_ir, output_path),
+                                                            self.args.compiler_report,
+                                                            self.args.mem_alloc_report))
+        # the job id is the result of a detached compile, so it is printed even in quiet mode
+        print(task.task_id)
+        return 0
+
+    def run_batch(self) -> int:
+        if self.args_map['source'] is not None:
+            raise CliError('source and --batch cannot be used together')
+        if self.args.jobs < 1:
+            raise CliError('--jobs must be at least 1')
+
+        from furiosacli.tasks import TaskPoller, submit_compile
+
+        with self.session.metrics.phase('config'):
+            sources = resolve_batch_sources(self.args.batch)
+            compiler_config = read_yaml_config(self.args.config)
+            target_npu_spec = read_yaml_config(self.args.target_npu_spec)
+            target_ir = handle_target_ir(self.args_map)
+        poller = self.poller()
+
+        # In batch mode, -o, --compiler-report and --mem-alloc-report are directories
+        output_dir = self.args_map['o'] or '.'
+        for directory in (output_dir, self.args.compiler_report, self.args.mem_alloc_report):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+
+        def model_outputs(name):
+            ir_paths = {ir: os.path.join(output_dir, '{}.{}'.format(name, ir)) for ir in target_ir.split(',')}
+            compiler_report_path = None
             if self.args.compiler_report is not None:
-                compiler_report_path = self.args.compiler_report
-                with open(compiler_report_path, 'w') as compiler_report_file:
-                    compiler_report = task.get_compiler_report()
-                    compiler_report_file.write(compiler_report)
-                    self.print_message('the compiler report has been written to {}'
-                                       .format(compiler_report_path))
-
+                compiler_report_path = os.path.join(self.args.compiler_report, '{}.compiler_report.txt'.format(name))
+            mem_alloc_report_path = None
             if self.args.mem_alloc_report is not None:
-                mem_alloc_report_path = self.args.mem_alloc_report
-                with open(self.args.mem_alloc_report, 'w') as mem_alloc_report_file:
-                    mem_alloc_report = task.get_memory_alloc_report()
-                    mem_alloc_report_file.write(mem_alloc_report)
-                    self.print_message('the memory allocation report has been written to {}'
-                                       .format(mem_alloc_report_path))
-        else:
-            raise CliError('fail to compile {}: \n{}'.format(source_path, task.get_error_message()))
+                mem_alloc_report_path = os.path.join(self.args.mem_alloc_report,
+                                                     '{}.mem_alloc_report.html'.format(name))
+            return ir_paths, compiler_report_path, mem_alloc_report_path
+
+        results = []
+
+        def finish(source_path, start, output_path=None, error=None):
+            results.append((source_path, output_path, time.perf_counter() - start, error))
+            if error is None:
+                self.print_message('{} has been generated (elapsed: {:.3f} ms)'
+                                   .format(output_path, (time.perf_counter() - start) * 1000))
+            else:
+                logging.error(error)
+
+        # -j bounds the models in flight, from their upload until their outputs are written, so at most -j
+        # compile tasks run on the server at once. A slot is taken before a model is submitted and given back
+        # once its outputs are written, while a single loop polls every submitted task.
+        slots = threading.Semaphore(self.args.jobs)
+        closing = threading.Event()
+        incoming = queue.Queue()
+
+        def submit_one(source_path, name):
+            slots.acquire()
+            if closing.is_set():
+                return
+            start = time.perf_counter()
+            paths = model_outputs(name)
+            key = self.cache_key('compile', source_path, compiler_config, target_npu_spec, target_ir)
+            try:
+                if self.restore_cached(key, Compile.output_map(*paths)):
+                    finish(source_path, start, ', '.join(paths[0].values()))
+                    slots.release()
+                    return
+                task = submit_compile(self.session, source_path, compiler_config, target_npu_spec, target_ir)
+            except Exception as e:
+                finish(source_path, start, error=getattr(e, 'message', str(e)))
+                slots.release()
+                return
+            submissions[task.task_id] = (task, source_path, start, key, paths)
+            incoming.put(task)
+
+        def fetch_one(task, source_path, start, key, paths):
+            try:
+                if not task.is_succeeded():
+                    raise CliError('fail to compile {}: \n{}'.format(source_path, task.get_error_message()))
+                Compile.write_outputs(task, *paths)
+                self.store_cached(key, Compile.output_map(*paths))
+                finish(source_path, start, ', '.join(paths[0].values()))
+            except Exception as e:
+                finish(source_path, start, error=getattr(e, 'message', str(e)))
+            finally:
+                slots.release()
+
+        batch_start = time.perf_counter()
+        submissions = {}
+        downloads = []
+        with ThreadPoolExecutor(max_workers=self.args.jobs) as submitter, \
+                ThreadPoolExecutor(max_workers=self.args.jobs) as downloader:
+            submitted = [submitter.submit(submit_one, source, name)
+                         for source, name in zip(sources, batch_output_names(sources))]
+            # the poller stops receiving tasks once every model has been submitted (or restored from the cache)
+            threading.Thread(target=lambda: (wait_futures(submitted), incoming.put(None)), daemon=True).start()
+            try:
+                with self.session.metrics.phase('server', tasks=len(sources)):
+                    poller.wait([], on_finished=lambda task: downloads.append(
+                        downloader.submit(fetch_one, *submissions[task.task_id])), incoming=incoming)
+            except BaseException:
+                # the submitters waiting for a slot give up, and the tasks submitted meanwhile are cancelled
+                closing.set()
+                for _ in sources:
+                    slots.release()
+                wait_futures(submitted)
+                while not incoming.empty():
+                    task = incoming.get_nowait()
+                    if task is not None:
+                        TaskPoller.cancel([task])
+                raise
+            for download in downloads:
+                download.result()
+
+        failed = [result for result in results if result[3] is not None]
+        self.print_message(format_batch_summary(sorted(results, key=lambda result: result[0]),
+                                                time.perf_counter() - batch_start))
+        return 1 if failed else 0
+
+
+def format_batch_summary(results, wall_clock_secs: float) -> str:
+    width = max([len('MODEL')] + [len(result[0]) for result in results])
+    lines = ['{:<{width}}  {:<6}  {:>12}  {}'.format('MODEL', 'STATUS', 'ELAPSED (s)', 'OUTPUT', width=width)]
+    for source_path, output_path, elapsed, error in results:
+        status = 'OK' if error is None else 'FAILED'
+        lines.append('{:<{width}}  {:<6}  {:>12.3f}  {}'
+                     .format(source_path, status, elapsed, output_path or '-', width=width))
+    succeeded = sum(1 for result in results if result[3] is None)
+    lines.append('{} of {} models compiled (wall clock: {:.3f} s)'
+                 .format(succeeded, len(results), wall_clock_secs))
+    return '\n'.join(lines)
+
+
+def dss_request(session,
+                api_path: str,
+                model: ModelSource,
+                model_path: str,
+                description: str,
+                fields: Dict[str, str] = None,
+                stream: bool = False):
+    return post_model(session, 'api/v1/dss/{}'.format(api_path), model, model_path, description,
+                      fields=fields, stream=stream)
 
 
 class Perf(Command):
@@ -156,51 +493,99 @@ class Perf(Command):
         self.api_path = "api/v1/" + api_path
         self.content_type = content_type
 
+    @staticmethod
+    def perf_request(session,
+                     model: ModelSource,
+                     target_npu_spec: str = '{}',
+                     compiler_config: str = '{}',
+                     api_path: str = 'api/v1/perfeye',
+                     model_path: str = None,
+                     stream: bool = False,
+                     toolchain: str = None):
+        logging.debug("target npu spec: \n{}\n".format(pretty_yaml(target_npu_spec)))
+        logging.debug("compiler config: \n{}\n".format(pretty_yaml(compiler_config)))
+        fields = {'target_npu_spec': target_npu_spec, 'compiler_config': compiler_config}
+        # without a toolchain, the server estimates with its default toolchain
+        if toolchain is not None:
+            fields['toolchain'] = toolchain
+        return post_model(session, api_path, model, model_path, 'estimate the performance',
+                          fields=fields, stream=stream)
+
+    @staticmethod
+    def perf_to_file(session,
+                     model: ModelSource,
+                     output_path: str,
+                     target_npu_spec: str = '{}',
+                     compiler_config: str = '{}',
+                     api_path: str = 'api/v1/perfeye',
+                     model_path: str = None,
+                     toolchain: str = None) -> int:
+        r = Perf.perf_request(session, model, target_npu_spec, compiler_config,
+                              api_path=api_path, model_path=model_path, stream=True, toolchain=toolchain)
+        return http.save_response(r, output_path, metrics=session.metrics)
+
+    def estimate_to_file(self,
+                         source_path: str,
+                         output_path: str,
+                         target_npu_spec: str,
+                         compiler_config: str,
+                         toolchain: str = None) -> bool:
+        params = [target_npu_spec, compiler_config] + ([toolchain] if toolchain is not None else [])
+        key = self.cache_key(self.api_path, source_path, *params)
+        if self.restore_cached(key, {'result': output_path}):
+            return True
+
+        logging.debug("output path: {}".format(output_path))
+        r = Perf.perf_request(self.session, source_path, target_npu_spec, compiler_config,
+                              api_path=self.api_path, stream=True, toolchain=toolchain)
+        http.save_response(r, output_path, metrics=self.session.metrics)
+        self.store_cached(key, {'result': output_path})
+        return False
+
     def run(self) -> int:
+        if getattr(self.args, 'watch', False):
+            return self.watch(self.run_once)
+        return self.run_once()
+
+    def run_once(self) -> int:
+        start = time.perf_counter()
         source_path = self.args_map['source']
-        target_npu_spec = handle_target_npu_spec(self.args)
-        compiler_config = handle_compiler_config(self.args)
+        with self.session.metrics.phase('config'):
+            target_npu_spec = handle_target_npu_spec(self.args)
+            compiler_config = handle_compiler_config(self.args)
 
         if 'o' in self.args and self.args_map['o'] is not None:
             output_path = self.args_map['o']
         else:
             output_path = 'output.{}'.format(self.content_type)
 
-        multi_parts = MultipartEncoder(
-            fields={
-                'target_npu_spec': target_npu_spec,
-                'compiler_config': compiler_config,
-                'source': (source_path, open(source_path, mode='rb'), 'application/octet-stream')
-            }
-        )
-
-        request_url = '{}/{}'.format(self.session.api_endpoint, self.api_path)
-        headers = {
-            consts.REQUEST_ID_HTTP_HEADER: str(uuid.uuid4()),
-            'Content-Type': multi_parts.content_type,
-            **http.DEFAULT_HEADERS
-        }
-
-        logging.debug("submitting the perf request to {}".format(request_url))
-        logging.debug("source path: {}".format(source_path))
-        logging.debug("output path: {}".format(output_path))
-        logging.debug("target npu spec: \n{}\n".format(pretty_yaml(target_npu_spec)))
-        logging.debug("compiler config: \n{}\n".format(pretty_yaml(compiler_config)))
-
-        r = requests.post(request_url,
-                          data=multi_parts,
-                          headers=headers,
-                          auth=ApiKeyAuth(self.session))
-
-        if r.status_code == 200:
-            with open(output_path, 'wb') as output_file:
-                content = r.content
-                output_file.write(content)
+        table = None
+        if self.content_type == 'csv' and (output_path.endswith('.json') or self.args_map.get('top')):
+            from furiosacli.perfdata import PerfTable
+
+            # the server estimates in csv, which is converted into json locally
+            with tempfile.TemporaryDirectory() as work_dir:
+                result_path = output_path
+                if output_path.endswith('.json'):
+                    result_path = os.path.join(work_dir, 'result.csv')
+                cached = self.estimate_to_file(source_path, result_path, target_npu_spec, compiler_config,
+                                               self.args.toolchain)
+                table = PerfTable.load(result_path)
+                if result_path != output_path:
+                    table.write_json(output_path)
+        else:
+            cached = self.estimate_to_file(source_path, output_path, target_npu_spec, compiler_config,
+                                           self.args.toolchain)
 
-                ms_elapsed = r.elapsed.microseconds / 1000
-                self.print_message('{} has been generated (elapsed: {} ms)'.format(output_path, ms_elapsed))
+        if cached:
+            self.print_message('{} has been generated (cached)'.format(output_path))
         else:
-            raise ApiError('fail to estimate the performance {}'.format(source_path), r)
+            self.print_message('{} has been generated (elapsed: {:.3f} ms)'
+                               .format(output_path, (time.perf_counter() - start) * 1000))
+        if table is not None and self.args_map.get('top'):
+            from furiosacli.perfdata import format_top_operators
+
+            self.print_message(format_top_operators(table, table.latency_column(), self.args_map['top']))
 
 
 class Perfeye(Perf):
@@ -208,38 +593,236 @@ class Perfeye(Perf):
         super().__init__(session, args, args_map, api_path='perfeye', content_type='html')
 
 
-class Optimize(Command):
+class PerfDiff(Perf):
     def __init__(self, session, args, args_map):
-        super().__init__(session, args, args_map)
+        super().__init__(session, args, args_map, api_path='perf', content_type='csv')
+
+    def estimate_table(self,
+                       source_path: str,
+                       target_npu_spec: str,
+                       compiler_config: str,
+                       toolchain: str,
+                       work_dir: str) -> 'PerfTable':
+        from furiosacli.perfdata import PerfTable
+
+        fd, result_path = tempfile.mkstemp(suffix='.csv', dir=work_dir)
+        os.close(fd)
+        self.estimate_to_file(source_path, result_path, target_npu_spec, compiler_config, toolchain)
+        return PerfTable.load(result_path)
 
     @staticmethod
-    def optimize(session, model: bytes, model_path: str = None) -> bytes:
-        model_path = model_path or 'model.onnx'
-        multi_parts = MultipartEncoder(
-            fields={
-                'source': (model_path, model, 'application/octet-stream')
-            }
-        )
-
-        request_url = '{}/api/v1/dss/optimize'.format(session.api_endpoint)
-        headers = {
-            consts.REQUEST_ID_HTTP_HEADER: str(uuid.uuid4()),
-            'Content-Type': multi_parts.content_type,
-            **http.DEFAULT_HEADERS
+    def check_baseline(baseline_file: str, stored: Dict, metadata: Dict):
+        if not stored:
+            raise CliError('{} does not record what it estimated; remove it to store a new baseline'
+                           .format(baseline_file))
+        for name in ('model_digest', 'compiler_config', 'target_npu_spec'):
+            if stored.get(name) != metadata[name]:
+                raise CliError('{} was estimated with another {}; remove it to store a new baseline'
+                               .format(baseline_file, name.replace('_', ' ')))
+        if metadata['toolchain'] is not None and stored.get('toolchain') != metadata['toolchain']:
+            raise CliError('{} was estimated with the toolchain {}, not --baseline-toolchain {}'
+                           .format(baseline_file, stored.get('toolchain') or '(server default)', metadata['toolchain']))
+
+    def run(self) -> int:
+        from furiosacli import perfdata
+
+        baseline_file = self.args.baseline_file
+        reuse_baseline = baseline_file is not None and os.path.isfile(baseline_file)
+        if self.args.baseline_toolchain is None and not reuse_baseline:
+            raise CliError('--baseline-toolchain is required unless --baseline-file exists')
+        if self.args.threshold < 0:
+            raise CliError('--threshold must not be negative')
+
+        source_path = self.args_map['source']
+        with self.session.metrics.phase('config'):
+            target_npu_spec = handle_target_npu_spec(self.args)
+            compiler_config = handle_compiler_config(self.args)
+        # a stored baseline is only compared against estimations of the same model and configs
+        metadata = {
+            'model_digest': file_digest(source_path),
+            'compiler_config': compiler_config,
+            'target_npu_spec': target_npu_spec,
+            'toolchain': self.args.baseline_toolchain,
         }
+        baseline = None
+        if reuse_baseline:
+            logging.debug('reusing the baseline {}'.format(baseline_file))
+            baseline = perfdata.PerfTable.load(baseline_file)
+            PerfDiff.check_baseline(baseline_file, baseline.metadata, metadata)
+
+        # both toolchains estimate at once; a stored baseline skips its estimation altogether
+        with tempfile.TemporaryDirectory() as work_dir, ThreadPoolExecutor(max_workers=2) as executor:
+            candidate = executor.submit(self.estimate_table, source_path, target_npu_spec, compiler_config,
+                                        self.args.candidate_toolchain, work_dir)
+            if baseline is None:
+                baseline = executor.submit(self.estimate_table, source_path, target_npu_spec, compiler_config,
+                                           self.args.baseline_toolchain, work_dir).result()
+            candidate = candidate.result()
+
+        if baseline_file is not None and not reuse_baseline:
+            baseline.metadata = metadata
+            baseline.write_json(baseline_file)
+            self.print_message('the baseline has been stored in {}'.format(baseline_file))
+
+        diff = perfdata.diff_tables(baseline, candidate)
+        column = baseline.latency_column(self.args.metric)
+        gated = [column] + [name for name in diff['columns'] if perfdata.is_memory_column(name)]
+        regressed = perfdata.regressions(diff, gated, self.args.threshold / 100)
+        if self.args_map['o'] is not None:
+            with open(self.args_map['o'], 'w') as output_file:
+                json.dump({**diff, 'gated': gated, 'threshold': self.args.threshold, 'regressed': regressed},
+                          output_file, indent=2)
+
+        self.print_message(perfdata.format_diff(diff, baseline.names[0], column, self.args.top))
+        if regressed:
+            self.print_message('REGRESSION: {} grew by more than {}%'.format(', '.join(regressed), self.args.threshold))
+            return 1
+        self.print_message('no regression above {}% in {}'.format(self.args.threshold, ', '.join(gated)))
+        return 0
+
+
+def read_yaml_dict(path: str) -> Dict:
+    if path is None:
+        return {}
+    with open(path, 'r') as yaml_file:
+        import yaml
 
-        logging.debug("submitting the build calibration model request to {}".format(request_url))
-        logging.debug("source path: {}".format(model_path))
+        content = yaml.safe_load(yaml_file) or {}
+    if not isinstance(content, dict):
+        raise CliError('{} must be a yaml mapping'.format(path))
+    return content
 
-        r = requests.post(request_url,
-                          data=multi_parts,
-                          headers=headers,
-                          auth=ApiKeyAuth(session))
 
-        if r.status_code == 200:
-            return r.content
-        else:
-            raise ApiError('fail to build calibration model {}'.format(model_path), r)
+class Sweep(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+        # results by point, so that a point is never estimated twice in one sweep
+        self.evaluated = {}
+
+    def evaluate(self, source_path: str, compiler_config: Dict, target_npu_spec: Dict, point, work_dir: str) -> Dict:
+        from furiosacli import perfdata, sweep
+
+        start = time.perf_counter()
+        result = {'point': point, 'latency': None, 'cached': False, 'error': None}
+        compiler_config = json.dumps(sweep.apply_point(compiler_config, 'compiler_config', point), sort_keys=True)
+        target_npu_spec = json.dumps(sweep.apply_point(target_npu_spec, 'target_npu_spec', point), sort_keys=True)
+        fd, result_path = tempfile.mkstemp(suffix='.csv', dir=work_dir)
+        os.close(fd)
+        # the same key as the perf result of the same configs, so sweeps share their results with each other
+        key = self.cache_key('api/v1/perf', source_path, target_npu_spec, compiler_config)
+        try:
+            result['cached'] = self.restore_cached(key, {'result': result_path})
+            if not result['cached']:
+                Perf.perf_to_file(self.session, source_path, result_path, target_npu_spec, compiler_config,
+                                  api_path='api/v1/perf')
+                self.store_cached(key, {'result': result_path})
+            with open(result_path, 'rb') as result_file:
+                result['metric'], result['latency'] = perfdata.total_latency(result_file.read(), self.args.metric)
+        except Exception as e:
+            result['error'] = getattr(e, 'message', str(e))
+            logging.error('fail to estimate {}: {}'.format(sweep.point_key(point), result['error']))
+        result['elapsed_secs'] = time.perf_counter() - start
+        return result
+
+    def evaluate_all(self, points, evaluate, executor) -> List[Dict]:
+        # Keeps at most --jobs estimations in flight. With --patience, no more points are submitted once that many
+        # results in a row have not improved the best latency; the estimations already in flight still finish.
+        from furiosacli.sweep import point_key
+
+        points = iter([point for point in points if point_key(point) not in self.evaluated])
+        running = set()
+        results = []
+        best = min([result['latency'] for result in self.evaluated.values() if result['latency'] is not None],
+                   default=None)
+        stale = 0
+        stopped = False
+        while True:
+            while not stopped and len(running) < self.args.jobs:
+                point = next(points, None)
+                if point is None:
+                    break
+                running.add(executor.submit(evaluate, point))
+            if not running:
+                return results
+
+            done, running = wait_futures(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                self.evaluated[point_key(result['point'])] = result
+                results.append(result)
+                if result['latency'] is not None and (best is None or result['latency'] < best):
+                    best, stale = result['latency'], 0
+                else:
+                    stale += 1
+            if self.args.patience is not None and stale >= self.args.patience and not stopped:
+                logging.warning('stopping the sweep: {} results in a row did not improve the best latency'
+                                .format(stale))
+                stopped = True
+
+    def greedy(self, grid, evaluate, executor):
+        # Coordinate descent: sweeps one parameter at a time with the others fixed at their best values so far,
+        # which estimates the sum instead of the product of the numbers of values
+        from furiosacli.sweep import point_key
+
+        best_point = {name: values[0] for name, values in grid.items()}
+        for name in sorted(grid):
+            candidates = [{**best_point, name: value} for value in grid[name]]
+            self.evaluate_all(candidates, evaluate, executor)
+            succeeded = [self.evaluated[point_key(point)] for point in candidates
+                         if self.evaluated[point_key(point)]['latency'] is not None]
+            if succeeded:
+                best_point = min(succeeded, key=lambda result: result['latency'])['point']
+
+    def run(self) -> int:
+        from furiosacli import sweep
+
+        if self.args.jobs < 1:
+            raise CliError('--jobs must be at least 1')
+        if self.args.patience is not None and self.args.patience < 1:
+            raise CliError('--patience must be at least 1')
+        if self.args.samples is not None and self.args.samples < 1:
+            raise CliError('--samples must be at least 1')
+
+        start = time.perf_counter()
+        source_path = self.args_map['source']
+        with self.session.metrics.phase('config'):
+            grid = sweep.load_grid(self.args.grid)
+            compiler_config = read_yaml_dict(self.args.config)
+            target_npu_spec = read_yaml_dict(self.args.target_npu_spec)
+        points = sweep.expand_grid(grid)
+
+        with tempfile.TemporaryDirectory() as work_dir, \
+                ThreadPoolExecutor(max_workers=self.args.jobs) as executor:
+            def evaluate(point):
+                return self.evaluate(source_path, compiler_config, target_npu_spec, point, work_dir)
+
+            if self.args.search == 'greedy':
+                self.greedy(grid, evaluate, executor)
+            else:
+                self.evaluate_all(sweep.sample_points(points, self.args.samples, self.args.seed), evaluate, executor)
+
+        results = sweep.rank_results(list(self.evaluated.values()))
+        metric = next((result['metric'] for result in results if result['latency'] is not None),
+                      self.args.metric or 'latency')
+        sweep.write_results(self.args_map['o'], results, sorted(grid), metric)
+        self.print_message(sweep.format_summary(results, sorted(grid), metric, len(points),
+                                                time.perf_counter() - start))
+        self.print_message('{} has been generated'.format(self.args_map['o']))
+        return 0 if any(result['latency'] is not None for result in results) else 1
+
+
+class Optimize(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    @staticmethod
+    def optimize(session, model: ModelSource, model_path: str = None) -> bytes:
+        return dss_request(session, 'optimize', model, model_path, 'optimize').content
+
+    @staticmethod
+    def optimize_to_file(session, model: ModelSource, output_path: str, model_path: str = None) -> int:
+        r = dss_request(session, 'optimize', model, model_path, 'optimize', stream=True)
+        return http.save_response(r, output_path, metrics=session.metrics)
 
     def run(self) -> int:
         source_path = self.args_map['source']
@@ -249,10 +832,13 @@ class Optimize(Command):
         else:
             output_path = 'output.onnx'
 
-        with open(source_path, 'rb') as model, \
-                open(output_path, 'wb') as output_file:
-            model = Optimize.optimize(self.session, model.read(), model_path=source_path)
-            output_file.write(model)
+        key = self.cache_key('dss/optimize', source_path)
+        if self.restore_cached(key, {'model': output_path}):
+            return 0
+
+        Optimize.optimize_to_file(self.session, source_path, output_path)
+        self.store_cached(key, {'model': output_path})
+        return 0
 
 
 class BuildCalibrationModel(Command):
@@ -261,34 +847,19 @@ class BuildCalibrationModel(Command):
 
     @staticmethod
     def build_calibration_model(session,
-                                model: bytes,
+                                model: ModelSource,
                                 model_path: str = None) -> bytes:
-        model_path = model_path or 'model.onnx'
-        multi_parts = MultipartEncoder(
-            fields={
-                'source': (model_path, model, 'application/octet-stream')
-            }
-        )
-
-        request_url = '{}/api/v1/dss/build-calibration-model'.format(session.api_endpoint)
-        headers = {
-            consts.REQUEST_ID_HTTP_HEADER: str(uuid.uuid4()),
-            'Content-Type': multi_parts.content_type,
-            **http.DEFAULT_HEADERS
-        }
-
-        logging.debug("submitting the build calibration model request to {}".format(request_url))
-        logging.debug("source path: {}".format(model_path))
-
-        r = requests.post(request_url,
-                          data=multi_parts,
-                          headers=headers,
-                          auth=ApiKeyAuth(session))
+        return dss_request(session, 'build-calibration-model', model, model_path,
+                           'build calibration model').content
 
-        if r.status_code == 200:
-            return r.content
-        else:
-            raise ApiError('fail to build calibration model {}'.format(model_path), r)
+    @staticmethod
+    def build_calibration_model_to_file(session,
+                                        model: ModelSource,
+                                        output_path: str,
+                                        model_path: str = None) -> int:
+        r = dss_request(session, 'build-calibration-model', model, model_path,
+                        'build calibration model', stream=True)
+        return http.save_response(r, output_path, metrics=session.metrics)
 
     def run(self) -> int:
         source_path = self.args_map['source']
@@ -298,70 +869,240 @@ class BuildCalibrationModel(Command):
         else:
             output_path = 'output.onnx'
 
-        with open(source_path, 'rb') as model, \
-                open(output_path, 'wb') as output_file:
-            model = BuildCalibrationModel.build_calibration_model(self.session,
-                                                                  model.read(),
-                                                                  model_path=source_path)
-            output_file.write(model)
+        key = self.cache_key('dss/build-calibration-model', source_path)
+        if self.restore_cached(key, {'model': output_path}):
+            return 0
+
+        BuildCalibrationModel.build_calibration_model_to_file(self.session, source_path, output_path)
+        self.store_cached(key, {'model': output_path})
+        return 0
 
 
 class Quantize(Command):
     def __init__(self, session, args, args_map):
         super().__init__(session, args, args_map)
 
+    @staticmethod
+    def quantize_request(session,
+                         model: ModelSource,
+                         dynamic_ranges: Dict[str, Tuple[float, float]],
+                         model_path: str = None,
+                         stream: bool = False):
+        logging.debug("dynamic ranges: \n{}\n".format(dynamic_ranges))
+        return dss_request(session, 'quantize', model, model_path, 'quantize the model',
+                           fields={'dynamic_ranges': json.dumps(dynamic_ranges)},
+                           stream=stream)
+
     @staticmethod
     def quantize(session,
-                 model: bytes,
+                 model: ModelSource,
                  dynamic_ranges: Dict[str, Tuple[float, float]],
                  model_path: str = None) -> bytes:
-        model_path = model_path or 'model.onnx'
-        multi_parts = MultipartEncoder(
-            fields={
-                'dynamic_ranges': json.dumps(dynamic_ranges),
-                'source': (model_path, model, 'application/octet-stream')
-            }
-        )
-
-        request_url = '{}/api/v1/dss/quantize'.format(session.api_endpoint)
-        headers = {
-            consts.REQUEST_ID_HTTP_HEADER: str(uuid.uuid4()),
-            'Content-Type': multi_parts.content_type,
-            **http.DEFAULT_HEADERS
-        }
+        return Quantize.quantize_request(session, model, dynamic_ranges, model_path).content
 
-        logging.debug("submitting the quantize request to {}".format(request_url))
-        logging.debug("source path: {}".format(model_path or 'model.onnx'))
-        logging.debug("dynamic ranges: \n{}\n".format(dynamic_ranges))
+    @staticmethod
+    def quantize_to_file(session,
+                         model: ModelSource,
+                         dynamic_ranges: Dict[str, Tuple[float, float]],
+                         output_path: str,
+                         model_path: str = None) -> int:
+        r = Quantize.quantize_request(session, model, dynamic_ranges, model_path, stream=True)
+        return http.save_response(r, output_path, metrics=session.metrics)
 
-        r = requests.post(request_url,
-                          data=multi_parts,
-                          headers=headers,
-                          auth=ApiKeyAuth(session))
+    def run(self) -> int:
+        source_path = self.args_map['source']
+        dynamic_ranges = self.args_map['dynamic_ranges']
 
-        if r.status_code == 200:
-            return r.content
+        if 'o' in self.args and self.args_map['o'] is not None:
+            output_path = self.args_map['o']
         else:
-            raise ApiError('fail to quantize th model {}'.format(model_path), r)
+            output_path = 'output.onnx'
+
+        with self.session.metrics.phase('config'), open(dynamic_ranges, 'r') as dynamic_ranges_file:
+            dynamic_ranges = json.load(dynamic_ranges_file)
+
+        key = self.cache_key('dss/quantize', source_path, json.dumps(dynamic_ranges, sort_keys=True))
+        if self.restore_cached(key, {'model': output_path}):
+            return 0
+
+        Quantize.quantize_to_file(self.session, source_path, dynamic_ranges, output_path)
+        self.store_cached(key, {'model': output_path})
+        return 0
+
+
+class Pipeline(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+        self.timings = []
+
+    def run_stage(self, stage: str, key: str, outputs: Dict[str, str], produce):
+        start = time.perf_counter()
+        cached = self.restore_cached(key, outputs)
+        if not cached:
+            produce()
+            self.store_cached(key, outputs)
+        self.record_timing(stage, time.perf_counter() - start, cached)
+
+    def record_timing(self, stage: str, elapsed: float, cached: bool):
+        self.timings.append((stage, elapsed, cached))
+        self.print_message('[{}] done (elapsed: {:.3f} ms{})'
+                           .format(stage, elapsed * 1000, ', cached' if cached else ''))
 
     def run(self) -> int:
         source_path = self.args_map['source']
-        dynamic_ranges = self.args_map['dynamic_ranges']
+        target_ir = handle_target_ir(self.args_map)
+        if ',' in target_ir:
+            raise CliError('pipeline takes a single target IR')
+        if self.args_map['o'] is not None:
+            output_path = self.args_map['o']
+        else:
+            output_path = 'output.{}'.format(target_ir)
+
+        with self.session.metrics.phase('config'):
+            with open(self.args.dynamic_ranges, 'r') as dynamic_ranges_file:
+                dynamic_ranges = json.load(dynamic_ranges_file)
+            # perfeye takes JSON configs while the compiler takes YAML ones
+            compiler_config = read_yaml_config(self.args.config)
+            target_npu_spec = read_yaml_config(self.args.target_npu_spec)
+            perf_compiler_config = handle_compiler_config(self.args)
+            perf_target_npu_spec = handle_target_npu_spec(self.args)
+
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            work_dir = self.args.work_dir or tmp_dir
+            os.makedirs(work_dir, exist_ok=True)
+            optimized_path = os.path.join(work_dir, 'optimized.onnx')
+            quantized_path = os.path.join(work_dir, 'quantized.onnx')
+
+            self.run_stage('optimize', self.cache_key('dss/optimize', source_path), {'model': optimized_path},
+                           lambda: Optimize.optimize_to_file(self.session, source_path, optimized_path))
+
+            # perfeye and the calibration model only depend on the optimized model,
+            # so they run alongside quantize and compile
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                side_stages = []
+                if self.args.perfeye is not None:
+                    side_stages.append(executor.submit(
+                        self.run_stage, 'perfeye',
+                        self.cache_key('api/v1/perfeye', optimized_path, perf_target_npu_spec, perf_compiler_config),
+                        {'result': self.args.perfeye},
+                        lambda: Perf.perf_to_file(self.session, optimized_path, self.args.perfeye,
+                                                  perf_target_npu_spec, perf_compiler_config)))
+                if self.args.calibration_model is not None:
+                    side_stages.append(executor.submit(
+                        self.run_stage, 'build_calibration_model',
+                        self.cache_key('dss/build-calibration-model', optimized_path),
+                        {'model': self.args.calibration_model},
+                        lambda: BuildCalibrationModel.build_calibration_model_to_file(
+                            self.session, optimized_path, self.args.calibration_model)))
+
+                self.run_stage('quantize',
+                               self.cache_key('dss/quantize', optimized_path,
+                                              json.dumps(dynamic_ranges, sort_keys=True)),
+                               {'model': quantized_path},
+                               lambda: Quantize.quantize_to_file(self.session, optimized_path, dynamic_ranges,
+                                                                 quantized_path))
+
+                compile_start = time.perf_counter()
+                cached = Compile(self.session, self.args, self.args_map).compile(
+                    quantized_path, compiler_config, target_npu_spec, target_ir, output_path,
+                    compiler_report_path=self.args.compiler_report,
+                    mem_alloc_report_path=self.args.mem_alloc_report)
+                self.record_timing('compile', time.perf_counter() - compile_start, cached)
+
+                for stage in side_stages:
+                    stage.result()
+
+        self.print_message('{} has been generated (elapsed: {:.3f} ms)'
+                           .format(output_path, (time.perf_counter() - start) * 1000))
+        for stage, elapsed, cached in self.timings:
+            self.print_message('  {:<24} {:>12.3f} ms{}'.format(stage, elapsed * 1000, ' (cached)' if cached else ''))
+        return 0
+
+
+class Calibrate(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def run(self) -> int:
+        source_path = self.args_map['source']
+        if self.args.batch_size < 1 or self.args.workers < 1:
+            raise CliError('--batch-size and --workers must be at least 1')
+        histogram_bins = self.args.bins if self.args.histograms is not None else 0
+        if self.args.histograms is not None and histogram_bins < 1:
+            raise CliError('--bins must be at least 1')
 
         if 'o' in self.args and self.args_map['o'] is not None:
             output_path = self.args_map['o']
         else:
-            output_path = 'output.onnx'
+            output_path = 'dynamic_ranges.json'
 
-        with open(source_path, 'rb') as model, \
-                open(dynamic_ranges, 'r') as dynamic_ranges, \
-                open(output_path, 'wb') as output_file:
-            dynamic_ranges = json.load(dynamic_ranges)
-            model = Quantize.quantize(self.session,
-                                      model.read(),
-                                      dynamic_ranges,
-                                      model_path=source_path)
-            output_file.write(model)
+        from furiosacli import calibration, ranges
+
+        start = time.perf_counter()
+        dynamic_ranges, histograms, num_samples = calibration.calibrate(source_path, self.args.dataset,
+                                                                        batch_size=self.args.batch_size,
+                                                                        workers=self.args.workers,
+                                                                        histogram_bins=histogram_bins)
+        ranges.write_ranges(output_path, dynamic_ranges)
+        if self.args.histograms is not None:
+            with open(self.args.histograms, 'w') as histograms_file:
+                json.dump(histograms, histograms_file)
+            self.print_message('the histograms have been written to {}'.format(self.args.histograms))
+
+        self.print_message('{} has been generated from {} samples of {} tensors (elapsed: {:.3f} ms)'
+                           .format(output_path, num_samples, len(dynamic_ranges),
+                                   (time.perf_counter() - start) * 1000))
+        return 0
+
+
+class RangesMerge(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def run(self) -> int:
+        from furiosacli import ranges
+
+        if self.args.method == 'percentile' and not 0 < self.args.percentile <= 100:
+            raise CliError('--percentile must be in (0, 100]')
+
+        dynamic_ranges, histograms = ranges.merge_dynamic_ranges(self.args.sources,
+                                                                 method=self.args.method,
+                                                                 percentile=self.args.percentile)
+        ranges.write_ranges(self.args_map['o'], dynamic_ranges)
+        self.print_message('{} has been generated from {} files of {} tensors'
+                           .format(self.args_map['o'], len(self.args.sources), len(dynamic_ranges)))
+
+        if self.args.histograms is not None:
+            with open(self.args.histograms, 'w') as histograms_file:
+                json.dump(histograms, histograms_file)
+            self.print_message('the merged histograms have been written to {}'.format(self.args.histograms))
+        return 0
+
+
+class ReportSummarize(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def run(self) -> int:
+        from furiosacli import reports
+
+        if self.args.top < 1:
+            raise CliError('--top must be at least 1')
+        if self.args.jobs < 1:
+            raise CliError('--jobs must be at least 1')
+
+        paths = reports.resolve_reports(self.args.reports)
+        summaries = reports.summarize_reports(paths, self.args.top, self.args.jobs)
+        totals = reports.aggregate(summaries, self.args.top)
+        if self.args_map['o'] is not None:
+            reports.write_summary(self.args_map['o'], summaries, totals)
+            self.print_message('the summary of {} reports has been written to {}'
+                               .format(len(summaries), self.args_map['o']))
+        else:
+            print(reports.format_summary(summaries, totals))
+        # a report which cannot be parsed fails the command, once the others have been summarized
+        return 1 if totals['errors'] else 0
 
 
 class ToolchainList(Command):
@@ -370,9 +1111,7 @@ class ToolchainList(Command):
 
     def run(self) -> int:
         request_url = '{}/api/v1/compiler'.format(self.session.api_endpoint)
-        r = requests.get(request_url,
-                         headers=http.DEFAULT_HEADERS,
-                         auth=ApiKeyAuth(self.session))
+        r = self.session.http.get(request_url)
 
         if r.status_code == 200:
             content = r.json()
@@ -387,4 +1126,234 @@ class ToolchainList(Command):
             print()
         else:
             print("Client version: {}".format(__version__))
-            raise ApiError('fail to get version', r)
\ No newline at end of file
+            raise ApiError('fail to get version', r)
+
+
+class CacheCommand(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def run(self) -> int:
+        cache = self.session.cache
+
+        if self.args.subcmd == 'stats':
+            stats = cache.stats()
+            print("Cache directory: {}".format(stats['root']))
+            print("Entries: {}".format(stats['entries']))
+            print("Size: {} / {}".format(format_size(stats['size']), format_size(stats['max_size'])))
+            print("Least recently used: {}".format(format_timestamp(stats['oldest'])))
+            print("Most recently used: {}".format(format_timestamp(stats['newest'])))
+        elif self.args.subcmd == 'prune':
+            max_size = parse_size(self.args.max_size) if self.args.max_size is not None else None
+            removed = cache.prune(max_size)
+            self.print_message('{} cached results have been evicted'.format(removed))
+        elif self.args.subcmd == 'clear':
+            removed = cache.clear()
+            self.print_message('{} cached results have been removed'.format(removed))
+        return 0
+
+
+class Jobs(Command):
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def job_task(self, job: Dict) -> 'CompileTask':
+        from furiosacli.tasks import CompileTask, require_compile_tasks_api
+
+        if job.get('endpoint') != self.session.api_endpoint:
+            raise CliError('job {} has been submitted to {}, but the API endpoint is {}'
+                           .format(job['job_id'], job.get('endpoint'), self.session.api_endpoint))
+        require_compile_tasks_api(self.session, 'jobs {}'.format(self.args.subcmd))
+        return CompileTask(self.session, {'task_id': job['job_id'], 'phase': job.get('phase', 'running')})
+
+    def record_status(self, task: 'CompileTask'):
+        self.session.jobs.record(task.task_id,
+                                 phase=task.phase,
+                                 progress=task.progress,
+                                 error_message=task.status.get('error_message'))
+
+    def run(self) -> int:
+        if self.args.subcmd == 'list':
+            return self.list()
+        elif self.args.subcmd == 'status':
+            return self.status()
+        elif self.args.subcmd == 'wait':
+            return self.wait()
+        elif self.args.subcmd == 'fetch':
+            return self.fetch()
+        elif self.args.subcmd == 'prune':
+            removed = self.session.jobs.prune(self.args.keep)
+            self.print_message('{} jobs have been removed from {}'.format(removed, self.session.jobs.path))
+            return 0
+
+    def list(self) -> int:
+        jobs = self.session.jobs.list()
+        if not jobs:
+            self.print_message('no jobs in {}'.format(self.session.jobs.path))
+            return 0
+
+        print('{:<32}  {:<10}  {:<19}  {:<4}  {}'.format('JOB ID', 'STATUS', 'SUBMITTED', 'IR', 'SOURCE'))
+        for job in jobs:
+            print('{:<32}  {:<10}  {:<19}  {:<4}  {}'.format(job['job_id'], job.get('phase', '-'),
+                                                             format_timestamp(job.get('submitted_at')),
+                                                             job.get('target_ir', '-'), job.get('source', '-')))
+        return 0
+
+    def status(self) -> int:
+        job = self.session.jobs.get(self.args.job_id)
+        task = self.job_task(job)
+        task.refresh()
+        self.record_status(task)
+
+        print('Job: {}'.format(task.task_id))
+        print('Source: {}'.format(job.get('source', '-')))
+        print('Target IR: {}'.format(job.get('target_ir', '-')))
+        print('Submitted: {}'.format(format_timestamp(job.get('submitted_at'))))
+        print('Status: {} ({:.0%})'.format(task.phase, task.progress))
+        if task.phase == 'failed':
+            print('Error: {}'.format(task.get_error_message()))
+        return 0
+
+    def wait(self) -> int:
+        tasks = [self.job_task(self.session.jobs.get(job_id)) for job_id in self.args.job_ids]
+
+        def on_finished(task):
+            self.record_status(task)
+            self.print_message('job {} is {}'.format(task.task_id, task.phase))
+            if task.phase == 'failed':
+                logging.error(task.get_error_message())
+
+        for task in tasks:
+            task.refresh()
+        with self.session.metrics.phase('server', tasks=len(tasks)):
+            self.poller().wait(tasks, on_finished=on_finished)
+        return 0 if all(task.is_succeeded() for task in tasks) else 1
+
+    def fetch(self) -> int:
+        job = self.session.jobs.get(self.args.job_id)
+        task = self.job_task(job)
+        task.refresh()
+        self.record_status(task)
+        if task.phase == 'failed':
+            raise CliError('job {} has failed: \n{}'.format(task.task_id, task.get_error_message()))
+        if not task.is_succeeded():
+            raise CliError('job {} is {}, run "furiosa jobs wait {}" first'
+                           .format(task.task_id, task.phase, task.task_id))
+
+        # every artifact is fetched; the report paths default to the ones given at submission, or sit next to the IR
+        target_ir = job.get('target_ir', 'enf')
+        outputs = job.get('outputs', {})
+        if self.args_map['o'] is not None:
+            ir_paths = Compile.ir_paths(target_ir, self.args_map['o'])
+        else:
+            ir_paths = {ir: outputs.get('ir.{}'.format(ir), 'output.{}'.format(ir)) for ir in target_ir.split(',')}
+        stem = os.path.splitext(next(iter(ir_paths.values())))[0]
+        compiler_report_path = (self.args.compiler_report or outputs.get('compiler_report')
+                                or '{}.compiler_report.txt'.format(stem))
+        mem_alloc_report_path = (self.args.mem_alloc_report or outputs.get('mem_alloc_report')
+                                 or '{}.mem_alloc_report.html'.format(stem))
+
+        Compile.write_outputs(task, ir_paths, compiler_report_path, mem_alloc_report_path)
+        if job.get('cache_key') is not None:
+            self.store_cached(job['cache_key'],
+                              Compile.output_map(ir_paths, compiler_report_path, mem_alloc_report_path))
+        self.session.jobs.record(task.task_id, fetched_at=time.time())
+
+        for path in ir_paths.values():
+            self.print_message('{} has been generated'.format(path))
+        self.print_message('the compiler report has been written to {}'.format(compiler_report_path))
+        self.print_message('the memory allocation report has been written to {}'.format(mem_alloc_report_path))
+        return 0
+
+
+class RunBatch(Command):
+    # Runs many commands in this one process, so they share the imports, the configs and the connection pool.
+    # Prints one json line per command (id, args, exit_code, error, output, elapsed_secs) as soon as it finishes.
+    def __init__(self, session, args, args_map):
+        super().__init__(session, args, args_map)
+
+    def run_request(self, parser, stdout, stderr, request_id, argv) -> Tuple[int, str]:
+        from furiosacli.batch import NESTED_COMMANDS, format_result
+        from furiosacli.clidriver import CLIDriver
+
+        start = time.perf_counter()
+        stdout.capture()
+        stderr.capture()
+        exit_code, error = 0, None
+        try:
+            args = parser.parse_args(argv)
+            if args.command in NESTED_COMMANDS:
+                raise CliError('{} cannot run inside a batch'.format(args.command))
+            cli = CLIDriver(args, vars(args), session=self.session)
+            try:
+                exit_code = cli.run()
+            finally:
+                self.session.metrics.merge(cli.session.metrics)
+        except CliError as e:
+            exit_code, error = e.exit_code, e.message
+        except SystemExit as e:
+            # argparse exits on --help and on invalid arguments, printing the reason to stderr
+            exit_code = e.code if isinstance(e.code, int) else 2
+        except Exception as e:
+            exit_code, error = 1, str(e) or type(e).__name__
+        finally:
+            output = stdout.release()
+            errors = stderr.release().strip()
+
+        if error is None and exit_code and errors:
+            error = errors.splitlines()[-1]
+        return exit_code, format_result(request_id, argv, exit_code, error, output, time.perf_counter() - start)
+
+    def run(self) -> int:
+        import sys
+        from furiosacli.argparser import create_argparser
+        from furiosacli.batch import ThreadOutput, format_result, parse_request
+
+        if self.args.jobs < 1:
+            raise CliError('--jobs must be at least 1')
+        if self.args.input == '-':
+            lines = sys.stdin
+        else:
+            try:
+                lines = open(self.args.input, 'r')
+            except OSError as e:
+                raise CliError('fail to read the commands: {}'.format(e))
+
+        parser = create_argparser()
+        results = sys.stdout
+        failed = 0
+
+        def emit(exit_code, result):
+            nonlocal failed
+            failed += 1 if exit_code else 0
+            results.write(result + '\n')
+            results.flush()
+
+        # what a command prints is captured into its result line; output of other threads goes to stderr
+        stdout, stderr = ThreadOutput(sys.stderr), ThreadOutput(sys.stderr)
+        sys.stdout, sys.stderr = stdout, stderr
+        running = set()
+        try:
+            with ThreadPoolExecutor(max_workers=self.args.jobs) as executor:
+                for line_no, line in enumerate(lines, 1):
+                    try:
+                        request = parse_request(line, line_no)
+                    except CliError as e:
+                        emit(e.exit_code, format_result(line_no, [], e.exit_code, e.message, '', 0.0))
+                        continue
+                    if request is None:
+                        continue
+
+                    # at most --jobs commands in flight, so a long input is read as the commands finish
+                    if len(running) >= self.args.jobs:
+                        done, running = wait_futures(running, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            emit(*future.result())
+                    running.add(executor.submit(self.run_request, parser, stdout, stderr, *request))
+                for future in as_completed(running):
+                    emit(*future.result())
+        finally:
+            sys.stdout, sys.stderr = results, stderr.fallback
+            if lines is not sys.stdin:
+                lines.close()
+        return 0 if failed == 0 else 1
@@ -0,0 +1,114 @@
+import importlib.util
+import zlib
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Set
+
+from furiosacli.exceptions import CliError
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+def zstd_available() -> bool:
+    # compressing uploads with zstd needs the optional zstandard package
+    return importlib.util.find_spec('zstandard') is not None
+
+
+def supported_encodings() -> List[str]:
+    # the encodings of uploads, in order of preference
+    return ['zstd', 'gzip'] if zstd_available() else ['gzip']
+
+
+def decodable_encodings() -> List[str]:
+    # The encodings of responses, in order of preference. Responses are decoded by urllib3, which only decodes
+    # zstd with a zstandard version it supports (or none at all), whether or not zstandard can be imported.
+    from urllib3 import response
+
+    return ['zstd', 'gzip'] if getattr(response, 'HAS_ZSTD', False) else ['gzip']
+
+
+def check_compression(compression: str):
+    if compression == 'zstd' and not zstd_available():
+        raise CliError('zstd compression requires the zstandard package (pip install zstandard)')
+
+
+def accept_encoding(compression: str) -> str:
+    # the Accept-Encoding of every request
+    if compression == 'none':
+        return 'identity'
+    if compression == 'gzip':
+        return 'gzip'
+    return ', '.join(decodable_encodings())
+
+
+def parse_accept_encoding(value: str) -> Set[str]:
+    # the content codings of an Accept-Encoding header, but the ones with q=0
+    encodings = set()
+    for item in value.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().lower()
+        if coding and not (quality.startswith('q=') and quality[2:].strip('0.') == ''):
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def upload_encoding(compression: str, accepted: Optional[Set[str]]) -> Optional[str]:
+    # The encoding to compress an upload with, given the encodings the server has advertised (None when it has not
+    # advertised any yet). auto only compresses for a server known to accept it; zstd and gzip do unless the server
+    # has told otherwise.
+    if compression == 'none':
+        return None
+    if compression == 'auto':
+        if accepted is None:
+            return None
+        candidates = supported_encodings()
+    else:
+        candidates = [compression]
+    for encoding in candidates:
+        if accepted is None or encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def compressor(encoding: str):
+    if encoding == 'gzip':
+        return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == 'zstd':
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    raise CliError('unsupported content encoding: {}'.format(encoding))
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str, counter: List[int] = None) -> Iterator[bytes]:
+    # Compresses chunk by chunk, so the data is never held in memory as a whole. counter[0] adds up the
+    # compressed bytes.
+    compress = compressor(encoding)
+    for chunk in chunks:
+        compressed = compress.compress(chunk)
+        if compressed:
+            if counter is not None:
+                counter[0] += len(compressed)
+            yield compressed
+    compressed = compress.flush()
+    if counter is not None:
+        counter[0] += len(compressed)
+    yield compressed
+
+
+def compress_stream(reader: BinaryIO, encoding: str, counter: List[int] = None,
+                    chunk_size: int = COMPRESS_CHUNK_SIZE) -> Iterator[bytes]:
+    # compresses reader while it is being sent
+    return compress_chunks(iter(lambda: reader.read(chunk_size), b''), encoding, counter)
+
+
+def decompressing_reader(raw: BinaryIO, encoding: str) -> BinaryIO:
+    if encoding == 'gzip':
+        import gzip
+
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if encoding == 'zstd':
+        import zstandard
+
+        return zstandard.ZstdDecompressor().stream_reader(raw)
+    raise CliError('unsupported content encoding: {}'.format(encoding))
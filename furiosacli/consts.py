@@ -8,6 +8,23 @@ DEFAULT_API_ENDPOINT=PRODUCTION_API_ENDPOINT
 FURIOSA_API_ENDPOINT_ENV='FURIOSA_API_ENDPOINT'
 FURIOSA_ACCESS_KEY_ID_ENV='FURIOSA_ACCESS_KEY_ID'
 SECRET_ACCESS_KEY_ENV='FURIOSA_SECRET_ACCESS_KEY'
+FURIOSA_HTTP_POOL_SIZE_ENV='FURIOSA_HTTP_POOL_SIZE'
+FURIOSA_HTTP_CONNECT_TIMEOUT_ENV='FURIOSA_HTTP_CONNECT_TIMEOUT'
+FURIOSA_HTTP_READ_TIMEOUT_ENV='FURIOSA_HTTP_READ_TIMEOUT'
+FURIOSA_HTTP_MAX_RETRIES_ENV='FURIOSA_HTTP_MAX_RETRIES'
+FURIOSA_HTTP_RETRY_BACKOFF_ENV='FURIOSA_HTTP_RETRY_BACKOFF'
+FURIOSA_HTTP_RETRY_MAX_BACKOFF_ENV='FURIOSA_HTTP_RETRY_MAX_BACKOFF'
+FURIOSA_CACHE_DIR_ENV='FURIOSA_CACHE_DIR'
+FURIOSA_CACHE_MAX_SIZE_ENV='FURIOSA_CACHE_MAX_SIZE'
+FURIOSA_SERVER_VERSION_TTL_ENV='FURIOSA_SERVER_VERSION_TTL'
+FURIOSA_JOBS_FILE_ENV='FURIOSA_JOBS_FILE'
+FURIOSA_JOBS_MAX_ENV='FURIOSA_JOBS_MAX'
+FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV='FURIOSA_UPLOAD_DEDUP_MIN_SIZE'
+FURIOSA_COMPRESSION_ENV='FURIOSA_COMPRESSION'
+FURIOSA_UPLOAD_CHUNKED_MIN_SIZE_ENV='FURIOSA_UPLOAD_CHUNKED_MIN_SIZE'
+FURIOSA_UPLOAD_PART_SIZE_ENV='FURIOSA_UPLOAD_PART_SIZE'
+FURIOSA_UPLOAD_PARALLEL_PARTS_ENV='FURIOSA_UPLOAD_PARALLEL_PARTS'
+FURIOSA_UPLOADS_DIR_ENV='FURIOSA_UPLOADS_DIR'
 
 # HTTP header keys
 REQUEST_ID_HTTP_HEADER='X-Request-Id'
@@ -17,6 +34,51 @@ FURIOSA_SDK_VERSION_HEADER='X-FuriosaAI-SDK-Version'
 FURIOSA_SDK_VERSION_VALUE='0.2.1'
 ACCESS_KEY_ID_HTTP_HEADER='X-FuriosaAI-Access-Key-ID'
 SECRET_ACCESS_KEY_HTTP_HEADER='X-FuriosaAI-Secret-Access-KEY'
+PART_SHA256_HTTP_HEADER='X-FuriosaAI-Part-SHA256'
+
+# HTTP connection pool
+DEFAULT_HTTP_POOL_SIZE=10
+DEFAULT_HTTP_CONNECT_TIMEOUT=10.0
+DEFAULT_HTTP_READ_TIMEOUT=600.0
+DEFAULT_HTTP_MAX_RETRIES=3
+DEFAULT_HTTP_BACKOFF_FACTOR=0.5
+DEFAULT_HTTP_MAX_BACKOFF=60.0
+HTTP_RETRY_STATUS_CODES=(429, 502, 503, 504)
+
+# Local result cache
+DEFAULT_CACHE_DIR_NAME='.furiosa/cache'
+DEFAULT_CACHE_MAX_SIZE='2G'
+# cache keys include the server's toolchain version (GET /version), fetched again after this many seconds
+DEFAULT_SERVER_VERSION_TTL=300.0
+DEFAULT_JOBS_FILE_NAME='.furiosa/jobs.jsonl'
+# finished jobs beyond the most recent ones are pruned from the ledger
+DEFAULT_JOBS_MAX=1000
+
+# Upload deduplication: HEAD {BLOBS_API_PATH}/sha256:{hex} tells whether the server has a model,
+# and a model request with SOURCE_DIGEST_FIELD but without the source refers to it
+BLOBS_API_PATH='api/v1/blobs'
+SOURCE_DIGEST_FIELD='source_digest'
+DEFAULT_UPLOAD_DEDUP_MIN_SIZE='1M'
+
+# Chunked uploads of large models into the blob store: POST {UPLOADS_API_PATH} starts an upload, PUT {id}/parts/{n}
+# sends a part with its sha256 in PART_SHA256_HTTP_HEADER, GET {id} lists the received parts and POST {id}/complete
+# assembles the blob, which model requests then refer to by its digest
+UPLOADS_API_PATH='api/v1/uploads'
+DEFAULT_UPLOAD_CHUNKED_MIN_SIZE='64M'
+DEFAULT_UPLOAD_PART_SIZE='8M'
+DEFAULT_UPLOAD_PARALLEL_PARTS=4
+DEFAULT_UPLOADS_DIR_NAME='.furiosa/uploads'
+
+# Compressed transport: auto compresses uploads once the server has advertised the encodings it accepts
+# (Accept-Encoding of its responses), and every mode but none asks for compressed downloads
+COMPRESSION_CHOICES=('auto', 'zstd', 'gzip', 'none')
+DEFAULT_COMPRESSION='auto'
+
+# compile tasks: POST to submit, GET {id} for the status, GET {id}/{artifact} for outputs, DELETE {id} to cancel
+COMPILE_TASKS_API_PATH='api/v1/compiler/tasks'
+COMPILE_TASK_ARTIFACTS=('ir', 'compiler-report', 'memory-alloc-report')
+# the phases of a compile task the server is done with
+FINISHED_PHASES={'succeeded', 'failed', 'cancelled'}
 
 
 SUPPORT_TARGET_IRS = {'dfg', 'cdfg', 'ldfg', 'gir', 'lir', 'enf'}
\ No newline at end of file
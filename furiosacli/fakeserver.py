@@ -0,0 +1,711 @@
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from furiosacli import __version__, consts
+from furiosacli.cache import parse_size
+from furiosacli.compression import compress_chunks, decompressing_reader, parse_accept_encoding, supported_encodings
+
+VERSION_BODY = {
+    'version': __version__,
+    'revision': 'fakeserver',
+    'build_time': '1970-01-01T00:00:00Z'
+}
+
+TOOLCHAINS_BODY = [
+    {'version': __version__, 'revision': 'fakeserver', 'build_time': '1970-01-01 00:00:00'},
+    {'version': __version__ + '-next', 'revision': 'fakeserver', 'build_time': '1970-01-02 00:00:00'},
+]
+TOOLCHAIN_VERSIONS = {toolchain['version'] for toolchain in TOOLCHAINS_BODY}
+
+COMPILE_TASKS_PATH = '/' + consts.COMPILE_TASKS_API_PATH
+BLOBS_PATH = '/' + consts.BLOBS_API_PATH
+BLOB_PATH = re.compile(r'/{}/(sha256:[0-9a-f]{{64}})'.format(re.escape(consts.BLOBS_API_PATH)))
+UPLOADS_PATH = '/' + consts.UPLOADS_API_PATH
+UPLOAD_PATH = re.compile(r'{}/([0-9a-f]+)(?:/(complete|parts/(\d+)))?'.format(re.escape(UPLOADS_PATH)))
+COMPILE_TASK_PATH = re.compile(r'{}/([0-9a-f]+)(?:/([a-z-]+))?'.format(re.escape(COMPILE_TASKS_PATH)))
+PAYLOAD_CHUNK_SIZE = 64 * 1024
+PAYLOAD_PADDING = b'\0' * PAYLOAD_CHUNK_SIZE
+# responses smaller than this are never compressed
+MIN_COMPRESS_SIZE = 1024
+FORM_FIELD = re.compile(rb'name="([^"]+)"\r\n\r\n(.*?)\r\n--', re.DOTALL)
+FAKE_OPERATORS = ('Conv', 'Relu', 'Conv', 'Add', 'MaxPool', 'Conv', 'Gemm', 'Softmax')
+
+
+class FakeCompileTask(object):
+    def __init__(self, duration: float, fail: bool):
+        self.task_id = uuid.uuid4().hex
+        self.submitted_at = time.monotonic()
+        self.duration = duration
+        self.fail = fail
+        self.cancelled = False
+
+    @property
+    def progress(self) -> float:
+        if self.duration <= 0:
+            return 1.0
+        return min((time.monotonic() - self.submitted_at) / self.duration, 1.0)
+
+    @property
+    def phase(self) -> str:
+        if self.cancelled:
+            return 'cancelled'
+        if self.progress < 1.0:
+            return 'running'
+        return 'failed' if self.fail else 'succeeded'
+
+    def status(self) -> Dict:
+        return {
+            'task_id': self.task_id,
+            'phase': self.phase,
+            'progress': self.progress,
+            'error_message': 'fake compile failure' if self.phase == 'failed' else None,
+        }
+
+
+def fake_perf_csv(compiler_config: str, target_npu_spec: str, toolchain: str = None) -> bytes:
+    # the same configs (and toolchain) always get the same estimation,
+    # so sweeps and diffs against the fake server are reproducible
+    seed = '{}\0{}'.format(compiler_config, target_npu_spec)
+    if toolchain is not None:
+        seed += '\0' + toolchain
+    rng = random.Random(seed)
+    lines = ['operator,op_type,cycles,latency_us,sram_bytes']
+    for idx, op_type in enumerate(FAKE_OPERATORS):
+        cycles = rng.randint(1000, 100000)
+        lines.append('{}_{},{},{},{:.3f},{}'.format(op_type.lower(), idx, op_type, cycles, cycles / 1000,
+                                                     rng.randint(1, 64) * 4096))
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class FakeUpload(object):
+    # a chunked upload of a blob, whose parts are written into a temporary directory until it completes
+    def __init__(self, digest: str, size: int, part_size: int):
+        self.upload_id = uuid.uuid4().hex
+        self.digest = digest
+        self.size = size
+        self.part_size = part_size
+        self.parts = set()
+        self.tmp_dir = tempfile.TemporaryDirectory(prefix='fakeserver-upload-')
+
+    def part_path(self, index: int) -> str:
+        return os.path.join(self.tmp_dir.name, str(index))
+
+    @property
+    def num_parts(self) -> int:
+        return max((self.size + self.part_size - 1) // self.part_size, 1)
+
+    def part_length(self, index: int) -> int:
+        return min(self.part_size, self.size - index * self.part_size)
+
+    def status(self) -> Dict:
+        return {'upload_id': self.upload_id, 'digest': self.digest, 'size': self.size, 'part_size': self.part_size,
+                'parts': sorted(self.parts)}
+
+
+class RequestBody(io.RawIOBase):
+    # The body of a request as it arrives, Content-Length bytes or in chunked transfer encoding.
+    # Every byte is counted and read at the bandwidth of the server.
+    def __init__(self, handler):
+        super().__init__()
+        self.rfile = handler.rfile
+        self.server = handler.server
+        self.chunked = handler.headers.get('Transfer-Encoding', '').lower() == 'chunked'
+        self.remaining = 0 if self.chunked else int(handler.headers.get('Content-Length', 0))
+        self.finished = not self.chunked
+
+    def readable(self) -> bool:
+        return True
+
+    def next_chunk(self):
+        size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+        if size == 0:
+            # the last chunk is followed by optional trailers and an empty line
+            while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            self.finished = True
+        self.remaining = size
+
+    def readinto(self, buffer) -> int:
+        if self.remaining == 0 and not self.finished:
+            self.next_chunk()
+        if self.remaining == 0:
+            return 0
+        data = self.rfile.read(min(len(buffer), self.remaining, PAYLOAD_CHUNK_SIZE))
+        if not data:
+            self.remaining, self.finished = 0, True
+            return 0
+        self.remaining -= len(data)
+        if self.chunked and self.remaining == 0:
+            self.rfile.readline()
+        self.server.count_received(len(data))
+        self.server.throttle(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which Nagle's algorithm would delay by a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+
+    def log_message(self, format, *args):
+        logging.debug('fakeserver: ' + format, *args)
+
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        # the content codings a request body may be compressed with
+        self.send_header('Accept-Encoding', ', '.join(self.server.encodings) or 'identity')
+
+    def do_GET(self):
+        if self.reject():
+            return
+        url = urlsplit(self.path)
+        task_path = COMPILE_TASK_PATH.fullmatch(url.path)
+        upload_path = UPLOAD_PATH.fullmatch(url.path)
+        if url.path == '/version':
+            self.send_json(self.server.version_body)
+        elif url.path == '/api/v1/compiler':
+            self.send_json(TOOLCHAINS_BODY)
+        elif url.path == COMPILE_TASKS_PATH and self.server.compile_tasks_api:
+            # servers with the compile task api list their tasks, which clients probe the api with
+            self.send_json(self.server.list_compile_tasks())
+        elif task_path is not None and self.server.compile_tasks_api:
+            target_ir = parse_qs(url.query).get('target_ir', [None])[0]
+            self.get_compile_task(*task_path.groups(), target_ir=target_ir)
+        elif upload_path is not None and upload_path.group(2) is None:
+            upload = self.server.upload(upload_path.group(1))
+            if upload is None:
+                self.send_error_json(404, 'NOT_FOUND', 'unknown upload {}'.format(self.path))
+            else:
+                self.send_json(upload.status())
+        else:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown path {}'.format(self.path))
+
+    def do_HEAD(self):
+        if self.reject():
+            return
+        blob_path = BLOB_PATH.fullmatch(self.path)
+        if not self.server.blobs_api:
+            status = 404
+        elif self.path == BLOBS_PATH:
+            # servers with the blob api answer on its root, which clients probe the api with
+            status = 200
+        else:
+            status = 200 if blob_path is not None and self.server.has_blob(blob_path.group(1)) else 404
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        head = self.drain_body()
+        if self.reject() or not self.accept_body() or not self.resolve_source(head):
+            return
+        upload_path = UPLOAD_PATH.fullmatch(self.path)
+        if self.path == '/api/v1/perf':
+            fields = self.form_fields(head)
+            toolchain = fields.get('toolchain')
+            if toolchain is not None and toolchain not in TOOLCHAIN_VERSIONS:
+                self.send_error_json(400, 'UNKNOWN_TOOLCHAIN', 'unknown toolchain {}'.format(toolchain))
+                return
+            self.send_payload(fake_perf_csv(fields.get('compiler_config', '{}'), fields.get('target_npu_spec', '{}'),
+                                            toolchain))
+        elif self.path == '/api/v1/perfeye' or self.path.startswith('/api/v1/dss/'):
+            self.send_payload(b'fake result of ' + self.path.encode())
+        elif self.path == COMPILE_TASKS_PATH and self.server.compile_tasks_api:
+            self.send_json(self.server.submit_compile_task().status())
+        elif self.path == UPLOADS_PATH and self.server.chunked_uploads:
+            self.start_upload(head)
+        elif upload_path is not None and upload_path.group(2) == 'complete':
+            self.complete_upload(upload_path.group(1))
+        else:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown path {}'.format(self.path))
+
+    def do_PUT(self):
+        upload_path = UPLOAD_PATH.fullmatch(self.path)
+        if upload_path is None or upload_path.group(3) is None:
+            self.drain_body()
+            self.send_error_json(404, 'NOT_FOUND', 'unknown path {}'.format(self.path))
+            return
+        self.put_part(upload_path.group(1), int(upload_path.group(3)))
+
+    def start_upload(self, body: bytes):
+        try:
+            request = json.loads(body)
+            upload = FakeUpload(request['digest'], int(request['size']),
+                                self.server.part_size or int(request['part_size']))
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error_json(400, 'INVALID_REQUEST', 'invalid upload request: {}'.format(e))
+            return
+        self.server.add_upload(upload)
+        self.send_json(upload.status())
+
+    def put_part(self, upload_id: str, index: int):
+        # the part is streamed into its file while its sha256 is computed
+        upload = self.server.upload(upload_id)
+        tmp_path = None
+        checksum = hashlib.sha256()
+        received = 0
+        body = RequestBody(self)
+        if upload is not None and index < upload.num_parts:
+            tmp_path = '{}.{}.part'.format(upload.part_path(index), uuid.uuid4().hex)
+            corrupt = self.server.corrupt_part()
+            with open(tmp_path, 'wb') as part_file:
+                for chunk in iter(lambda: body.read(PAYLOAD_CHUNK_SIZE), b''):
+                    if corrupt:
+                        chunk, corrupt = bytes([chunk[0] ^ 0xff]) + chunk[1:], False
+                    checksum.update(chunk)
+                    part_file.write(chunk)
+                    received += len(chunk)
+        else:
+            while body.read(PAYLOAD_CHUNK_SIZE):
+                pass
+
+        try:
+            if self.reject():
+                return
+            if upload is None:
+                self.send_error_json(404, 'NOT_FOUND', 'unknown upload {}'.format(upload_id))
+            elif self.server.fail_part(index):
+                self.send_error_json(503, 'SERVICE_UNAVAILABLE', 'injected failure of the part {}'.format(index))
+            elif tmp_path is None or received != upload.part_length(index):
+                self.send_error_json(400, 'INVALID_PART', 'part {} has {} bytes'.format(index, received))
+            elif checksum.hexdigest() != self.headers.get(consts.PART_SHA256_HTTP_HEADER):
+                self.send_error_json(400, 'CHECKSUM_MISMATCH', 'the sha256 of the part {} does not match'.format(index))
+            else:
+                os.replace(tmp_path, upload.part_path(index))
+                upload.parts.add(index)
+                self.send_json({'upload_id': upload_id, 'part': index})
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def complete_upload(self, upload_id: str):
+        upload = self.server.upload(upload_id)
+        if upload is None:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown upload {}'.format(upload_id))
+            return
+        missing = [index for index in range(upload.num_parts) if index not in upload.parts]
+        if missing:
+            self.send_error_json(409, 'MISSING_PARTS', 'parts {} have not been uploaded'.format(missing))
+            return
+        digest = hashlib.sha256()
+        for index in range(upload.num_parts):
+            with open(upload.part_path(index), 'rb') as part_file:
+                for chunk in iter(lambda: part_file.read(PAYLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        self.server.remove_upload(upload_id)
+        if 'sha256:{}'.format(digest.hexdigest()) != upload.digest:
+            self.send_error_json(400, 'DIGEST_MISMATCH', 'the sha256 of the blob does not match')
+            return
+        self.server.add_blob(upload.digest)
+        self.send_json({'digest': upload.digest})
+
+    def do_DELETE(self):
+        if self.reject():
+            return
+        task_path = COMPILE_TASK_PATH.fullmatch(self.path)
+        task = self.server.compile_task(task_path.group(1)) \
+            if task_path and not task_path.group(2) and self.server.compile_tasks_api else None
+        if task is None:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown path {}'.format(self.path))
+            return
+        if task.phase == 'running':
+            task.cancelled = True
+        self.send_json(task.status())
+
+    def get_compile_task(self, task_id: str, artifact: Optional[str], target_ir: str = None):
+        task = self.server.compile_task(task_id)
+        if task is None:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown compile task {}'.format(task_id))
+        elif artifact is None:
+            self.send_json(task.status())
+        elif artifact not in consts.COMPILE_TASK_ARTIFACTS:
+            self.send_error_json(404, 'NOT_FOUND', 'unknown artifact {}'.format(artifact))
+        elif task.phase != 'succeeded':
+            self.send_error_json(409, 'TASK_NOT_SUCCEEDED', 'compile task {} is {}'.format(task_id, task.phase))
+        else:
+            body = 'fake {} of {}'.format(artifact, task_id)
+            if target_ir is not None:
+                body += ' ({})'.format(target_ir)
+            self.send_payload(body.encode())
+
+    def resolve_source(self, head: bytes) -> bool:
+        # A model request without the source refers to a model uploaded before by its digest. An uploaded model
+        # is stored by the digest the client sent along (a real server would verify it).
+        if not self.headers.get('Content-Type', '').startswith('multipart/form-data'):
+            return True
+        digest = self.form_fields(head).get(consts.SOURCE_DIGEST_FIELD)
+        self.server.source_digests.append(digest)
+        if not self.server.blobs_api:
+            # a server without the blob api ignores the digest, and needs the source
+            if b'name="source"' not in head:
+                self.send_error_json(400, 'MISSING_SOURCE', 'no source in {}'.format(self.path))
+                return False
+            return True
+        if digest is None:
+            return True
+        if b'name="source"' in head:
+            self.server.add_blob(digest)
+        elif not self.server.has_blob(digest):
+            self.send_error_json(404, 'BLOB_NOT_FOUND', 'unknown model {}'.format(digest))
+            return False
+        return True
+
+    def accept_body(self) -> bool:
+        if self.refused_encoding is not None:
+            self.send_error_json(415, 'UNSUPPORTED_CONTENT_ENCODING',
+                                 'unsupported content encoding {}'.format(self.refused_encoding))
+            return False
+        if self.body_error is not None:
+            self.send_error_json(400, 'INVALID_BODY', 'fail to decode the request body: {}'.format(self.body_error))
+            return False
+        return True
+
+    def reject(self) -> bool:
+        # simulates the server latency, and a failed request at the configured failure rate
+        self.server.record_request_id(self.headers.get(consts.REQUEST_ID_HTTP_HEADER))
+        self.server.simulate_latency()
+        if self.server.should_fail():
+            body = json.dumps({'error_code': 'SERVICE_UNAVAILABLE', 'message': 'injected failure'}).encode()
+            self.send_response(503)
+            if self.server.retry_after is not None:
+                self.send_header('Retry-After', str(self.server.retry_after))
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return True
+        return False
+
+    def drain_body(self) -> bytes:
+        # reads (and decompresses) the whole body, but only keeps its beginning, where the form fields precede
+        # the model
+        body = RequestBody(self)
+        encoding = self.headers.get('Content-Encoding', 'identity').lower()
+        self.refused_encoding = None
+        self.body_error = None
+        if encoding == 'identity':
+            reader = body
+        elif encoding in self.server.encodings:
+            reader = decompressing_reader(io.BufferedReader(body, PAYLOAD_CHUNK_SIZE), encoding)
+        else:
+            # drained as it is, to keep the connection usable
+            self.refused_encoding = encoding
+            reader = body
+
+        head = b''
+        try:
+            for chunk in iter(lambda: reader.read(PAYLOAD_CHUNK_SIZE), b''):
+                if len(head) < PAYLOAD_CHUNK_SIZE:
+                    head += chunk
+        except Exception as e:
+            self.body_error = str(e) or type(e).__name__
+            while body.read(PAYLOAD_CHUNK_SIZE):
+                pass
+        return head
+
+    @staticmethod
+    def form_fields(head: bytes) -> Dict[str, str]:
+        return {name.decode(): value.decode(errors='replace') for name, value in FORM_FIELD.findall(head)}
+
+    def response_encoding(self, size: int) -> Optional[str]:
+        # the first content coding of the server the client accepts, for a body worth compressing
+        if size < MIN_COMPRESS_SIZE:
+            return None
+        accepted = parse_accept_encoding(self.headers.get('Accept-Encoding', ''))
+        return next((encoding for encoding in self.server.encodings if encoding in accepted), None)
+
+    def send_chunks(self, chunks, size: int, content_type: str, status: int = 200):
+        encoding = self.response_encoding(size)
+        if encoding is not None:
+            chunks = list(compress_chunks(chunks, encoding))
+            size = sum(len(chunk) for chunk in chunks)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            self.server.throttle(len(chunk))
+
+    def send_bytes(self, body: bytes, content_type: str, status: int = 200):
+        self.send_chunks([body], len(body), content_type, status)
+
+    def send_payload(self, body: bytes):
+        # sends `body`, or payload_size bytes starting with it when the server has a payload size
+        size = self.server.payload_size
+        if size is None:
+            self.send_bytes(body, 'application/octet-stream')
+            return
+
+        def payload_chunks():
+            remaining = size
+            chunk = body[:PAYLOAD_CHUNK_SIZE].ljust(PAYLOAD_CHUNK_SIZE, b'\0')
+            while remaining > 0:
+                yield chunk[:remaining]
+                remaining -= min(remaining, PAYLOAD_CHUNK_SIZE)
+                chunk = PAYLOAD_PADDING
+
+        self.send_chunks(payload_chunks(), size, 'application/octet-stream')
+
+    def send_json(self, obj, status: int = 200):
+        self.send_bytes(json.dumps(obj).encode(), 'application/json', status)
+
+    def send_error_json(self, status: int, error_code: str, message: str):
+        self.send_json({'error_code': error_code, 'message': message}, status)
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    # A stand-in for the API server: every response is delayed by latency (+ up to jitter) seconds,
+    # a failure_rate fraction of the requests (and the first fail_first requests) fails with 503, with Retry-After
+    # when retry_after is set, perf and DSS results (and compile artifacts) are payload_size bytes long,
+    # and compile tasks run for compile_time seconds, failing at task_failure_rate. Request bodies may be compressed
+    # in `encodings` (all the supported ones by default), which are also used for the responses, and every
+    # connection reads and writes at most `bandwidth` bytes per second. Chunked uploads use the part size the client
+    # asks for (or `part_size`) unless `chunked_uploads` is off; the parts in `failing_parts` are answered with 503,
+    # and the first `corrupt_parts` parts are corrupted on arrival.
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 failure_rate: float = 0.0,
+                 payload_size: int = None,
+                 compile_time: float = 0.0,
+                 task_failure_rate: float = 0.0,
+                 seed: int = None,
+                 fail_first: int = 0,
+                 retry_after: int = None,
+                 encodings=None,
+                 bandwidth: int = None,
+                 part_size: int = None,
+                 failing_parts=(),
+                 corrupt_parts: int = 0,
+                 chunked_uploads: bool = True,
+                 compile_tasks_api: bool = True,
+                 blobs_api: bool = True):
+        super().__init__((host, port), FakeApiHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.payload_size = payload_size
+        self.compile_time = compile_time
+        self.task_failure_rate = task_failure_rate
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.encodings = list(supported_encodings() if encodings is None else encodings)
+        self.bandwidth = bandwidth
+        self.part_size = part_size
+        self.failing_parts = set(failing_parts)
+        self.corrupt_parts = corrupt_parts
+        self.chunked_uploads = chunked_uploads
+        self.compile_tasks_api = compile_tasks_api
+        self.blobs_api = blobs_api
+        self.version_body = dict(VERSION_BODY)
+        self.uploads = {}
+        # the X-Request-Id of every request, in arrival order
+        self.request_ids = []
+        # digests of the uploaded models, the source_digest of every model request (None without one),
+        # and the bytes of every request body
+        self.blobs = set()
+        self.source_digests = []
+        self.received_bytes = 0
+        self.connections = 0
+        self.compile_tasks = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def simulate_latency(self):
+        delay = self.latency
+        if self.jitter > 0:
+            with self._lock:
+                delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttle(self, num_bytes: int):
+        if self.bandwidth:
+            time.sleep(num_bytes / self.bandwidth)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return True
+            return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    def add_blob(self, digest: str):
+        with self._lock:
+            self.blobs.add(digest)
+
+    def has_blob(self, digest: str) -> bool:
+        with self._lock:
+            return digest in self.blobs
+
+    def add_upload(self, upload: FakeUpload):
+        with self._lock:
+            self.uploads[upload.upload_id] = upload
+
+    def upload(self, upload_id: str) -> Optional[FakeUpload]:
+        with self._lock:
+            return self.uploads.get(upload_id)
+
+    def remove_upload(self, upload_id: str):
+        with self._lock:
+            upload = self.uploads.pop(upload_id, None)
+        if upload is not None:
+            upload.tmp_dir.cleanup()
+
+    def fail_part(self, index: int) -> bool:
+        with self._lock:
+            return index in self.failing_parts
+
+    def corrupt_part(self) -> bool:
+        with self._lock:
+            if self.corrupt_parts > 0:
+                self.corrupt_parts -= 1
+                return True
+            return False
+
+    def count_received(self, num_bytes: int):
+        with self._lock:
+            self.received_bytes += num_bytes
+
+    def record_request_id(self, request_id: Optional[str]):
+        with self._lock:
+            self.request_ids.append(request_id)
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def submit_compile_task(self) -> FakeCompileTask:
+        with self._lock:
+            fail = self.task_failure_rate > 0 and self._random.random() < self.task_failure_rate
+            task = FakeCompileTask(self.compile_time, fail)
+            self.compile_tasks[task.task_id] = task
+        return task
+
+    def list_compile_tasks(self) -> List[Dict]:
+        with self._lock:
+            return [task.status() for task in self.compile_tasks.values()]
+
+    def compile_task(self, task_id: str) -> Optional[FakeCompileTask]:
+        with self._lock:
+            return self.compile_tasks.get(task_id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        for upload_id in list(self.uploads):
+            self.remove_upload(upload_id)
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m furiosacli.fakeserver',
+                                     description='Run a local stand-in of the Furiosa API server')
+    parser.add_argument('port', type=int, nargs='?', default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to delay every response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Seconds of uniformly random delay added on top of --latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of the requests answered with 503 (0.0 - 1.0)')
+    parser.add_argument('--payload-size', type=parse_size, default=None,
+                        help='Size of the perf, DSS and compile results (e.g. 512K, 10M)')
+    parser.add_argument('--compile-time', type=float, default=0.0, help='Seconds every compile task runs')
+    parser.add_argument('--task-failure-rate', type=float, default=0.0,
+                        help='Fraction of the compile tasks which fail (0.0 - 1.0)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the injected jitter and failures')
+    parser.add_argument('--fail-first', type=int, default=0, help='Number of the first requests answered with 503')
+    parser.add_argument('--retry-after', type=int, default=None,
+                        help='Retry-After seconds sent with the injected 503 responses')
+    parser.add_argument('--encodings', type=str, default=None,
+                        help='Comma-separated content codings accepted for request bodies and used for responses '
+                             '(default: zstd,gzip or gzip without zstandard; identity to disable compression)')
+    parser.add_argument('--bandwidth', type=parse_size, default=None,
+                        help='Bytes per second every connection reads and writes at most (e.g. 1M)')
+    parser.add_argument('--part-size', type=parse_size, default=None,
+                        help='Part size of the chunked uploads (default: the one the client asks for)')
+    parser.add_argument('--failing-parts', type=str, default='',
+                        help='Comma-separated numbers of the upload parts always answered with 503')
+    parser.add_argument('--corrupt-parts', type=int, default=0,
+                        help='Number of the first upload parts corrupted on arrival')
+    parser.add_argument('--no-chunked-uploads', action='store_true',
+                        help='Answer 404 to chunked uploads, as a server without them')
+    parser.add_argument('--no-compile-tasks-api', action='store_true',
+                        help='Answer 404 to the compile task api, as a server only furiosa.client compiles with')
+    parser.add_argument('--no-blobs-api', action='store_true',
+                        help='Answer 404 to the blob api and ignore source_digest, as a server without deduplication')
+    args = parser.parse_args()
+    encodings = None if args.encodings is None else \
+        [encoding.strip() for encoding in args.encodings.split(',') if encoding.strip() not in ('', 'identity')]
+
+    server = FakeApiServer(args.host, args.port,
+                           latency=args.latency,
+                           jitter=args.jitter,
+                           failure_rate=args.failure_rate,
+                           payload_size=args.payload_size,
+                           compile_time=args.compile_time,
+                           task_failure_rate=args.task_failure_rate,
+                           seed=args.seed,
+                           fail_first=args.fail_first,
+                           retry_after=args.retry_after,
+                           encodings=encodings,
+                           bandwidth=args.bandwidth,
+                           part_size=args.part_size,
+                           failing_parts=[int(part) for part in args.failing_parts.split(',') if part.strip()],
+                           corrupt_parts=args.corrupt_parts,
+                           chunked_uploads=not args.no_chunked_uploads,
+                           compile_tasks_api=not args.no_compile_tasks_api,
+                           blobs_api=not args.no_blobs_api)
+    print('fake API server is listening on {}'.format(server.endpoint))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,24 @@
+import email.utils
+import hashlib
+import logging
+import mmap
+import os
+import random
 import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Dict, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
 from furiosacli import consts, __version__
+from furiosacli.compression import accept_encoding, compress_stream, parse_accept_encoding, upload_encoding
+from furiosacli.exceptions import ApiError, CliError
 
 DEFAULT_HEADERS = {
     'User-Agent': 'FuriosaCli %s (Python %s.%s.%s)' % (__version__,
@@ -7,4 +26,469 @@ DEFAULT_HEADERS = {
                                                     sys.version_info.micro),
     consts.FURIOSA_API_VERSION_HEADER: consts.FURIOSA_API_VERSION_VALUE,  # version 2
     consts.FURIOSA_SDK_VERSION_HEADER: consts.FURIOSA_SDK_VERSION_VALUE
-}
\ No newline at end of file
+}
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# A model to upload: a file path, a binary file object or a bytes-like object (bytes, memoryview, mmap)
+ModelSource = Union[str, os.PathLike, BinaryIO, bytes, bytearray, memoryview, mmap.mmap]
+
+
+class ApiKeyAuth(requests.auth.AuthBase):
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self, r):
+        r.headers[consts.ACCESS_KEY_ID_HTTP_HEADER] = self.session.access_key_id
+        r.headers[consts.SECRET_ACCESS_KEY_HTTP_HEADER] = self.session.secret_key_access
+        return r
+
+
+class AdapterRetry(Retry):
+    # The retries of the adapter, which leaves the connection failures of the requests sent by RetryPolicy.send()
+    # to send(): both retrying them would make up to (max_retries + 1)^2 attempts of an upload.
+    policy = None
+
+    def new(self, **kw) -> 'AdapterRetry':
+        retry = super().new(**kw)
+        retry.policy = self.policy
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None) -> Retry:
+        if error is not None and self._is_connection_error(error) \
+                and self.policy is not None and self.policy.sending():
+            raise MaxRetryError(_pool, url, error) from error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class RetryPolicy(object):
+    # The retries shared by every request of a session. Idempotent requests are retried inside the adapter
+    # (urllib3_retry), and uploads by send(), which rebuilds the body for each attempt. Both keep the X-Request-Id
+    # of the first attempt, so the server can deduplicate a retried request. A retry waits for Retry-After when the
+    # server sends one, and backoff_factor * 2^(retry - 1) plus up to backoff_factor of jitter (at most max_backoff)
+    # otherwise.
+    def __init__(self,
+                 max_retries: int = consts.DEFAULT_HTTP_MAX_RETRIES,
+                 backoff_factor: float = consts.DEFAULT_HTTP_BACKOFF_FACTOR,
+                 max_backoff: float = consts.DEFAULT_HTTP_MAX_BACKOFF,
+                 status_codes=consts.HTTP_RETRY_STATUS_CODES):
+        if max_retries < 0 or backoff_factor < 0 or max_backoff < 0:
+            raise CliError('the max retries and the retry backoff must not be negative')
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        # set while send() sends an attempt in this thread
+        self.local = threading.local()
+        self.status_codes = status_codes
+
+    def urllib3_retry(self) -> Retry:
+        # Connection failures are retried for every method because no byte of the body has been sent yet, except
+        # in send(), which retries them itself. Read and status failures are only retried for idempotent methods;
+        # uploads cannot be rewound here.
+        retry = AdapterRetry(total=self.max_retries,
+                             connect=self.max_retries,
+                             read=self.max_retries,
+                             status=self.max_retries,
+                             backoff_factor=self.backoff_factor,
+                             backoff_jitter=self.backoff_factor,
+                             backoff_max=self.max_backoff,
+                             status_forcelist=self.status_codes,
+                             allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS', 'DELETE']),
+                             respect_retry_after_header=True,
+                             raise_on_status=False)
+        retry.policy = self
+        return retry
+
+    def sending(self) -> bool:
+        return getattr(self.local, 'sending', False)
+
+    def backoff(self, retry: int, response: requests.Response = None) -> float:
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return retry_after
+        return min(self.backoff_factor * 2 ** (retry - 1) + random.uniform(0, self.backoff_factor), self.max_backoff)
+
+    def send(self,
+             send_once: Callable[[int], requests.Response],
+             method: str,
+             url: str,
+             request_id: str,
+             rewindable: bool = True,
+             metrics=None) -> requests.Response:
+        # send_once(retry) sends the request once; a failed attempt is retried while retries are left
+        max_retries = self.max_retries if rewindable else 0
+        retry = 0
+        while True:
+            self.local.sending = True
+            try:
+                r = send_once(retry)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry >= max_retries:
+                    raise
+                r, reason = None, type(e).__name__
+            else:
+                if r.status_code not in self.status_codes or retry >= max_retries:
+                    return r
+                reason = str(r.status_code)
+            finally:
+                self.local.sending = False
+
+            retry += 1
+            delay = self.backoff(retry, r)
+            if r is not None:
+                r.close()
+            logging.warning('retrying {} {} in {:.1f} s after {} (retry {} of {}, request id: {})'
+                            .format(method, url, delay, reason, retry, max_retries, request_id))
+            if metrics is not None:
+                metrics.add_retry(method, url, request_id, reason, delay)
+            time.sleep(delay)
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    # Retry-After is either seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+# requests.Session has no default timeout, so the adapter applies one to every request.
+# It also tags every request with an X-Request-Id to correlate it with the server logs.
+class TimeoutHTTPAdapter(HTTPAdapter):
+    def __init__(self, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        if consts.REQUEST_ID_HTTP_HEADER not in request.headers:
+            request.headers[consts.REQUEST_ID_HTTP_HEADER] = str(uuid.uuid4())
+        return super().send(request, **kwargs)
+
+
+def create_http_session(session,
+                        pool_size: int = consts.DEFAULT_HTTP_POOL_SIZE,
+                        connect_timeout: float = consts.DEFAULT_HTTP_CONNECT_TIMEOUT,
+                        read_timeout: float = consts.DEFAULT_HTTP_READ_TIMEOUT,
+                        max_retries: int = consts.DEFAULT_HTTP_MAX_RETRIES,
+                        backoff_factor: float = consts.DEFAULT_HTTP_BACKOFF_FACTOR,
+                        max_backoff: float = consts.DEFAULT_HTTP_MAX_BACKOFF) -> requests.Session:
+    retry_policy = RetryPolicy(max_retries, backoff_factor, max_backoff)
+    adapter = TimeoutHTTPAdapter(timeout=(connect_timeout, read_timeout),
+                                 pool_connections=pool_size,
+                                 pool_maxsize=pool_size,
+                                 max_retries=retry_policy.urllib3_retry())
+
+    http_session = requests.Session()
+    http_session.mount('http://', adapter)
+    http_session.mount('https://', adapter)
+    http_session.headers.update(DEFAULT_HEADERS)
+    http_session.headers['Accept-Encoding'] = accept_encoding(getattr(session, 'compression',
+                                                                      consts.DEFAULT_COMPRESSION))
+    http_session.auth = ApiKeyAuth(session)
+    # post_model retries uploads by the same policy
+    http_session.retry_policy = retry_policy
+    # the content codings the server accepts for request bodies, once one of its responses has told
+    http_session.accepted_encodings = None
+
+    def record_encodings(response, *args, **kwargs):
+        if 'Accept-Encoding' in response.headers:
+            http_session.accepted_encodings = parse_accept_encoding(response.headers['Accept-Encoding'])
+
+    http_session.hooks['response'].append(record_encodings)
+
+    metrics = getattr(session, 'metrics', None)
+    if metrics is not None:
+        def record_request(response, *args, **kwargs):
+            request = response.request
+            request_id = request.headers.get(consts.REQUEST_ID_HTTP_HEADER)
+            # the retries urllib3 made before this response
+            retries = getattr(getattr(response, 'raw', None), 'retries', None)
+            for attempt in (retries.history if retries is not None else ()):
+                metrics.add_retry(request.method, request.url, request_id,
+                                  str(attempt.status) if attempt.status is not None else type(attempt.error).__name__)
+            metrics.add_request(request.method, request.url, response.status_code, request_id,
+                                response.elapsed.total_seconds(),
+                                int(request.headers.get('Content-Length', 0)))
+
+        http_session.hooks['response'].append(record_request)
+    return http_session
+
+
+def save_response(response: requests.Response,
+                  output_path: str,
+                  chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                  metrics=None) -> int:
+    # Writes the body chunk by chunk into a temporary file next to output_path and renames it on success,
+    # so memory use stays flat and output_path never holds a partially downloaded artifact.
+    start = time.perf_counter()
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    tmp_path = os.path.join(output_dir, '.{}.{}.part'.format(os.path.basename(output_path), uuid.uuid4().hex))
+    written = 0
+    try:
+        with open(tmp_path, 'xb') as tmp_file:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                tmp_file.write(chunk)
+                written += len(chunk)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        response.close()
+        if metrics is not None:
+            metrics.add_phase('download', time.perf_counter() - start, written, path=output_path,
+                              **encoding_labels(response))
+    return written
+
+
+def encoding_labels(response: requests.Response) -> Dict:
+    # the content coding and the bytes on the wire of a compressed response body
+    encoding = response.headers.get('Content-Encoding', 'identity')
+    raw = getattr(response, 'raw', None)
+    if encoding == 'identity' or not hasattr(raw, 'tell'):
+        return {}
+    return {'encoding': encoding, 'wire_bytes': raw.tell()}
+
+
+class BufferReader(object):
+    # A file-like reader over a bytes-like object. Each read() copies only the requested slice,
+    # so MultipartEncoder streams the buffer without a second full copy in memory.
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.pos = 0
+
+    def __len__(self):
+        # requests_toolbelt expects the number of bytes left to read
+        return len(self.view) - self.pos
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else min(self.pos + size, len(self.view))
+        chunk = self.view[self.pos:end].tobytes()
+        self.pos = end
+        return chunk
+
+
+def model_name(model: ModelSource, default: str = 'model.onnx') -> str:
+    if isinstance(model, (str, os.PathLike)):
+        return os.fspath(model)
+    return getattr(model, 'name', None) or default
+
+
+@contextmanager
+def open_model(model: ModelSource):
+    if isinstance(model, (str, os.PathLike)):
+        with open(model, 'rb') as model_file:
+            yield model_file
+    elif isinstance(model, (bytes, bytearray, memoryview, mmap.mmap)):
+        yield BufferReader(model)
+    elif hasattr(model, 'read'):
+        yield model
+    else:
+        raise CliError('model must be a path, a binary file object or a bytes-like object, but got {}'
+                       .format(type(model).__name__))
+
+
+def model_size(model: ModelSource) -> Optional[int]:
+    if isinstance(model, (str, os.PathLike)):
+        return os.path.getsize(model)
+    if isinstance(model, (bytes, bytearray, memoryview, mmap.mmap)):
+        return memoryview(model).nbytes
+    if hasattr(model, 'seek') and hasattr(model, 'tell'):
+        position = model.tell()
+        size = model.seek(0, os.SEEK_END) - position
+        model.seek(position)
+        return size
+    return None
+
+
+def model_digest(model: ModelSource) -> Optional[str]:
+    # the sha256 of the model, read chunk by chunk; None for a file object that cannot be read twice
+    from furiosacli.cache import HASH_CHUNK_SIZE, file_digest
+
+    if isinstance(model, (str, os.PathLike)):
+        return file_digest(os.fspath(model))
+    if isinstance(model, (bytes, bytearray, memoryview, mmap.mmap)):
+        return hashlib.sha256(memoryview(model).cast('B')).hexdigest()
+    if not (hasattr(model, 'seek') and hasattr(model, 'tell')):
+        return None
+    position = model.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: model.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    model.seek(position)
+    return digest.hexdigest()
+
+
+def blobs_api(session) -> bool:
+    # Whether the server deduplicates models by their digest, which is probed once per session. Without it, every
+    # model is uploaded, without being hashed or checked for.
+    http_session = session.http
+    supported = getattr(http_session, 'blobs_api', None)
+    if supported is None:
+        r = http_session.head('{}/{}'.format(session.api_endpoint, consts.BLOBS_API_PATH))
+        r.close()
+        supported = r.status_code == 200
+        http_session.blobs_api = supported
+        logging.debug('the server {} the blob api'.format('has' if supported else 'does not have'))
+    return supported
+
+
+def has_blob(session, digest: str) -> bool:
+    if digest in session.known_blobs:
+        return True
+    if not blobs_api(session):
+        return False
+    r = session.http.head('{}/{}/sha256:{}'.format(session.api_endpoint, consts.BLOBS_API_PATH, digest))
+    if r.status_code == 200:
+        session.known_blobs.add(digest)
+        return True
+    return False
+
+
+def at_least(size: Optional[int], min_size: Optional[int]) -> bool:
+    return size is not None and min_size is not None and size >= min_size
+
+
+def upload_digest(session, model: ModelSource, size: Optional[int]) -> Optional[str]:
+    # the digest to upload the model by, when it is large enough to be deduplicated or uploaded in parts
+    if not (at_least(size, getattr(session, 'upload_dedup_min_size', None))
+            or at_least(size, getattr(session, 'upload_chunked_min_size', None))):
+        return None
+    # the server refers to the model by its digest only with the blob api, so the digest is not even sent without it
+    if not blobs_api(session):
+        return None
+    metrics = getattr(session, 'metrics', None)
+    start = time.perf_counter()
+    digest = model_digest(model)
+    if metrics is not None and digest is not None:
+        metrics.add_phase('hash', time.perf_counter() - start, size)
+    return digest
+
+
+def post_model(session,
+               api_path: str,
+               model: ModelSource,
+               model_path: str,
+               description: str,
+               fields: Dict[str, str] = None,
+               stream: bool = False):
+    model_path = model_path or model_name(model)
+    request_url = '{}/{}'.format(session.api_endpoint, api_path)
+
+    logging.debug("submitting the {} request to {}".format(description, request_url))
+    logging.debug("source path: {}".format(model_path))
+
+    from requests_toolbelt.multipart.encoder import MultipartEncoder, MultipartEncoderMonitor
+
+    metrics = getattr(session, 'metrics', None)
+    # a file object is read from its current position again on every attempt
+    position = model.tell() if hasattr(model, 'read') and hasattr(model, 'seek') else None
+    size = model_size(model)
+    digest = upload_digest(session, model, size)
+
+    def send_once(request_id: str, retry: int, by_digest: bool = False, encoding: str = None):
+        if retry > 0 and position is not None:
+            model.seek(position)
+        uploaded = []
+        wire_bytes = [0]
+
+        def on_read(monitor):
+            if not uploaded and monitor.bytes_read >= monitor.len:
+                uploaded.append(time.perf_counter())
+
+        with open_model(model) as source:
+            parts = dict(fields or {})
+            if digest is not None:
+                parts[consts.SOURCE_DIGEST_FIELD] = 'sha256:{}'.format(digest)
+            # a model the server already has is referred to by its digest instead of being uploaded again
+            if not by_digest:
+                parts['source'] = (model_path, source, 'application/octet-stream')
+            multi_parts = MultipartEncoder(fields=parts)
+            headers = {
+                consts.REQUEST_ID_HTTP_HEADER: request_id,
+                'Content-Type': multi_parts.content_type
+            }
+            data = MultipartEncoderMonitor(multi_parts, on_read)
+            if encoding is not None:
+                # the body is compressed while it is sent, in chunked transfer encoding
+                headers['Content-Encoding'] = encoding
+                data = compress_stream(data, encoding, wire_bytes)
+
+            start = time.perf_counter()
+            r = session.http.post(request_url,
+                                  data=data,
+                                  headers=headers,
+                                  stream=stream)
+
+        # the upload ends with the last byte of the body, and the server phase with the response headers
+        if metrics is not None:
+            headers_at = start + r.elapsed.total_seconds()
+            uploaded_at = min(uploaded[0] if uploaded else headers_at, headers_at)
+            labels = {'encoding': encoding, 'wire_bytes': wire_bytes[0]} if encoding is not None else {}
+            metrics.add_phase('upload', uploaded_at - start, multi_parts.len, api=api_path, request_id=request_id,
+                              by_digest=by_digest, **labels)
+            metrics.add_phase('server', headers_at - uploaded_at, api=api_path, request_id=request_id)
+            if not stream and r.status_code == 200:
+                metrics.add_phase('download', time.perf_counter() - headers_at, len(r.content),
+                                  api=api_path, request_id=request_id, **encoding_labels(r))
+        return r
+
+    retry_policy = getattr(session.http, 'retry_policy', None) or RetryPolicy(max_retries=0)
+    compression = getattr(session, 'compression', 'none')
+    refused = set()
+
+    def send(by_digest: bool = False, rewindable: bool = True) -> requests.Response:
+        # every attempt carries the same request id, so the server can tell a retry from a new request.
+        # A server refusing a compressed body (415) gets it again in another encoding it accepts, or uncompressed.
+        while True:
+            accepted = getattr(session.http, 'accepted_encodings', None)
+            encoding = upload_encoding(compression, None if accepted is None else accepted - refused)
+            # a request referring to the model by its digest is too small to compress
+            if encoding in refused or by_digest:
+                encoding = None
+            request_id = str(uuid.uuid4())
+            r = retry_policy.send(lambda retry: send_once(request_id, retry, by_digest, encoding), 'POST',
+                                  request_url, request_id, rewindable=rewindable, metrics=metrics)
+            if r.status_code != 415 or encoding is None:
+                return r
+            if not rewindable:
+                raise ApiError('fail to {} {} in {}'.format(description, model_path, encoding), r)
+            logging.debug('the server does not accept {} request bodies, sending it again'.format(encoding))
+            refused.add(encoding)
+            r.close()
+
+    r = None
+    if digest is not None and at_least(size, getattr(session, 'upload_dedup_min_size', None)) \
+            and has_blob(session, digest):
+        logging.debug('the server has {} (sha256:{}), skipping its upload'.format(model_path, digest))
+        r = send(by_digest=True)
+        if r.status_code == 404:
+            # the server has dropped the model since the check
+            logging.debug('the server has no sha256:{} any more, uploading it'.format(digest))
+            session.known_blobs.discard(digest)
+            r.close()
+            r = None
+    if r is None and digest is not None and at_least(size, getattr(session, 'upload_chunked_min_size', None)):
+        # a large model is uploaded in parts first, and then referred to by its digest
+        from furiosacli.uploads import upload_blob
+
+        if upload_blob(session, model, digest, size, position or 0, model_path):
+            r = send(by_digest=True)
+    if r is None:
+        r = send(rewindable=position is not None or not hasattr(model, 'read'))
+        if digest is not None and r.status_code == 200:
+            session.known_blobs.add(digest)
+    if r.status_code == 200:
+        return r
+    else:
+        raise ApiError('fail to {} {}'.format(description, model_path), r)
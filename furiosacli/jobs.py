@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List
+
+from furiosacli import consts
+from furiosacli.exceptions import CliError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# the ledger is pruned by a write once it grows past this size
+PRUNE_SIZE = 1024 * 1024
+
+
+class JobLedger(object):
+    # A JSON-lines file of the detached compile jobs. A change of a job appends a line with the changed fields
+    # only, and later lines override earlier ones, so CLI processes sharing the ledger never rewrite each other.
+    # Once the file grows past PRUNE_SIZE, it is rewritten with one line per job, keeping the unfinished jobs and
+    # the `max_jobs` most recently submitted ones; writers hold a lock on the file, so no line is lost meanwhile.
+    def __init__(self, path: str, max_jobs: int = None):
+        self.path = path
+        self.max_jobs = max_jobs
+
+    @staticmethod
+    def parse(path: str, lines: Iterable[str]) -> Dict[str, Dict]:
+        jobs = {}
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                job_id = record['job_id']
+            except (ValueError, KeyError):
+                logging.warning('skipping a corrupted line of {}'.format(path))
+                continue
+            jobs[job_id] = {**jobs.get(job_id, {}), **record}
+        return jobs
+
+    def records(self) -> Dict[str, Dict]:
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, 'r') as ledger:
+            return JobLedger.parse(self.path, ledger)
+
+    def list(self) -> List[Dict]:
+        return sorted(self.records().values(), key=lambda job: job.get('submitted_at', 0))
+
+    def get(self, job_id: str) -> Dict:
+        # a job can be referred to by any unique prefix of its id
+        jobs = self.records()
+        if job_id in jobs:
+            return jobs[job_id]
+        matched = [job for known_id, job in jobs.items() if known_id.startswith(job_id)]
+        if not matched:
+            raise CliError('unknown job {} (see furiosa jobs list)'.format(job_id))
+        if len(matched) > 1:
+            raise CliError('job id {} is ambiguous: {}'.format(job_id, ', '.join(job['job_id'] for job in matched)))
+        return matched[0]
+
+    @contextmanager
+    def locked(self):
+        # the ledger opened for appending under an exclusive lock
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        while True:
+            ledger = open(self.path, 'a+')
+            if fcntl is None:
+                break
+            fcntl.flock(ledger.fileno(), fcntl.LOCK_EX)
+            try:
+                # a prune may have replaced the file while this waited for the lock
+                if os.fstat(ledger.fileno()).st_ino == os.stat(self.path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            ledger.close()
+        try:
+            yield ledger
+        finally:
+            ledger.close()
+
+    def record(self, job_id: str, **fields) -> Dict:
+        record = {'job_id': job_id, 'updated_at': time.time(), **fields}
+        # a single short write in append mode, so concurrent writers do not interleave lines
+        with self.locked() as ledger:
+            ledger.write(json.dumps(record) + '\n')
+            ledger.flush()
+            if self.max_jobs is not None and os.fstat(ledger.fileno()).st_size > PRUNE_SIZE:
+                self.rewrite(ledger, self.max_jobs)
+        return record
+
+    def prune(self, max_jobs: int = None) -> int:
+        # the number of jobs removed from the ledger
+        max_jobs = self.max_jobs if max_jobs is None else max_jobs
+        if max_jobs is None or not os.path.isfile(self.path):
+            return 0
+        if max_jobs < 0:
+            raise CliError('the number of jobs to keep must not be negative')
+        with self.locked() as ledger:
+            return self.rewrite(ledger, max_jobs)
+
+    def rewrite(self, ledger, max_jobs: int) -> int:
+        ledger.seek(0)
+        jobs = JobLedger.parse(self.path, ledger)
+        newest = sorted(jobs.values(), key=lambda job: job.get('submitted_at', 0), reverse=True)
+        kept = [job for idx, job in enumerate(newest)
+                if idx < max_jobs or job.get('phase') not in consts.FINISHED_PHASES]
+
+        tmp_path = '{}.{}.tmp'.format(self.path, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, 'w') as tmp_file:
+                for job in reversed(kept):
+                    tmp_file.write(json.dumps(job) + '\n')
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return len(jobs) - len(kept)
@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class Metrics(object):
+    # Per-phase timings, byte counts and requests of one CLI command, safe to record from many threads.
+    # The phases are config (reading configs), hash (hashing a model to skip its upload), upload (sending a request
+    # body), server (waiting for the server:
+    # request processing, compile queue and compilation), download (streaming a response to disk)
+    # and write (copying results from or into the local cache).
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.phases = []
+        self.requests = []
+        self.retries = []
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase: str, elapsed_secs: float, num_bytes: int = 0, **labels) -> Dict:
+        record = {'phase': phase, 'elapsed_secs': elapsed_secs, 'bytes': num_bytes, **labels}
+        with self._lock:
+            self.phases.append(record)
+        return record
+
+    @contextmanager
+    def phase(self, phase: str, **labels):
+        # the yielded record can be updated (e.g. record['bytes']) until the block ends
+        record = {'bytes': 0, **labels}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            num_bytes = record.pop('bytes')
+            self.add_phase(phase, time.perf_counter() - start, num_bytes, **record)
+
+    def add_request(self, method: str, url: str, status: int, request_id: str,
+                    elapsed_secs: float, bytes_sent: int):
+        with self._lock:
+            self.requests.append({
+                'method': method,
+                'url': url,
+                'status': status,
+                'request_id': request_id,
+                'elapsed_secs': elapsed_secs,
+                'bytes_sent': bytes_sent,
+            })
+
+    def add_retry(self, method: str, url: str, request_id: str, reason: str, delay_secs: float = None):
+        with self._lock:
+            self.retries.append({
+                'method': method,
+                'url': url,
+                'request_id': request_id,
+                'reason': reason,
+                'delay_secs': delay_secs,
+            })
+
+    def merge(self, other: 'Metrics'):
+        # adds the phases, requests and retries of another command (e.g. one of a batch)
+        with other._lock:
+            phases, requests, retries = list(other.phases), list(other.requests), list(other.retries)
+        with self._lock:
+            self.phases += phases
+            self.requests += requests
+            self.retries += retries
+
+    @property
+    def elapsed_secs(self) -> float:
+        return time.perf_counter() - self._start
+
+    def totals(self) -> Dict[str, Dict]:
+        totals = {}
+        with self._lock:
+            for record in self.phases:
+                total = totals.setdefault(record['phase'], {'elapsed_secs': 0.0, 'bytes': 0, 'count': 0})
+                total['elapsed_secs'] += record['elapsed_secs']
+                total['bytes'] += record['bytes']
+                total['count'] += 1
+        return totals
+
+    def to_dict(self, command: str, exit_code: int, error: str = None) -> Dict:
+        with self._lock:
+            phases = list(self.phases)
+            requests = list(self.requests)
+            retries = list(self.retries)
+        return {
+            'command': command,
+            'exit_code': exit_code,
+            'error': error,
+            'started_at': self.started_at,
+            'elapsed_secs': self.elapsed_secs,
+            'totals': self.totals(),
+            'phases': phases,
+            'requests': requests,
+            'retries': retries,
+        }
+
+    def to_openmetrics(self, command: str, exit_code: int) -> str:
+        labels = 'command="{}"'.format(escape_label(command))
+        lines = [
+            '# TYPE furiosa_command_duration_seconds gauge',
+            '# UNIT furiosa_command_duration_seconds seconds',
+            'furiosa_command_duration_seconds{{{}}} {}'.format(labels, self.elapsed_secs),
+            '# TYPE furiosa_command_exit_code gauge',
+            'furiosa_command_exit_code{{{}}} {}'.format(labels, exit_code),
+        ]
+
+        totals = self.totals()
+        lines += ['# TYPE furiosa_phase_duration_seconds counter',
+                  '# UNIT furiosa_phase_duration_seconds seconds']
+        lines += ['furiosa_phase_duration_seconds_total{{{},phase="{}"}} {}'
+                  .format(labels, phase, total['elapsed_secs']) for phase, total in sorted(totals.items())]
+        lines += ['# TYPE furiosa_phase_bytes counter', '# UNIT furiosa_phase_bytes bytes']
+        lines += ['furiosa_phase_bytes_total{{{},phase="{}"}} {}'.format(labels, phase, total['bytes'])
+                  for phase, total in sorted(totals.items())]
+
+        statuses = {}
+        with self._lock:
+            requests = list(self.requests)
+        for request in requests:
+            statuses[request['status']] = statuses.get(request['status'], 0) + 1
+        lines.append('# TYPE furiosa_http_requests counter')
+        lines += ['furiosa_http_requests_total{{{},status="{}"}} {}'.format(labels, status, count)
+                  for status, count in sorted(statuses.items())]
+        with self._lock:
+            retries = {}
+            for retry in self.retries:
+                retries[retry['reason']] = retries.get(retry['reason'], 0) + 1
+        lines.append('# TYPE furiosa_http_retries counter')
+        lines += ['furiosa_http_retries_total{{{},reason="{}"}} {}'.format(labels, escape_label(reason), count)
+                  for reason, count in sorted(retries.items())]
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path: str, command: str, exit_code: int, error: str = None):
+        with open(path, 'w') as metrics_file:
+            json.dump(self.to_dict(command, exit_code, error), metrics_file, indent=2)
+
+    def write_openmetrics(self, path: str, command: str, exit_code: int):
+        with open(path, 'w') as metrics_file:
+            metrics_file.write(self.to_openmetrics(command, exit_code))
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
@@ -0,0 +1,263 @@
+import csv
+import heapq
+import io
+import json
+import math
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from furiosacli.exceptions import CliError
+
+# columns holding the estimated latency of an operator, in order of preference
+LATENCY_COLUMNS = ('latency_us', 'latency_ms', 'latency', 'cycles')
+
+
+def to_number(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def json_number(value: float):
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class PerfTable(object):
+    # The per-operator performance estimation of a model, stored by column. Numeric columns are array('d')
+    # (NaN where a cell has no number), which numpy.frombuffer() wraps without a copy; the others are lists of str.
+    # A 'total' row of the estimation is kept apart in `totals`, and `metadata` describes what was estimated.
+    def __init__(self, columns: Dict[str, Sequence], totals: Dict[str, float] = None, metadata: Dict = None):
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise CliError('the columns of a perf table must have the same length')
+        self.columns = columns
+        self.totals = totals or {}
+        self.metadata = metadata or {}
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    @staticmethod
+    def from_rows(header: List[str], rows: List[Sequence]) -> 'PerfTable':
+        totals = {}
+        operators = []
+        for row in rows:
+            row = list(row) + [''] * (len(header) - len(row))
+            if str(row[0]).strip().lower() == 'total':
+                totals = {name: to_number(value) for name, value in zip(header, row) if to_number(value) is not None}
+            else:
+                operators.append(row)
+
+        columns = {}
+        for idx, name in enumerate(header):
+            values = [row[idx] for row in operators]
+            numbers = [to_number(value) for value in values]
+            if all(number is not None or value in ('', None) for value, number in zip(values, numbers)) \
+                    and any(number is not None for number in numbers):
+                columns[name] = array('d', (math.nan if number is None else number for number in numbers))
+            else:
+                columns[name] = ['' if value is None else str(value) for value in values]
+        return PerfTable(columns, totals)
+
+    @staticmethod
+    def from_csv(data: bytes) -> 'PerfTable':
+        reader = csv.reader(io.StringIO(data.decode('utf-8', errors='replace')))
+        rows = [row for row in reader if row]
+        if not rows:
+            raise CliError('the perf result is empty')
+        return PerfTable.from_rows([name.strip() for name in rows[0]], rows[1:])
+
+    @staticmethod
+    def from_json(data: bytes) -> 'PerfTable':
+        try:
+            content = json.loads(data)
+            names = content['columns']
+            rows = [[operator.get(name) for name in names] for operator in content['operators']]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise CliError('the perf result is not a valid perf json: {}'.format(e))
+        table = PerfTable.from_rows(names, rows)
+        table.totals = {name: to_number(value) for name, value in (content.get('totals') or {}).items()
+                        if to_number(value) is not None}
+        table.metadata = content.get('metadata') or {}
+        return table
+
+    @staticmethod
+    def load(path: str) -> 'PerfTable':
+        with open(path, 'rb') as perf_file:
+            data = perf_file.read()
+        return PerfTable.from_json(data) if path.endswith('.json') else PerfTable.from_csv(data)
+
+    def is_numeric(self, name: str) -> bool:
+        return isinstance(self.column(name), array)
+
+    def column(self, name: str) -> Sequence:
+        if name not in self.columns:
+            raise CliError('the perf result has no column {}: {}'.format(name, self.names))
+        return self.columns[name]
+
+    def latency_column(self, name: str = None) -> str:
+        if name is not None:
+            if not self.is_numeric(name):
+                raise CliError('the column {} of the perf result is not numeric'.format(name))
+            return name
+        lowered = {column.lower(): column for column in self.names if self.is_numeric(column)}
+        for candidate in LATENCY_COLUMNS:
+            if candidate in lowered:
+                return lowered[candidate]
+        raise CliError('the perf result has none of the latency columns {}: {}'.format(LATENCY_COLUMNS, self.names))
+
+    def total(self, name: str) -> float:
+        # the estimation's own total when it has one, and the sum of the operators otherwise
+        if name in self.totals:
+            return self.totals[name]
+        return math.fsum(value for value in self.column(name) if not math.isnan(value))
+
+    def top_k(self, name: str, k: int) -> List[int]:
+        # indices of the k operators with the largest values of the column
+        values = self.column(name)
+        return heapq.nlargest(k, (idx for idx in range(len(self)) if not math.isnan(values[idx])),
+                              key=values.__getitem__)
+
+    def row(self, idx: int) -> Dict:
+        return {name: json_number(values[idx]) if isinstance(values, array) else values[idx]
+                for name, values in self.columns.items()}
+
+    def to_dict(self) -> Dict:
+        content = {
+            'columns': self.names,
+            'operators': [self.row(idx) for idx in range(len(self))],
+            'totals': {name: json_number(self.total(name)) for name in self.names if self.is_numeric(name)},
+        }
+        if self.metadata:
+            content['metadata'] = self.metadata
+        return content
+
+    def write_json(self, path: str):
+        with open(path, 'w') as output_file:
+            json.dump(self.to_dict(), output_file, indent=2)
+
+
+def total_latency(data: bytes, column: str = None) -> Tuple[str, float]:
+    table = PerfTable.from_csv(data)
+    column = table.latency_column(column)
+    return column, table.total(column)
+
+
+def format_top_operators(table: PerfTable, column: str, k: int) -> str:
+    total = table.total(column)
+    values = table.column(column)
+    name_column = table.names[0]
+    width = max([len(name_column)] + [len(str(table.column(name_column)[idx])) for idx in range(len(table))])
+    lines = ['{:<{width}}  {:>14}  {:>6}'.format(name_column.upper(), column.upper(), 'SHARE', width=width)]
+    for idx in table.top_k(column, k):
+        share = values[idx] / total if total else 0.0
+        lines.append('{:<{width}}  {:>14.3f}  {:>6.1%}'
+                     .format(str(table.column(name_column)[idx]), values[idx], share, width=width))
+    lines.append('total {}: {:.3f} ({} operators)'.format(column, total, len(table)))
+    return '\n'.join(lines)
+
+
+# columns holding memory allocation figures, compared (and gated) along with the latency
+MEMORY_COLUMN_HINTS = ('bytes', 'memory', 'sram', 'dram')
+
+
+def is_memory_column(name: str) -> bool:
+    return any(hint in name.lower() for hint in MEMORY_COLUMN_HINTS)
+
+
+def relative_change(baseline: float, candidate: float) -> Optional[float]:
+    if math.isnan(baseline) or math.isnan(candidate):
+        return None
+    if baseline == 0:
+        return 0.0 if candidate == 0 else None
+    return (candidate - baseline) / abs(baseline)
+
+
+def compare(baseline: float, candidate: float) -> Dict:
+    return {'baseline': json_number(baseline), 'candidate': json_number(candidate),
+            'change': relative_change(baseline, candidate)}
+
+
+def diff_tables(baseline: PerfTable, candidate: PerfTable) -> Dict:
+    # Compares the totals and the operators (matched by the first column) of every numeric column of both tables
+    columns = [name for name in baseline.names
+               if name in candidate.columns and baseline.is_numeric(name) and candidate.is_numeric(name)]
+    key = baseline.names[0]
+    candidate_rows = {str(name): idx for idx, name in enumerate(candidate.column(key))} \
+        if key in candidate.columns else {}
+
+    operators = []
+    for idx, name in enumerate(baseline.column(key)):
+        if str(name) not in candidate_rows:
+            continue
+        other = candidate_rows[str(name)]
+        operators.append({key: name, **{column: compare(baseline.column(column)[idx], candidate.column(column)[other])
+                                        for column in columns}})
+    baseline_names = {str(name) for name in baseline.column(key)}
+    return {
+        'columns': columns,
+        'totals': {column: compare(baseline.total(column), candidate.total(column)) for column in columns},
+        'operators': operators,
+        'added': [name for name in candidate_rows if name not in baseline_names],
+        'removed': sorted(baseline_names - set(candidate_rows)),
+    }
+
+
+def regressions(diff: Dict, columns: List[str], threshold: float) -> List[str]:
+    # the columns whose total grew by more than threshold (a fraction)
+    regressed = []
+    for column in columns:
+        total = diff['totals'].get(column)
+        if total is None:
+            continue
+        if total['change'] is None:
+            # a figure growing from zero has no relative change, but is still a regression
+            if total['baseline'] == 0 and (total['candidate'] or 0) > 0:
+                regressed.append(column)
+        elif total['change'] > threshold:
+            regressed.append(column)
+    return regressed
+
+
+def format_change(change: Optional[float]) -> str:
+    return 'n/a' if change is None else '{:+.1%}'.format(change)
+
+
+def format_value(value) -> str:
+    return '-' if value is None else str(value)
+
+
+def format_diff(diff: Dict, key: str, column: str, k: int) -> str:
+    lines = ['{:<14}  {:>16}  {:>16}  {:>8}'.format('TOTAL', 'BASELINE', 'CANDIDATE', 'CHANGE')]
+    for name in diff['columns']:
+        total = diff['totals'][name]
+        lines.append('{:<14}  {:>16}  {:>16}  {:>8}'
+                     .format(name, format_value(total['baseline']), format_value(total['candidate']),
+                             format_change(total['change'])))
+
+    # the operators whose column changed the most
+    changed = sorted(diff['operators'], reverse=True,
+                     key=lambda operator: abs(operator[column]['candidate'] - operator[column]['baseline'])
+                     if operator[column]['candidate'] is not None and operator[column]['baseline'] is not None
+                     else 0.0)[:k]
+    if changed:
+        width = max([len(key)] + [len(str(operator[key])) for operator in changed])
+        lines.append('')
+        lines.append('{:<{width}}  {:>16}  {:>16}  {:>8}'
+                     .format(key.upper(), 'BASELINE', 'CANDIDATE', 'CHANGE', width=width))
+        for operator in changed:
+            lines.append('{:<{width}}  {:>16}  {:>16}  {:>8}'
+                         .format(str(operator[key]), format_value(operator[column]['baseline']),
+                                 format_value(operator[column]['candidate']),
+                                 format_change(operator[column]['change']), width=width))
+    if diff['added'] or diff['removed']:
+        lines.append('{} operator(s) added, {} removed'.format(len(diff['added']), len(diff['removed'])))
+    return '\n'.join(lines)
@@ -0,0 +1,147 @@
+import json
+from typing import Dict, Iterable, List, Tuple, Union
+
+from furiosacli.exceptions import CliError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# {tensor: (min, max)}: the dynamic ranges Quantize takes
+DynamicRanges = Dict[str, Tuple[float, float]]
+# {tensor: {'range': [min, max], 'counts': [...]}}: uniform bins between min and max of each tensor
+Histograms = Dict[str, Dict]
+
+SUPPORT_MERGE_METHODS = {'minmax', 'percentile'}
+
+
+def merge_ranges(ranges: DynamicRanges, other: DynamicRanges) -> DynamicRanges:
+    for name, (low, high) in other.items():
+        if name in ranges:
+            low = min(low, ranges[name][0])
+            high = max(high, ranges[name][1])
+        ranges[name] = (low, high)
+    return ranges
+
+
+def rebin(histogram: Dict, low: float, high: float, bins: int) -> List[float]:
+    # Redistributes the counts over `bins` uniform bins between low and high,
+    # assuming the values are uniformly distributed within each source bin
+    src_low, src_high = histogram['range']
+    counts = histogram['counts']
+    num_src_bins = len(counts)
+
+    if high <= low or src_high <= src_low:
+        new_counts = [0.0] * bins
+        pos = 0 if high <= low else int((src_low - low) / (high - low) * bins)
+        new_counts[min(max(pos, 0), bins - 1)] = float(sum(counts))
+        return new_counts
+
+    if np is not None:
+        src_edges = np.linspace(src_low, src_high, num_src_bins + 1)
+        cumulative = np.concatenate([[0.0], np.cumsum(counts, dtype=np.float64)])
+        cdf = np.interp(np.linspace(low, high, bins + 1), src_edges, cumulative)
+        return np.diff(cdf).tolist()
+
+    cumulative = [0.0]
+    for count in counts:
+        cumulative.append(cumulative[-1] + count)
+
+    def cdf_at(value: float) -> float:
+        pos = (value - src_low) / (src_high - src_low) * num_src_bins
+        if pos <= 0:
+            return 0.0
+        if pos >= num_src_bins:
+            return cumulative[-1]
+        idx = int(pos)
+        return cumulative[idx] + counts[idx] * (pos - idx)
+
+    width = (high - low) / bins
+    cdf = [cdf_at(low + idx * width) for idx in range(bins + 1)]
+    return [cdf[idx + 1] - cdf[idx] for idx in range(bins)]
+
+
+def merge_histogram(histogram: Dict, other: Dict) -> Dict:
+    low = min(histogram['range'][0], other['range'][0])
+    high = max(histogram['range'][1], other['range'][1])
+    bins = max(len(histogram['counts']), len(other['counts']))
+    counts = [a + b for a, b in zip(rebin(histogram, low, high, bins), rebin(other, low, high, bins))]
+    return {'range': [low, high], 'counts': counts}
+
+
+def merge_histograms(histograms: Histograms, other: Histograms) -> Histograms:
+    for name, histogram in other.items():
+        histograms[name] = merge_histogram(histograms[name], histogram) if name in histograms else histogram
+    return histograms
+
+
+def percentile_range(histogram: Dict, percentile: float) -> Tuple[float, float]:
+    # Clips the (100 - percentile)% tails on both sides of the histogram
+    low, high = histogram['range']
+    counts = histogram['counts']
+    total = sum(counts)
+    if total == 0 or high <= low:
+        return low, high
+
+    width = (high - low) / len(counts)
+    lower_target = total * (100.0 - percentile) / 100.0
+    upper_target = total * percentile / 100.0
+
+    def value_at(target: float) -> float:
+        cumulative = 0.0
+        for idx, count in enumerate(counts):
+            if count > 0 and cumulative + count >= target:
+                return low + (idx + (target - cumulative) / count) * width
+            cumulative += count
+        return high
+
+    return value_at(lower_target), value_at(upper_target)
+
+
+def load_ranges_file(path: str) -> Tuple[DynamicRanges, Histograms]:
+    with open(path, 'r') as ranges_file:
+        content = json.load(ranges_file)
+
+    ranges = {}
+    histograms = {}
+    for name, value in content.items():
+        if isinstance(value, dict) and 'range' in value and 'counts' in value:
+            histograms[name] = value
+            ranges[name] = tuple(value['range'])
+        elif isinstance(value, (list, tuple)) and len(value) == 2:
+            ranges[name] = tuple(value)
+        else:
+            raise CliError('{} has an invalid range of {}: {}'.format(path, name, value))
+    return ranges, histograms
+
+
+def merge_dynamic_ranges(sources: Iterable[Union[str, DynamicRanges]],
+                         method: str = 'minmax',
+                         percentile: float = 99.99) -> Tuple[DynamicRanges, Histograms]:
+    # Reduces the ranges (and histograms) of every source in a single pass, one source in memory at a time.
+    # A source is a path to a dynamic-ranges or histogram JSON, or an already loaded {tensor: (min, max)}.
+    if method not in SUPPORT_MERGE_METHODS:
+        raise CliError('method must be one of {}'.format(SUPPORT_MERGE_METHODS))
+
+    ranges = {}
+    histograms = {}
+    for source in sources:
+        if isinstance(source, dict):
+            source_ranges, source_histograms = source, {}
+        else:
+            source_ranges, source_histograms = load_ranges_file(source)
+
+        if method == 'percentile' and set(source_histograms) != set(source_ranges):
+            raise CliError('percentile merging requires histograms of every tensor: {}'.format(source))
+        merge_ranges(ranges, source_ranges)
+        merge_histograms(histograms, source_histograms)
+
+    if method == 'percentile':
+        ranges = {name: percentile_range(histogram, percentile) for name, histogram in histograms.items()}
+    return ranges, histograms
+
+
+def write_ranges(path: str, ranges: DynamicRanges):
+    with open(path, 'w') as output_file:
+        json.dump({name: list(dynamic_range) for name, dynamic_range in ranges.items()}, output_file, indent=2)
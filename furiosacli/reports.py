@@ -0,0 +1,211 @@
+import csv
+import glob
+import heapq
+import json
+import functools
+import math
+import multiprocessing
+import os
+import re
+from array import array
+from typing import Dict, List, Optional
+
+from furiosacli.exceptions import CliError
+from furiosacli.perfdata import PerfTable, json_number
+
+# A tensor of a memory allocation report, as in its hover labels: name [lifetime start, end) [address start, end),
+# the lifetime in cycles and the address in bytes
+TENSOR_PATTERN = re.compile(r'([A-Za-z_][\w#:./-]*)\]?\s*\[(\d+),\s*(\d+)\)\s*\[(\d+),\s*(\d+)\)')
+UTILIZATION_PATTERN = re.compile(r'computation/total:\s*(\d+)\s*/\s*(\d+)')
+# A pass of a compiler report: a line naming the pass and ending with its elapsed time, e.g. 'LowerToLir: 12.5 ms'
+PASS_PATTERN = re.compile(r'^\s*(?P<name>[A-Za-z_][^:=|]*?)\s*(?:[:=|]\s*)?(?:(?:elapsed|took|time)\s*[:=]?\s*)?'
+                          r'(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>ns|us|µs|ms|s|sec|secs)\s*\|?\s*$', re.IGNORECASE)
+TIME_UNITS_MS = {'ns': 1e-6, 'us': 1e-3, 'µs': 1e-3, 'ms': 1.0, 's': 1000.0, 'sec': 1000.0, 'secs': 1000.0}
+GLOB_CHARS = ('*', '?', '[')
+
+
+def resolve_reports(patterns: List[str]) -> List[str]:
+    paths = []
+    for pattern in patterns:
+        if not os.path.exists(pattern) and any(char in pattern for char in GLOB_CHARS):
+            matched = sorted(glob.glob(pattern, recursive=True))
+            if not matched:
+                raise CliError('no reports match {}'.format(pattern))
+            paths += matched
+        else:
+            paths.append(pattern)
+    return paths
+
+
+def parse_memory_report(text: str) -> Optional[PerfTable]:
+    # the tensors of a memory allocation report, by column; None when the text has no tensor
+    tensors = {}
+    for matched in TENSOR_PATTERN.finditer(text):
+        name = matched.group(1)
+        # a plot may repeat the label of a tensor
+        tensors.setdefault((name, matched.group(2), matched.group(4)), matched)
+    if not tensors:
+        return None
+
+    names = []
+    columns = {column: array('d') for column in ('size', 'lifetime_start', 'lifetime_end', 'lifetime',
+                                                 'address_start', 'address_end')}
+    for matched in tensors.values():
+        lifetime_start, lifetime_end, address_start, address_end = (int(value) for value in matched.groups()[1:])
+        names.append(matched.group(1))
+        columns['size'].append(address_end - address_start)
+        columns['lifetime_start'].append(lifetime_start)
+        columns['lifetime_end'].append(lifetime_end)
+        columns['lifetime'].append(lifetime_end - lifetime_start)
+        columns['address_start'].append(address_start)
+        columns['address_end'].append(address_end)
+    return PerfTable({'tensor': names, **columns})
+
+
+def parse_compiler_report(text: str) -> Optional[PerfTable]:
+    # the elapsed time of every pass in a compiler report, in milliseconds; None when the text has no pass
+    names = []
+    elapsed = array('d')
+    for line in text.splitlines():
+        matched = PASS_PATTERN.match(line.strip().strip('|'))
+        if matched is None:
+            continue
+        names.append(matched.group('name').strip())
+        elapsed.append(float(matched.group('value')) * TIME_UNITS_MS[matched.group('unit').lower()])
+    if not names:
+        return None
+    return PerfTable({'pass': names, 'elapsed_ms': elapsed})
+
+
+def peak_usage(table: PerfTable) -> Dict:
+    # the most bytes live at once (lifetimes are half-open, so a tensor freed at a cycle makes room for one
+    # allocated at the same cycle), and how much of the used address range they leave unused
+    events = []
+    sizes = table.column('size')
+    for idx, (start, end) in enumerate(zip(table.column('lifetime_start'), table.column('lifetime_end'))):
+        events.append((start, 1, sizes[idx]))
+        events.append((end, 0, -sizes[idx]))
+    events.sort()
+    live = peak = 0.0
+    peak_cycle = None
+    for cycle, _, size in events:
+        live += size
+        if live > peak:
+            peak, peak_cycle = live, cycle
+
+    footprint = max(table.column('address_end')) - min(table.column('address_start'))
+    return {
+        'peak_bytes': json_number(peak),
+        'peak_cycle': json_number(peak_cycle) if peak_cycle is not None else None,
+        'footprint_bytes': json_number(footprint),
+        'fragmentation': 1.0 - peak / footprint if footprint > 0 else 0.0,
+    }
+
+
+def summarize_report(path: str, k: int) -> Dict:
+    # runs in a worker process, so it returns plain data
+    summary = {'report': path}
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as report_file:
+            text = report_file.read()
+    except OSError as e:
+        return {**summary, 'error': str(e)}
+
+    memory = parse_memory_report(text)
+    if memory is not None:
+        summary.update(kind='memory', tensors=len(memory), total_bytes=json_number(memory.total('size')))
+        summary.update(peak_usage(memory))
+        utilization = UTILIZATION_PATTERN.search(text)
+        if utilization is not None:
+            computation, total = int(utilization.group(1)), int(utilization.group(2))
+            summary.update(computation_cycles=computation, total_cycles=total,
+                           utilization=computation / total if total else None)
+        summary['top_buffers'] = [memory.row(idx) for idx in memory.top_k('size', k)]
+        return summary
+
+    passes = parse_compiler_report(text)
+    if passes is not None:
+        summary.update(kind='compiler', passes=len(passes), compile_time_ms=json_number(passes.total('elapsed_ms')))
+        summary['slowest_passes'] = [passes.row(idx) for idx in passes.top_k('elapsed_ms', k)]
+        return summary
+    return {**summary, 'error': 'neither tensors of a memory allocation report nor compiler passes found'}
+
+
+def summarize_reports(paths: List[str], k: int, workers: int = 1) -> List[Dict]:
+    # parsing is cpu-bound, so hundreds of reports are spread over worker processes; the summaries keep the order
+    summarize = functools.partial(summarize_report, k=k)
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        return list(map(summarize, paths))
+    with multiprocessing.get_context('spawn').Pool(workers) as pool:
+        return pool.map(summarize, paths, chunksize=max(len(paths) // (workers * 4), 1))
+
+
+def aggregate(summaries: List[Dict], k: int) -> Dict:
+    # the k largest buffers of all memory reports, and the passes taking the most time over all compiler reports
+    buffers = [{'report': summary['report'], **buffer} for summary in summaries
+               for buffer in summary.get('top_buffers', [])]
+    passes = {}
+    for summary in summaries:
+        for compiler_pass in summary.get('slowest_passes', []):
+            total = passes.setdefault(compiler_pass['pass'], {'pass': compiler_pass['pass'], 'count': 0,
+                                                              'total_ms': 0.0, 'max_ms': 0.0, 'max_report': None})
+            total['count'] += 1
+            total['total_ms'] += compiler_pass['elapsed_ms']
+            if compiler_pass['elapsed_ms'] >= total['max_ms']:
+                total['max_ms'], total['max_report'] = compiler_pass['elapsed_ms'], summary['report']
+
+    memory = [summary for summary in summaries if summary.get('kind') == 'memory']
+    return {
+        'reports': len(summaries),
+        'errors': sum(1 for summary in summaries if 'error' in summary),
+        'max_peak_bytes': max((summary['peak_bytes'] for summary in memory), default=None),
+        'mean_fragmentation': math.fsum(summary['fragmentation'] for summary in memory) / len(memory)
+        if memory else None,
+        'top_buffers': heapq.nlargest(k, buffers, key=lambda buffer: buffer['size']),
+        'slowest_passes': heapq.nlargest(k, passes.values(), key=lambda total: total['total_ms']),
+    }
+
+
+SUMMARY_COLUMNS = ('report', 'kind', 'tensors', 'total_bytes', 'peak_bytes', 'peak_cycle', 'footprint_bytes',
+                   'fragmentation', 'utilization', 'passes', 'compile_time_ms', 'error')
+
+
+def write_summary(path: str, summaries: List[Dict], totals: Dict):
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=SUMMARY_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(summaries)
+    else:
+        with open(path, 'w') as output_file:
+            json.dump({'summary': totals, 'reports': summaries}, output_file, indent=2)
+
+
+def format_summary(summaries: List[Dict], totals: Dict) -> str:
+    lines = []
+    memory = [summary for summary in summaries if summary.get('kind') == 'memory']
+    if memory:
+        width = max(len('REPORT'), *(len(summary['report']) for summary in memory))
+        lines.append('{:<{width}}  {:>8}  {:>14}  {:>14}  {:>7}'
+                     .format('REPORT', 'TENSORS', 'PEAK BYTES', 'FOOTPRINT', 'FRAG', width=width))
+        for summary in sorted(memory, key=lambda summary: summary['peak_bytes'], reverse=True):
+            lines.append('{:<{width}}  {:>8}  {:>14}  {:>14}  {:>7.1%}'
+                         .format(summary['report'], summary['tensors'], summary['peak_bytes'],
+                                 summary['footprint_bytes'], summary['fragmentation'], width=width))
+    if totals['top_buffers']:
+        lines.append('')
+        lines.append('largest buffers:')
+        lines += ['  {} {} ({} bytes, cycles {}-{})'.format(buffer['report'], buffer['tensor'], buffer['size'],
+                                                            buffer['lifetime_start'], buffer['lifetime_end'])
+                  for buffer in totals['top_buffers']]
+    if totals['slowest_passes']:
+        lines.append('')
+        lines.append('slowest compiler passes:')
+        lines += ['  {} {:.3f} ms in {} report(s) (max {:.3f} ms in {})'
+                  .format(total['pass'], total['total_ms'], total['count'], total['max_ms'], total['max_report'])
+                  for total in totals['slowest_passes']]
+    for summary in summaries:
+        if 'error' in summary:
+            lines.append('ERROR: {}: {}'.format(summary['report'], summary['error']))
+    return '\n'.join(lines)
@@ -0,0 +1,107 @@
+import copy
+import csv
+import itertools
+import json
+import random
+from typing import Any, Dict, List
+
+from furiosacli.exceptions import CliError
+
+# a point of a sweep: {'compiler_config.<key>': value, 'target_npu_spec.<key>': value, ...}
+Point = Dict[str, Any]
+
+SWEEP_SECTIONS = ('compiler_config', 'target_npu_spec')
+
+
+def load_grid(path: str) -> Dict[str, List]:
+    # A grid file maps compiler config and NPU spec keys (dotted for nested keys) to the values to try:
+    #   compiler_config:
+    #     sa_malloc: [true, false]
+    #   target_npu_spec:
+    #     dram.bandwidth: [32, 64]
+    import yaml
+
+    with open(path, 'r') as grid_file:
+        content = yaml.safe_load(grid_file) or {}
+    if not isinstance(content, dict) or set(content) - set(SWEEP_SECTIONS):
+        raise CliError('{} must only have the sections {}'.format(path, SWEEP_SECTIONS))
+
+    grid = {}
+    for section in SWEEP_SECTIONS:
+        for key, values in (content.get(section) or {}).items():
+            values = values if isinstance(values, list) else [values]
+            if not values:
+                raise CliError('{} has no values for {}.{}'.format(path, section, key))
+            grid['{}.{}'.format(section, key)] = values
+    if not grid:
+        raise CliError('{} has no parameters to sweep'.format(path))
+    return grid
+
+
+def expand_grid(grid: Dict[str, List]) -> List[Point]:
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sample_points(points: List[Point], samples: int, seed: int = None) -> List[Point]:
+    if samples is None or samples >= len(points):
+        return points
+    return random.Random(seed).sample(points, samples)
+
+
+def apply_point(base: Dict, section: str, point: Point) -> Dict:
+    config = copy.deepcopy(base)
+    prefix = section + '.'
+    for name, value in point.items():
+        if not name.startswith(prefix):
+            continue
+        keys = name[len(prefix):].split('.')
+        target = config
+        for key in keys[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        target[keys[-1]] = value
+    return config
+
+
+def point_key(point: Point) -> str:
+    return json.dumps(point, sort_keys=True)
+
+
+def rank_results(results: List[Dict]) -> List[Dict]:
+    # the fastest points first, and the failed ones last
+    ranked = sorted(results, key=lambda result: (result['latency'] is None, result['latency'] or 0.0))
+    for rank, result in enumerate(ranked, 1):
+        result['rank'] = rank if result['latency'] is not None else None
+    return ranked
+
+
+def write_results(path: str, results: List[Dict], names: List[str], metric: str):
+    if path.endswith('.json'):
+        with open(path, 'w') as output_file:
+            json.dump({'metric': metric, 'results': results}, output_file, indent=2)
+        return
+
+    with open(path, 'w', newline='') as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(['rank', metric] + names + ['cached', 'error'])
+        for result in results:
+            writer.writerow([result['rank'] or '', '' if result['latency'] is None else result['latency']]
+                            + [json.dumps(result['point'][name]) for name in names]
+                            + [result['cached'], result['error'] or ''])
+
+
+def format_summary(results: List[Dict], names: List[str], metric: str, num_points: int, wall_clock_secs: float,
+                   top: int = 5) -> str:
+    lines = ['{:>4}  {:>14}  {}'.format('RANK', metric.upper(), 'PARAMETERS')]
+    for result in results[:top]:
+        if result['latency'] is None:
+            break
+        params = ', '.join('{}={}'.format(name, json.dumps(result['point'][name])) for name in names)
+        lines.append('{:>4}  {:>14.3f}  {}'.format(result['rank'], result['latency'], params))
+    cached = sum(1 for result in results if result['cached'])
+    failed = sum(1 for result in results if result['latency'] is None)
+    lines.append('{} of {} points estimated ({} cached, {} failed, wall clock: {:.3f} s)'
+                 .format(len(results), num_points, cached, failed, wall_clock_secs))
+    return '\n'.join(lines)
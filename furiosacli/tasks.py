@@ -0,0 +1,372 @@
+import inspect
+import io
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List
+
+from furiosacli import consts, http
+from furiosacli.exceptions import ApiError, CliError
+from furiosacli.http import ModelSource
+
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_POLL_INTERVAL = 30.0
+DEFAULT_POLL_BACKOFF = 1.5
+
+
+class CompileTask(object):
+    # A compile task running on the server. Every method issues at most one request and never blocks on
+    # the compilation itself, so any number of tasks can be polled from a single loop (see TaskPoller).
+    def __init__(self, session, status: Dict):
+        self.session = session
+        self.task_id = status['task_id']
+        self.status = status
+
+    @property
+    def url(self) -> str:
+        return '{}/{}/{}'.format(self.session.api_endpoint, consts.COMPILE_TASKS_API_PATH, self.task_id)
+
+    @property
+    def phase(self) -> str:
+        return self.status['phase']
+
+    @property
+    def progress(self) -> float:
+        return self.status.get('progress') or 0.0
+
+    def is_finished(self) -> bool:
+        return self.phase in consts.FINISHED_PHASES
+
+    def is_succeeded(self) -> bool:
+        return self.phase == 'succeeded'
+
+    def get_error_message(self) -> str:
+        return self.status.get('error_message') or 'the compile task is {}'.format(self.phase)
+
+    def refresh(self) -> Dict:
+        r = self.session.http.get(self.url)
+        if r.status_code != 200:
+            raise ApiError('fail to get the compile task {}'.format(self.task_id), r)
+        self.status = r.json()
+        return self.status
+
+    def cancel(self):
+        r = self.session.http.delete(self.url)
+        if r.status_code != 200:
+            raise ApiError('fail to cancel the compile task {}'.format(self.task_id), r)
+        self.status = r.json()
+
+    def artifact_request(self, artifact: str, target_ir: str = None, stream: bool = False):
+        # target_ir picks one IR of a task compiling several IRs
+        params = {'target_ir': target_ir} if target_ir is not None else None
+        r = self.session.http.get('{}/{}'.format(self.url, artifact), params=params, stream=stream)
+        if r.status_code != 200:
+            raise ApiError('fail to get the {} of the compile task {}'.format(artifact, self.task_id), r)
+        return r
+
+    def save_artifact(self, artifact: str, output_path: str, target_ir: str = None) -> int:
+        return http.save_response(self.artifact_request(artifact, target_ir, stream=True), output_path,
+                                  metrics=getattr(self.session, 'metrics', None))
+
+    def get_ir(self, target_ir: str = None) -> bytes:
+        return self.artifact_request('ir', target_ir).content
+
+    def get_compiler_report(self) -> str:
+        return self.artifact_request('compiler-report').text
+
+    def get_memory_alloc_report(self) -> str:
+        return self.artifact_request('memory-alloc-report').text
+
+
+class ClientCompileTask(CompileTask):
+    # A compile task submitted through furiosa.client, for servers without the compile task api. The client
+    # offers no status poll, so its blocking wait_for_complete() runs in a thread of its own and refresh() only
+    # looks whether it has returned. cancel() uses the cancel() of the client's task when it has one.
+    def __init__(self, session, task, model_path: str = None):
+        self.task = task
+        # the model the task compiles, naming the task in the logs
+        self.model_path = model_path
+        self.error = None
+        super().__init__(session, {'task_id': str(getattr(task, 'task_id', None) or uuid.uuid4().hex),
+                                   'phase': 'running'})
+        self.waiter = threading.Thread(target=self.wait_for_complete, daemon=True,
+                                       name='furiosa-compile-{}'.format(self.task_id))
+        self.waiter.start()
+
+    def wait_for_complete(self):
+        try:
+            self.task.wait_for_complete()
+        except Exception as e:
+            logging.debug('compile task {} of {} failed in furiosa.client: {}'.format(self.task_id, self.model_path, e))
+            self.error = e
+
+    def refresh(self) -> Dict:
+        if self.phase == 'cancelled' or self.waiter.is_alive():
+            self.status = {**self.status, 'progress': getattr(self.task, 'progress', None) or self.progress}
+        elif self.error is not None:
+            self.status = {**self.status, 'phase': 'failed', 'error_message': str(self.error)}
+        elif self.task.is_succeeded():
+            self.status = {**self.status, 'phase': 'succeeded', 'progress': 1.0}
+        else:
+            self.status = {**self.status, 'phase': 'failed', 'error_message': self.task.get_error_message()}
+        return self.status
+
+    def cancel(self):
+        cancel = getattr(self.task, 'cancel', None)
+        if not callable(cancel):
+            raise CliError('furiosa.client cannot cancel the compile task {}, so it keeps running on the server'
+                           .format(self.task_id))
+        cancel()
+        self.status = {**self.status, 'phase': 'cancelled'}
+
+    def save_artifact(self, artifact: str, output_path: str, target_ir: str = None) -> int:
+        if artifact == 'ir':
+            data = self.get_ir(target_ir)
+        elif artifact == 'compiler-report':
+            data = self.get_compiler_report()
+        elif artifact == 'memory-alloc-report':
+            data = self.get_memory_alloc_report()
+        else:
+            raise CliError('unknown artifact {} of the compile task {}'.format(artifact, self.task_id))
+        if isinstance(data, str):
+            data = data.encode()
+
+        # written as save_response does, so output_path never holds a partial artifact
+        tmp_path = os.path.join(os.path.dirname(os.path.abspath(output_path)),
+                                '.{}.{}.part'.format(os.path.basename(output_path), uuid.uuid4().hex))
+        try:
+            with open(tmp_path, 'xb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return len(data)
+
+    def get_ir(self, target_ir: str = None) -> bytes:
+        return self.task.get_ir()
+
+    def get_compiler_report(self) -> str:
+        return self.task.get_compiler_report()
+
+    def get_memory_alloc_report(self) -> str:
+        return self.task.get_memory_alloc_report()
+
+
+def compile_tasks_api(session) -> bool:
+    # Whether the server has the compile task api, which is probed once per session. Without it, compile tasks
+    # are submitted through furiosa.client.
+    http_session = session.http
+    supported = getattr(http_session, 'compile_tasks_api', None)
+    if supported is None:
+        r = http_session.get('{}/{}'.format(session.api_endpoint, consts.COMPILE_TASKS_API_PATH))
+        r.close()
+        supported = r.status_code == 200
+        http_session.compile_tasks_api = supported
+        logging.debug('the server {} the compile task api'.format('has' if supported else 'does not have'))
+    return supported
+
+
+def require_compile_tasks_api(session, feature: str):
+    if not compile_tasks_api(session):
+        raise CliError('{} needs a server with the compile task api ({})'
+                       .format(feature, consts.COMPILE_TASKS_API_PATH))
+
+
+def submit_client_compile(session,
+                          source: ModelSource,
+                          compiler_config: str,
+                          target_npu_spec: str,
+                          target_ir: str,
+                          model_path: str = None) -> ClientCompileTask:
+    try:
+        from furiosa.client import CompilerClient
+    except ImportError:
+        raise CliError('the server has no compile task api, so compiling needs furiosa-client '
+                       '(pip install -r requirements.txt)')
+
+    client = CompilerClient()
+    kwargs = {'compiler_config': compiler_config, 'target_npu_spec': target_npu_spec}
+    if 'target_ir' in inspect.signature(client.submit_compile).parameters:
+        kwargs['target_ir'] = target_ir
+    elif ',' in target_ir:
+        raise CliError('compiling several target IRs from one upload needs a server with the compile task api')
+
+    model_path = model_path or http.model_name(source)
+    source_file = None
+    if isinstance(source, (str, os.PathLike)):
+        source_file = source = open(source, 'rb')
+    elif not hasattr(source, 'read'):
+        source = io.BytesIO(source)
+    try:
+        with session.metrics.phase('upload', api='furiosa.client') as phase:
+            task = client.submit_compile(source=source, **kwargs)
+            if source_file is not None:
+                phase['bytes'] = os.fstat(source_file.fileno()).st_size
+    finally:
+        if source_file is not None:
+            source_file.close()
+    task = ClientCompileTask(session, task, model_path)
+    logging.debug('compile task {} of {} has been submitted through furiosa.client'.format(task.task_id, model_path))
+    return task
+
+
+def submit_compile(session,
+                   source: ModelSource,
+                   compiler_config: str,
+                   target_npu_spec: str,
+                   target_ir: str,
+                   model_path: str = None) -> CompileTask:
+    # target_ir may list several IRs (e.g. lir,enf), which are all compiled from the one upload
+    if not compile_tasks_api(session):
+        return submit_client_compile(session, source, compiler_config, target_npu_spec, target_ir, model_path)
+    r = http.post_model(session, consts.COMPILE_TASKS_API_PATH, source, model_path, 'submit the compile task',
+                        fields={
+                            'compiler_config': compiler_config,
+                            'target_npu_spec': target_npu_spec,
+                            'target_ir': target_ir,
+                        })
+    task = CompileTask(session, r.json())
+    logging.debug('compile task {} has been submitted'.format(task.task_id))
+    return task
+
+
+class TaskPoller(object):
+    # Waits on any number of compile tasks from one loop. A task is polled `interval` seconds after its last
+    # status, and the interval grows by `backoff` up to `max_interval` for as long as the task makes no progress.
+    # Unfinished tasks are cancelled on the server when `timeout` expires, when the wait is interrupted (Ctrl-C) or
+    # when `stop` is set (e.g. by compile --watch once a newer version of the model appears).
+    def __init__(self,
+                 interval: float = DEFAULT_POLL_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 backoff: float = DEFAULT_POLL_BACKOFF,
+                 timeout: float = None,
+                 quiet: bool = False,
+                 stream=None,
+                 stop: threading.Event = None):
+        if interval <= 0 or max_interval < interval or backoff < 1:
+            raise CliError('poll interval must be positive, at most the max poll interval, and backoff at least 1')
+        if timeout is not None and timeout <= 0:
+            raise CliError('timeout must be positive')
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stream = stream or sys.stderr
+        self.stop = stop
+        # the live progress line is only drawn on terminals
+        self.show_progress = not quiet and self.stream.isatty()
+
+    def wait(self, tasks: List[CompileTask], on_finished: Callable[[CompileTask], None] = None,
+             incoming: queue.Queue = None) -> List[CompileTask]:
+        # Tasks submitted while the wait runs (e.g. by the bounded submitters of compile --batch) are put into
+        # `incoming`, and the wait ends once None has been put into it and every task has finished.
+        start = time.monotonic()
+        deadline = None if self.timeout is None else start + self.timeout
+        tasks = list(tasks)
+        pending = {}
+        intervals = {}
+        next_polls = {}
+
+        def add(task):
+            if task.is_finished():
+                if on_finished is not None:
+                    on_finished(task)
+            else:
+                pending[task.task_id] = task
+                intervals[task.task_id] = self.interval
+                next_polls[task.task_id] = time.monotonic() + self.interval
+
+        def receive(timeout: float) -> bool:
+            # adds the tasks submitted until the timeout expires; False once there will be no more
+            try:
+                task = incoming.get(timeout=timeout) if timeout > 0 else incoming.get_nowait()
+                while task is not None:
+                    tasks.append(task)
+                    add(task)
+                    task = incoming.get_nowait()
+                return False
+            except queue.Empty:
+                return True
+
+        for task in tasks:
+            add(task)
+        receiving = incoming is not None
+        try:
+            while pending or receiving:
+                if self.stop is not None and self.stop.is_set():
+                    self.cancel(pending.values())
+                    raise CliError('{} compile task(s) have been cancelled: {}'
+                                   .format(len(pending), ', '.join(pending)))
+
+                now = time.monotonic()
+                if deadline is not None and now >= deadline:
+                    self.cancel(pending.values())
+                    raise CliError('{} compile task(s) did not finish in {} s and have been cancelled: {}'
+                                   .format(len(pending), self.timeout, ', '.join(pending)))
+
+                for task_id in [task_id for task_id, next_poll in next_polls.items() if next_poll <= now]:
+                    task = pending[task_id]
+                    progress = task.progress
+                    task.refresh()
+                    if task.is_finished():
+                        del pending[task_id], intervals[task_id], next_polls[task_id]
+                        logging.debug('compile task {} is {}'.format(task_id, task.phase))
+                        if on_finished is not None:
+                            on_finished(task)
+                        continue
+                    if task.progress > progress:
+                        intervals[task_id] = self.interval
+                    else:
+                        intervals[task_id] = min(intervals[task_id] * self.backoff, self.max_interval)
+                    next_polls[task_id] = time.monotonic() + intervals[task_id]
+
+                self.draw_progress(tasks, time.monotonic() - start)
+                if pending or receiving:
+                    wake_up = min(next_polls.values(), default=time.monotonic() + self.max_interval)
+                    if deadline is not None:
+                        wake_up = min(wake_up, deadline)
+                    delay = max(wake_up - time.monotonic(), 0)
+                    if receiving:
+                        receiving = receive(delay)
+                    elif self.stop is not None:
+                        self.stop.wait(delay)
+                    else:
+                        time.sleep(delay)
+        except KeyboardInterrupt:
+            self.cancel(pending.values())
+            raise
+        finally:
+            self.clear_progress()
+        return tasks
+
+    @staticmethod
+    def cancel(tasks):
+        for task in list(tasks):
+            try:
+                task.cancel()
+                logging.warning('compile task {} has been cancelled'.format(task.task_id))
+            except Exception as e:
+                logging.error('fail to cancel the compile task {}: {}'.format(task.task_id, e))
+
+    def draw_progress(self, tasks: List[CompileTask], elapsed: float):
+        if not self.show_progress:
+            return
+        if len(tasks) == 1:
+            line = 'compiling: {} {:.0%} ({:.1f} s)'.format(tasks[0].phase, tasks[0].progress, elapsed)
+        else:
+            finished = sum(1 for task in tasks if task.is_finished())
+            line = 'compiling: {} of {} tasks finished ({:.1f} s)'.format(finished, len(tasks), elapsed)
+        self.stream.write('\r\033[K' + line)
+        self.stream.flush()
+
+    def clear_progress(self):
+        if self.show_progress:
+            self.stream.write('\r\033[K')
+            self.stream.flush()
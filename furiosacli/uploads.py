@@ -0,0 +1,267 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from furiosacli import consts
+from furiosacli.exceptions import ApiError
+from furiosacli.http import ModelSource, RetryPolicy
+
+# status codes of a server without chunked uploads
+UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+PART_CHUNK_SIZE = 1024 * 1024
+
+
+class ChunkedUpload(object):
+    # A model uploaded into the blob store of the server in fixed-size parts, a few at a time over the connection
+    # pool. Every part carries its sha256, and a part the server received corrupted is sent again. The upload id and
+    # the received parts are kept in a checkpoint file, so an interrupted upload resumes with the missing parts only.
+    def __init__(self, session, model: ModelSource, digest: str, size: int, offset: int = 0, model_path: str = None):
+        self.session = session
+        self.model = model
+        self.digest = digest
+        self.size = size
+        self.offset = offset
+        self.model_path = model_path
+        self.part_size = session.upload_part_size
+        self.upload_id = None
+        self.parts = set()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return '{}/{}/{}'.format(self.session.api_endpoint, consts.UPLOADS_API_PATH, self.upload_id)
+
+    @property
+    def num_parts(self) -> int:
+        return max((self.size + self.part_size - 1) // self.part_size, 1)
+
+    @property
+    def checkpoint_path(self) -> str:
+        key = hashlib.sha256('{}\0{}'.format(self.session.api_endpoint, self.digest).encode()).hexdigest()
+        return os.path.join(self.session.uploads_dir, '{}.json'.format(key))
+
+    def load_checkpoint(self) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_path, 'r') as checkpoint_file:
+                checkpoint = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning('ignoring the upload checkpoint {}: {}'.format(self.checkpoint_path, e))
+            return None
+        if checkpoint.get('digest') != self.digest or checkpoint.get('size') != self.size:
+            return None
+        return checkpoint
+
+    def save_checkpoint(self):
+        # called from the part uploads, so the file is replaced as a whole
+        with self._lock:
+            checkpoint = {
+                'endpoint': self.session.api_endpoint,
+                'digest': self.digest,
+                'size': self.size,
+                'part_size': self.part_size,
+                'upload_id': self.upload_id,
+                'source': self.model_path,
+                'parts': sorted(self.parts),
+                'updated_at': time.time(),
+            }
+            os.makedirs(self.session.uploads_dir, exist_ok=True)
+            tmp_path = '{}.{}.tmp'.format(self.checkpoint_path, uuid.uuid4().hex)
+            try:
+                with open(tmp_path, 'w') as checkpoint_file:
+                    json.dump(checkpoint, checkpoint_file)
+                os.replace(tmp_path, self.checkpoint_path)
+            except OSError as e:
+                logging.warning('fail to write the upload checkpoint {}: {}'.format(self.checkpoint_path, e))
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def remove_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def resume(self, checkpoint: Dict) -> bool:
+        # the server's list of the received parts is authoritative; an unknown upload has expired
+        self.upload_id = checkpoint['upload_id']
+        r = self.session.http.get(self.url)
+        if r.status_code != 200:
+            logging.debug('cannot resume the upload {} (http_status: {})'.format(self.upload_id, r.status_code))
+            return False
+        status = r.json()
+        self.part_size = status.get('part_size', checkpoint['part_size'])
+        self.parts = set(status.get('parts', []))
+        logging.info('resuming the upload of {}: {} of {} parts have been uploaded'
+                     .format(self.model_path or self.digest, len(self.parts), self.num_parts))
+        return True
+
+    def start(self) -> bool:
+        # False when the server has no chunked uploads
+        r = self.session.http.post('{}/{}'.format(self.session.api_endpoint, consts.UPLOADS_API_PATH),
+                                   json={'digest': 'sha256:{}'.format(self.digest),
+                                         'size': self.size,
+                                         'part_size': self.part_size})
+        if r.status_code in UNSUPPORTED_STATUS_CODES:
+            return False
+        if r.status_code != 200:
+            raise ApiError('fail to start the upload of {}'.format(self.model_path or self.digest), r)
+        status = r.json()
+        self.upload_id = status['upload_id']
+        self.part_size = status.get('part_size', self.part_size)
+        self.parts = set(status.get('parts', []))
+        self.save_checkpoint()
+        return True
+
+    def part_range(self, index: int) -> Tuple[int, int]:
+        return self.offset + index * self.part_size, min(self.part_size, self.size - index * self.part_size)
+
+    @contextmanager
+    def open_part(self, index: int) -> Iterator['PartReader']:
+        # a reader streaming the part, so memory use does not grow with the part size
+        start, length = self.part_range(index)
+        if isinstance(self.model, (str, os.PathLike)):
+            with open(self.model, 'rb') as model_file:
+                yield PartReader(lambda offset, size: read_at(model_file, offset, size), start, length)
+        elif hasattr(self.model, 'read'):
+            # one file object is shared by the part uploads
+            def read_shared(offset, size):
+                with self._lock:
+                    position = self.model.tell()
+                    data = read_at(self.model, offset, size)
+                    self.model.seek(position)
+                return data
+
+            yield PartReader(read_shared, start, length)
+        else:
+            view = memoryview(self.model).cast('B')
+            yield PartReader(lambda offset, size: view[offset:offset + size].tobytes(), start, length)
+
+    def part_checksum(self, index: int) -> str:
+        checksum = hashlib.sha256()
+        with self.open_part(index) as part:
+            for chunk in iter(lambda: part.read(PART_CHUNK_SIZE), b''):
+                checksum.update(chunk)
+        return checksum.hexdigest()
+
+    def upload_part(self, index: int, retry_policy: RetryPolicy, metrics=None):
+        checksum = self.part_checksum(index)
+        url = '{}/parts/{}'.format(self.url, index)
+        length = self.part_range(index)[1]
+
+        def send_once(request_id):
+            with self.open_part(index) as part:
+                return self.session.http.put(url, data=part, headers={
+                    consts.REQUEST_ID_HTTP_HEADER: request_id,
+                    consts.PART_SHA256_HTTP_HEADER: checksum,
+                })
+
+        corrupted = 0
+        while True:
+            request_id = str(uuid.uuid4())
+            start = time.perf_counter()
+            r = retry_policy.send(lambda retry: send_once(request_id), 'PUT', url, request_id, metrics=metrics)
+            if r.status_code == 200:
+                break
+            if error_code(r) != 'CHECKSUM_MISMATCH' or corrupted >= retry_policy.max_retries:
+                raise ApiError('fail to upload the part {} of {}'.format(index, self.model_path or self.digest), r)
+            corrupted += 1
+            logging.warning('the part {} of {} has been corrupted on the way, uploading it again'
+                            .format(index, self.model_path or self.digest))
+            if metrics is not None:
+                metrics.add_retry('PUT', url, request_id, 'CHECKSUM_MISMATCH')
+
+        if metrics is not None:
+            metrics.add_phase('upload', time.perf_counter() - start, length, api=consts.UPLOADS_API_PATH,
+                              request_id=request_id, part=index)
+        with self._lock:
+            self.parts.add(index)
+        self.save_checkpoint()
+
+    def upload_parts(self, parallel: int):
+        missing = [index for index in range(self.num_parts) if index not in self.parts]
+        if not missing:
+            return
+        retry_policy = getattr(self.session.http, 'retry_policy', None) or RetryPolicy(max_retries=0)
+        metrics = getattr(self.session, 'metrics', None)
+        # once a part has failed, the parts not started yet are skipped; the checkpoint keeps the others
+        failed = threading.Event()
+
+        def upload(index):
+            if failed.is_set():
+                return
+            try:
+                self.upload_part(index, retry_policy, metrics)
+            except BaseException:
+                failed.set()
+                raise
+
+        with ThreadPoolExecutor(max_workers=min(parallel, len(missing))) as executor:
+            futures = [executor.submit(upload, index) for index in missing]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            raise errors[0]
+
+    def complete(self):
+        r = self.session.http.post('{}/complete'.format(self.url))
+        if r.status_code != 200:
+            if error_code(r) == 'DIGEST_MISMATCH':
+                # the model has changed since it was hashed, so its parts are of no use
+                self.remove_checkpoint()
+            raise ApiError('fail to complete the upload of {}'.format(self.model_path or self.digest), r)
+        self.remove_checkpoint()
+
+
+class PartReader(object):
+    # a file-like reader of `length` bytes from `start` on, through read_at(offset, size)
+    def __init__(self, read_at: Callable[[int, int], bytes], start: int, length: int):
+        self.read_at = read_at
+        self.pos = start
+        self.end = start + length
+
+    def __len__(self):
+        return self.end - self.pos
+
+    def read(self, size: int = -1) -> bytes:
+        size = len(self) if size is None or size < 0 else min(size, len(self))
+        data = self.read_at(self.pos, size) if size > 0 else b''
+        self.pos += len(data)
+        return data
+
+
+def read_at(model_file, offset: int, size: int) -> bytes:
+    model_file.seek(offset)
+    return model_file.read(size)
+
+
+def error_code(response) -> Optional[str]:
+    try:
+        return response.json().get('error_code')
+    except (ValueError, AttributeError):
+        return None
+
+
+def upload_blob(session, model: ModelSource, digest: str, size: int, offset: int = 0, model_path: str = None) -> bool:
+    # Uploads the model into the blob store in parts, resuming an interrupted upload of the same model.
+    # Returns False when the server has no chunked uploads, for the caller to upload the model at once.
+    upload = ChunkedUpload(session, model, digest, size, offset, model_path)
+    checkpoint = upload.load_checkpoint()
+    if checkpoint is None or not upload.resume(checkpoint):
+        if not upload.start():
+            logging.debug('the server has no chunked uploads, uploading {} at once'.format(model_path or digest))
+            return False
+    logging.debug('uploading {} in {} parts of {} bytes (upload id: {})'
+                  .format(model_path or digest, upload.num_parts, upload.part_size, upload.upload_id))
+    upload.upload_parts(session.upload_parallel_parts)
+    upload.complete()
+    session.known_blobs.add(digest)
+    return True
+
@@ -0,0 +1,219 @@
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from furiosacli.cache import file_digest
+from furiosacli.exceptions import CliError
+
+DEFAULT_DEBOUNCE = 0.3
+POLL_INTERVAL = 0.5
+
+# inotify(7): the events of a file being written, replaced (editors save into a new file and rename it) or removed
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher(object):
+    # Watches the directories of the files, so a file replaced by a rename is still watched. wait() blocks in
+    # select() until the kernel reports an event, without polling the files.
+    def __init__(self, paths: List[str]):
+        self.paths = {os.path.abspath(path) for path in paths}
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            wd = self.libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, 'cannot watch {}: {}'.format(directory, os.strerror(errno)))
+            self.dirs[wd] = directory
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        # the watched files changed until an event arrives or the timeout expires
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+                offset += length
+                path = os.path.join(self.dirs.get(wd, ''), name)
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher(object):
+    # the fallback where inotify is unavailable: compares the size and mtime of the files every `interval` seconds
+    def __init__(self, paths: List[str], interval: float = POLL_INTERVAL):
+        self.paths = {os.path.abspath(path) for path in paths}
+        self.interval = interval
+        self.stats = self.stat_all()
+
+    def stat_all(self) -> Dict[str, Optional[tuple]]:
+        stats = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stats[path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            stats = self.stat_all()
+            changed = {path for path in self.paths if stats[path] != self.stats[path]}
+            self.stats = stats
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else max(min(self.interval, deadline - time.monotonic()), 0))
+
+    def close(self):
+        pass
+
+
+def create_watcher(paths: List[str]):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            logging.warning('inotify is unavailable ({}), polling the watched files instead'.format(e))
+    return PollingWatcher(paths)
+
+
+def content_digest(paths: List[str]) -> str:
+    # a missing file (e.g. in the middle of an editor's save) has a digest of its own
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode())
+        digest.update(b'\0')
+        try:
+            digest.update(file_digest(path).encode())
+        except OSError:
+            digest.update(b'missing')
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class WatchLoop(object):
+    # Runs build(stop) once, and again whenever the content of the watched files changes. Bursts of writes are
+    # debounced, a save leaving the bytes as they were is skipped, and a build still running when a newer version
+    # appears is stopped (its compile task is cancelled on the server) before the newer version is built.
+    def __init__(self, paths: List[str], build: Callable[[threading.Event], None], debounce: float = DEFAULT_DEBOUNCE,
+                 quiet: bool = False, watcher=None, stream=None):
+        if debounce < 0:
+            raise CliError('--debounce must not be negative')
+        self.paths = [os.path.abspath(path) for path in paths]
+        for path in self.paths:
+            if not os.path.isfile(path):
+                raise CliError('cannot watch {}: no such file'.format(path))
+        self.build = build
+        self.debounce = debounce
+        self.quiet = quiet
+        self.watcher = watcher
+        self.stream = stream or sys.stderr
+        self.thread = None
+        self.stop = None
+        self.digest = None
+        self.builds = 0
+
+    def message(self, msg: str):
+        if not self.quiet:
+            self.stream.write(msg + '\n')
+            self.stream.flush()
+
+    def run_build(self, stop: threading.Event):
+        try:
+            self.build(stop)
+        except CliError as e:
+            if not stop.is_set():
+                self.message('ERROR: {}'.format(e.message))
+        except Exception as e:
+            if not stop.is_set():
+                logging.exception(e)
+                self.message('ERROR: {}'.format(e))
+        if stop.is_set():
+            self.message('the build has been superseded by a newer version')
+
+    def start_build(self, digest: str):
+        self.cancel_build()
+        self.digest = digest
+        self.builds += 1
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run_build, args=(self.stop,), name='furiosa-watch', daemon=True)
+        self.thread.start()
+
+    def cancel_build(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.stop.set()
+            self.thread.join()
+
+    def wait_change(self) -> Set[str]:
+        # blocks until a change, then until no write has come for `debounce` seconds
+        changed = self.watcher.wait()
+        while True:
+            more = self.watcher.wait(self.debounce)
+            if not more:
+                return changed
+            changed |= more
+
+    def poll(self) -> bool:
+        # handles one change of the watched files; True when a new build has been started
+        changed = self.wait_change()
+        digest = content_digest(self.paths)
+        if digest == self.digest:
+            logging.debug('{} changed without a change of the content'.format(', '.join(sorted(changed))))
+            return False
+        self.message('{} changed, rebuilding'.format(', '.join(sorted(os.path.basename(path) for path in changed))))
+        self.start_build(digest)
+        return True
+
+    def run(self, max_builds: int = None) -> int:
+        if self.watcher is None:
+            self.watcher = create_watcher(self.paths)
+        self.message('watching {} (Ctrl-C to stop)'.format(', '.join(self.paths)))
+        try:
+            self.start_build(content_digest(self.paths))
+            while max_builds is None or self.builds < max_builds:
+                self.poll()
+            if self.thread is not None:
+                self.thread.join()
+        except KeyboardInterrupt:
+            self.cancel_build()
+        finally:
+            self.watcher.close()
+        return 0
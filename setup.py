@@ -8,9 +8,16 @@ setup_requires = ["setuptools"]
 install_requires = [
     "pyyaml",
     "python-dotenv",
+    "requests",
     "requests-toolbelt",
+    "urllib3>=2",
     "furiosa-client"
 ]
+extras_require = {
+    "aio": ["aiohttp"],
+    "calibrate": ["numpy", "onnxruntime"],
+    "zstd": ["zstandard"]
+}
 
 here = os.path.abspath(os.path.dirname(__file__))
 
@@ -34,5 +41,6 @@ setup(
     packages=['furiosacli'],
     scripts = ['bin/furiosa'],
     setup_requires=setup_requires,
-    install_requires=install_requires
+    install_requires=install_requires,
+    extras_require=extras_require
 )
\ No newline at end of file
@@ -1,4 +1,49 @@
 import os
+import unittest
+
+from furiosacli import consts
+from furiosacli.fakeserver import FakeApiServer
+
 
 def test_data(relative_path) -> str:
-    return os.path.dirname(__file__) + "/../test_data/" + relative_path
\ No newline at end of file
+    return os.path.dirname(__file__) + "/../test_data/" + relative_path
+
+
+# the test modules import it, and it is no test of theirs
+test_data.__test__ = False
+
+
+def restore_environ(saved):
+    os.environ.clear()
+    os.environ.update(saved)
+
+
+class EnvironTestCase(unittest.TestCase):
+    # os.environ is saved before every test and restored after its tearDown, so the variables a test sets
+    # (endpoint, credentials, cache dir, upload options, ...) never leak into the next one
+    def setUp(self):
+        self.addCleanup(restore_environ, dict(os.environ))
+        os.environ[consts.FURIOSA_ACCESS_KEY_ID_ENV] = 'test'
+        os.environ[consts.SECRET_ACCESS_KEY_ENV] = 'test'
+
+    @staticmethod
+    def use_server(server: FakeApiServer):
+        # the sessions created from now on talk to the server
+        os.environ[consts.FURIOSA_API_ENDPOINT_ENV] = server.endpoint
+
+
+class FakeServerTestCase(EnvironTestCase):
+    # A FakeApiServer of `server_options` runs for the whole class, and every test talks to it
+    server_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeApiServer(**cls.server_options).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        super().setUp()
+        self.use_server(self.server)
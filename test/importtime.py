@@ -0,0 +1,32 @@
+import subprocess
+import sys
+from typing import Dict, List
+
+# Startup path of the CLI up to argument parsing: what `furiosa --help` and argument errors pay for
+STARTUP_CODE = 'import furiosacli.clidriver as clidriver; clidriver.argparser.create_argparser()'
+
+# Dependencies which must only be imported by the commands that need them
+HEAVY_MODULES = ['requests', 'requests_toolbelt', 'urllib3', 'yaml', 'dotenv', 'furiosa', 'numpy',
+                 'onnxruntime', 'aiohttp']
+
+
+def measure_imports(code: str = STARTUP_CODE) -> Dict[str, int]:
+    # Runs `code` in a fresh interpreter with -X importtime and returns {module: cumulative import time in us}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True)
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def heavy_imports(imports: Dict[str, int]) -> List[str]:
+    return sorted(name for name in imports if name.split('.')[0] in HEAVY_MODULES)
+
+
+def package_import_time(imports: Dict[str, int]) -> int:
+    # top-level modules of the package, each cumulative time including everything it pulled in
+    return sum(cumulative for name, cumulative in imports.items() if name in ('furiosacli', 'furiosacli.clidriver'))
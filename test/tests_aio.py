@@ -0,0 +1,139 @@
+import asyncio
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from furiosacli import aio, __version__
+from furiosacli.clidriver import Session
+from furiosacli.commands import Perf
+from furiosacli.exceptions import ApiError, CliError
+from furiosacli.fakeserver import TOOLCHAINS_BODY
+from test import FakeServerTestCase, test_data
+
+
+@unittest.skipIf(aio.aiohttp is None, 'aiohttp is not installed')
+class AsyncSessionTests(FakeServerTestCase):
+    server_options = {'latency': 0.05}
+
+    def setUp(self):
+        super().setUp()
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_concurrent_calls(self):
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                return await asyncio.gather(session.version(),
+                                            session.toolchain_list(),
+                                            *[session.optimize(b'model') for _ in range(10)])
+
+        results = asyncio.run(run())
+        self.assertIn('version', results[0])
+        self.assertEqual([toolchain['version'] for toolchain in TOOLCHAINS_BODY],
+                         [toolchain['version'] for toolchain in results[1]])
+        self.assertEqual([b'fake result of /api/v1/dss/optimize'] * 10, results[2:])
+
+    def optimize_retried(self, model) -> bytes:
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                return await session.optimize(model)
+
+        self.server.fail_first = 1
+        self.server.retry_after = 0
+        try:
+            result = asyncio.run(run())
+        finally:
+            self.server.fail_first = 0
+            self.server.retry_after = None
+        self.assertEqual(1, len(self.session.metrics.retries))
+        return result
+
+    def test_retried_upload_from_path(self):
+        self.assertEqual(b'fake result of /api/v1/dss/optimize', self.optimize_retried(test_data('test.onnx')))
+
+    def test_retried_upload_from_file(self):
+        with open(test_data('test.onnx'), 'rb') as model:
+            model.read(16)
+            self.assertEqual(b'fake result of /api/v1/dss/optimize', self.optimize_retried(model))
+            # the file of the caller stays open, and both attempts sent it from the position it had
+            self.assertFalse(model.closed)
+            self.assertEqual(os.path.getsize(test_data('test.onnx')), model.tell())
+
+    def test_perf_with_toolchain(self):
+        toolchains = (__version__, __version__ + '-next')
+
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                return await asyncio.gather(*[session.perf(b'model', api_path='perf', toolchain=toolchain)
+                                              for toolchain in toolchains])
+
+        estimates = asyncio.run(run())
+        # the same estimates as the blocking perf requests of perf-diff
+        self.assertEqual([Perf.perf_request(self.session, b'model', api_path='api/v1/perf', toolchain=toolchain)
+                          .content for toolchain in toolchains], estimates)
+        self.assertNotEqual(estimates[0], estimates[1])
+
+    def test_compile(self):
+        self.server.compile_time = 0.2
+
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                tasks = await asyncio.gather(*[session.compile(b'model', target_ir='lir,enf', model_path='model.onnx')
+                                               for _ in range(3)])
+                return tasks, [await task.get_ir('enf') for task in tasks]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tasks, irs = asyncio.run(run())
+            for task, ir in zip(tasks, irs):
+                self.assertIsInstance(task, aio.AsyncCompileTask)
+                self.assertTrue(task.is_succeeded())
+                self.assertEqual('fake ir of {} (enf)'.format(task.task_id).encode(), ir)
+
+            async def save():
+                async with aio.AsyncSession(self.session) as session:
+                    task = await session.compile(b'model', model_path='model.onnx')
+                    return task, await task.save_artifact('compiler-report', os.path.join(tmp_dir, 'report.txt'))
+
+            task, size = asyncio.run(save())
+            with open(os.path.join(tmp_dir, 'report.txt'), 'rb') as report:
+                self.assertEqual('fake compiler-report of {}'.format(task.task_id).encode(), report.read())
+            self.assertEqual(os.path.getsize(os.path.join(tmp_dir, 'report.txt')), size)
+
+    def test_cancelled_compile(self):
+        self.server.compile_time = 10
+        num_tasks = len(self.server.compile_tasks)
+
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                await asyncio.wait_for(session.compile(b'model', model_path='model.onnx'), 0.3)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+        tasks = list(self.server.compile_tasks.values())[num_tasks:]
+        self.assertEqual(['cancelled'], [task.phase for task in tasks])
+
+    @unittest.skipIf(importlib.util.find_spec('furiosa') is not None, 'furiosa.client is installed')
+    def test_compile_without_compile_tasks_api(self):
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                await session.compile(b'model', model_path='model.onnx')
+
+        self.server.compile_tasks_api = False
+        try:
+            # the blocking furiosa.client path is taken, which is not installed here
+            with self.assertRaises(CliError):
+                asyncio.run(run())
+        finally:
+            self.server.compile_tasks_api = True
+
+    def test_api_error(self):
+        async def run():
+            async with aio.AsyncSession(self.session) as session:
+                await session.get_json('unknown', 'get unknown')
+
+        with self.assertRaises(ApiError) as context:
+            asyncio.run(run())
+        self.assertIn('NOT_FOUND', context.exception.message)
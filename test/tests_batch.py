@@ -0,0 +1,93 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli import consts
+from furiosacli.argparser import create_argparser
+from furiosacli.batch import ThreadOutput, parse_request
+from furiosacli.clidriver import CLIDriver, Session
+from furiosacli.exceptions import CliError
+from test import FakeServerTestCase
+
+
+class ParseRequestTests(unittest.TestCase):
+    def test_command_line(self):
+        self.assertEqual((3, ['perfeye', 'a b.onnx', '-o', 'out.html']),
+                         parse_request('furiosa perfeye "a b.onnx" -o out.html\n', 3))
+        self.assertIsNone(parse_request('  \n', 1))
+        self.assertIsNone(parse_request('# version\n', 1))
+
+    def test_json(self):
+        self.assertEqual(('a', ['toolchain', 'list']), parse_request('{"id": "a", "args": ["toolchain", "list"]}', 1))
+        self.assertEqual((2, ['version']), parse_request('{"command": "version"}', 2))
+        with self.assertRaises(CliError):
+            parse_request('{"id": "a"}', 1)
+        with self.assertRaises(CliError):
+            parse_request('{"id": ', 1)
+
+    def test_thread_output(self):
+        fallback = io.StringIO()
+        output = ThreadOutput(fallback)
+        output.write('before ')
+        output.capture()
+        output.write('captured')
+        self.assertEqual('captured', output.release())
+        output.write('after')
+        self.assertEqual('before after', fallback.getvalue())
+
+
+class RunBatchTests(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.environ[consts.FURIOSA_CACHE_DIR_ENV] = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_batch(self, commands: str, *argv, jobs: int = 1) -> (int, list):
+        commands_path = os.path.join(self.tmp_dir.name, 'commands.txt')
+        with open(commands_path, 'w') as commands_file:
+            commands_file.write(commands)
+        args = create_argparser().parse_args(argv + ('run-batch', commands_path, '-j', str(jobs)))
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = CLIDriver(args, vars(args)).run()
+        return exit_code, [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_results(self):
+        exit_code, results = self.run_batch('version\n\n{"id": "tc", "args": ["toolchain", "list"]}\n')
+        self.assertEqual(0, exit_code)
+        self.assertEqual([1, 'tc'], [result['id'] for result in results])
+        self.assertIn('Client version', results[0]['output'])
+        self.assertIn('Available Toolchains', results[1]['output'])
+        self.assertTrue(all(result['exit_code'] == 0 and result['error'] is None for result in results))
+
+    def test_failures(self):
+        exit_code, results = self.run_batch('bogus\nrun-batch\njobs status unknown\nversion\n', '-q')
+        self.assertEqual(1, exit_code)
+        self.assertEqual([2, 2, 2, 0], [result['exit_code'] for result in results])
+        self.assertTrue(all(result['error'] for result in results[:3]))
+
+    def test_concurrency_and_metrics(self):
+        metrics_path = os.path.join(self.tmp_dir.name, 'metrics.json')
+        exit_code, results = self.run_batch('version\n' * 8, '--metrics-json', metrics_path, jobs=4)
+        self.assertEqual(0, exit_code)
+        self.assertEqual(8, len(results))
+        with open(metrics_path, 'r') as metrics_file:
+            self.assertEqual(8, len(json.load(metrics_file)['requests']))
+
+    def test_fork(self):
+        with Session() as session:
+            forked = session.fork()
+            self.assertIs(session.http, forked.http)
+            self.assertIsNot(session.metrics, forked.metrics)
+            forked.close()
+            self.assertIsNotNone(session.http.adapters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import tempfile
+import unittest
+
+from furiosacli import cache, consts
+from furiosacli.argparser import create_argparser
+from furiosacli.cache import ResultCache, parse_size
+from furiosacli.clidriver import CLIDriver, Session
+from furiosacli.commands import BuildCalibrationModel, Optimize, Perfeye, Quantize
+from furiosacli.exceptions import CliError
+from furiosacli.fakeserver import VERSION_BODY
+from test import FakeServerTestCase
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.tmp_dir.name, 'cache'), parse_size('1M'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_file(self, name: str, content: bytes) -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return path
+
+    def test_parse_size(self):
+        self.assertEqual(512, parse_size('512'))
+        self.assertEqual(512 * 1024 ** 2, parse_size('512M'))
+        self.assertEqual(2 * 1024 ** 3, parse_size('2GiB'))
+        with self.assertRaises(CliError):
+            parse_size('two gigabytes')
+
+    def test_file_digests_are_bounded(self):
+        path = self.write_file('model.tflite', b'model')
+        digest = cache.file_digest(path)
+        for idx in range(cache.FILE_DIGESTS_CACHE_SIZE + 10):
+            os.utime(path, ns=(idx, idx))
+            cache.file_digest(path)
+        self.assertEqual(digest, cache.file_digest(path))
+        self.assertLessEqual(cache._file_digest.cache_info().currsize, cache.FILE_DIGESTS_CACHE_SIZE)
+
+        self.write_file('model.tflite', b'other')
+        self.assertNotEqual(digest, cache.file_digest(path))
+
+    def test_key_depends_on_model_and_params(self):
+        model = self.write_file('model.tflite', b'model')
+        same_model = self.write_file('same_model.tflite', b'model')
+        other_model = self.write_file('other_model.tflite', b'other')
+
+        key = ResultCache.make_key('compile', model, 'config', 'enf')
+        self.assertEqual(key, ResultCache.make_key('compile', same_model, 'config', 'enf'))
+        self.assertNotEqual(key, ResultCache.make_key('compile', other_model, 'config', 'enf'))
+        self.assertNotEqual(key, ResultCache.make_key('compile', model, 'config', 'lir'))
+        self.assertNotEqual(key, ResultCache.make_key('api/v1/perfeye', model, 'config', 'enf'))
+
+    def test_put_and_get(self):
+        model = self.write_file('model.tflite', b'model')
+        ir = self.write_file('output.enf', b'ir')
+        key = ResultCache.make_key('compile', model)
+
+        self.assertIsNone(self.cache.get(key, ['ir']))
+        self.cache.put(key, {'ir': ir})
+
+        artifacts = self.cache.get(key, ['ir'])
+        with open(artifacts['ir'], 'rb') as file:
+            self.assertEqual(b'ir', file.read())
+        self.assertIsNone(self.cache.get(key, ['ir', 'compiler_report']))
+        self.assertEqual(1, self.cache.stats()['entries'])
+
+    def test_evict_least_recently_used(self):
+        artifact = self.write_file('artifact', b'x' * 400 * 1024)
+        keys = [ResultCache.make_key('compile', artifact, idx) for idx in range(3)]
+
+        self.cache.put(keys[0], {'ir': artifact})
+        self.cache.put(keys[1], {'ir': artifact})
+        os.utime(self.cache.entry_path(keys[0]), (1, 1))
+        os.utime(self.cache.entry_path(keys[1]), (2, 2))
+        self.cache.get(keys[0], ['ir'])
+        self.cache.put(keys[2], {'ir': artifact})
+
+        self.assertIsNotNone(self.cache.get(keys[0], ['ir']))
+        self.assertIsNone(self.cache.get(keys[1], ['ir']))
+        self.assertIsNotNone(self.cache.get(keys[2], ['ir']))
+
+    def test_prune_and_clear(self):
+        artifact = self.write_file('artifact', b'x' * 1024)
+        for idx in range(3):
+            self.cache.put(ResultCache.make_key('compile', artifact, idx), {'ir': artifact})
+
+        self.assertEqual(2, self.cache.prune(1024))
+        self.assertEqual(1, self.cache.stats()['entries'])
+        self.assertEqual(1, self.cache.clear())
+        self.assertEqual(0, self.cache.stats()['entries'])
+
+
+class ServerVersionTests(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as model:
+            model.write(b'model')
+        os.environ[consts.FURIOSA_CACHE_DIR_ENV] = os.path.join(self.tmp_dir.name, 'cache')
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.version_body = dict(VERSION_BODY)
+        self.tmp_dir.cleanup()
+
+    def cache_key(self, *argv) -> str:
+        args = create_argparser().parse_args(argv + ('perfeye', self.model_path))
+        return Perfeye(self.session, args, vars(args)).cache_key('api/v1/perfeye', self.model_path)
+
+    def version_requests(self) -> int:
+        return len([request for request in self.session.metrics.requests if request['url'].endswith('/version')])
+
+    def test_key_follows_server_version(self):
+        key = self.cache_key()
+        self.assertEqual(key, self.cache_key())
+        self.assertEqual(1, self.version_requests())
+
+        # an upgrade is only noticed once the fetched version has expired
+        self.server.version_body['version'] = 'upgraded'
+        self.assertEqual(key, self.cache_key())
+        self.session.server_version_ttl = 0
+        self.assertNotEqual(key, self.cache_key())
+        self.assertEqual(2, self.version_requests())
+
+    def test_no_request_without_cache(self):
+        self.cache_key('--no-cache')
+        self.assertEqual(0, self.version_requests())
+
+    def perfeye(self) -> int:
+        args = create_argparser().parse_args(['-q', 'perfeye', self.model_path, '-o',
+                                              os.path.join(self.tmp_dir.name, 'perfeye.html')])
+        return CLIDriver(args, vars(args)).run()
+
+    def test_cache_hit_sends_no_request(self):
+        self.assertEqual(0, self.perfeye())
+        num_requests = len(self.server.request_ids)
+        # a later command reuses the version stored in the cache along with the result
+        self.assertEqual(0, self.perfeye())
+        self.assertEqual(num_requests, len(self.server.request_ids))
+
+    def test_version_kept_while_server_does_not_tell(self):
+        key = self.cache_key()
+        # as when the server cannot be reached, the version fetched last keeps finding the cached results
+        self.session.server_version_ttl = 0
+        self.server.version_body = {}
+        self.assertEqual(key, self.cache_key())
+        self.assertEqual(2, self.version_requests())
+
+    def test_dss_commands_return_zero(self):
+        ranges_path = os.path.join(self.tmp_dir.name, 'ranges.json')
+        with open(ranges_path, 'w') as ranges_file:
+            ranges_file.write('{"input": [0.0, 1.0]}')
+        for command, argv in ((Optimize, ['optimize']), (BuildCalibrationModel, ['build_calibration_model']),
+                              (Quantize, ['quantize', '--dynamic-ranges', ranges_path])):
+            output_path = os.path.join(self.tmp_dir.name, 'output.onnx')
+            args = create_argparser().parse_args(argv[:1] + [self.model_path, '-o', output_path] + argv[1:])
+            # a cache miss and a cache hit
+            self.assertEqual([0, 0], [command(self.session, args, vars(args)).run() for _ in range(2)])
+
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from furiosacli import calibration
+from test import test_data
+
+
+@unittest.skipIf(calibration.np is None or calibration.onnxruntime is None,
+                 'numpy and onnxruntime are not installed')
+class CalibrationTests(unittest.TestCase):
+    test_onnx_model = test_data('test.onnx')
+
+    def setUp(self):
+        np = calibration.np
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+        session = calibration.onnxruntime.InferenceSession(self.test_onnx_model,
+                                                           providers=['CPUExecutionProvider'])
+        model_input = session.get_inputs()[0]
+        shape = [dim if isinstance(dim, int) else 1 for dim in model_input.shape]
+
+        rng = np.random.default_rng(0)
+        self.samples = rng.random([8] + shape[1:], dtype=np.float32)
+        self.dataset_file = os.path.join(self.tmp_dir.name, 'dataset.npy')
+        np.save(self.dataset_file, self.samples)
+
+        self.dataset_dir = os.path.join(self.tmp_dir.name, 'dataset')
+        os.mkdir(self.dataset_dir)
+        for idx, sample in enumerate(self.samples):
+            np.save(os.path.join(self.dataset_dir, '{:04d}.npy'.format(idx)), sample)
+
+        self.input_name = model_input.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_calibrate(self):
+        ranges, _, num_samples = calibration.calibrate(self.test_onnx_model, self.dataset_file, batch_size=3)
+        self.assertEqual(8, num_samples)
+        self.assertAlmostEqual(float(self.samples.min()), ranges[self.input_name][0], places=6)
+        self.assertAlmostEqual(float(self.samples.max()), ranges[self.input_name][1], places=6)
+
+        dir_ranges, _, dir_num_samples = calibration.calibrate(self.test_onnx_model, self.dataset_dir)
+        self.assertEqual(8, dir_num_samples)
+        self.assertEqual(ranges, dir_ranges)
+
+    def test_calibrate_npz(self):
+        np = calibration.np
+        ranges, _, _ = calibration.calibrate(self.test_onnx_model, self.dataset_file, batch_size=3)
+        for save in (np.savez, np.savez_compressed):
+            npz_file = os.path.join(self.tmp_dir.name, 'dataset.npz')
+            save(npz_file, self.samples)
+            npz_ranges, _, num_samples = calibration.calibrate(self.test_onnx_model, npz_file, batch_size=3,
+                                                               workers=2)
+            self.assertEqual(8, num_samples)
+            self.assertEqual(ranges, npz_ranges)
+
+    def test_read_npz_samples(self):
+        np = calibration.np
+        npz_file = os.path.join(self.tmp_dir.name, 'arrays.npz')
+        samples = np.arange(60, dtype=np.float32).reshape(10, 2, 3)
+        for save in (np.savez, np.savez_compressed):
+            save(npz_file, c_order=samples, fortran_order=np.asfortranarray(samples))
+            with zipfile.ZipFile(npz_file) as npz:
+                for name in ('c_order.npy', 'fortran_order.npy'):
+                    np.testing.assert_array_equal(samples[3:7], calibration.read_npz_samples(npz, name, 3, 7))
+                    np.testing.assert_array_equal(samples[8:], calibration.read_npz_samples(npz, name, 8, 12))
+
+    def test_calibrate_with_workers(self):
+        ranges, histograms, _ = calibration.calibrate(self.test_onnx_model, self.dataset_file, batch_size=2,
+                                                      histogram_bins=16)
+        parallel_ranges, parallel_histograms, num_samples = calibration.calibrate(
+            self.test_onnx_model, self.dataset_file, batch_size=2, workers=2, histogram_bins=16)
+        self.assertEqual(8, num_samples)
+        self.assertEqual(ranges, parallel_ranges)
+        self.assertEqual(set(ranges), set(parallel_histograms))
+        for name, histogram in histograms.items():
+            self.assertAlmostEqual(sum(histogram['counts']), sum(parallel_histograms[name]['counts']), places=3)
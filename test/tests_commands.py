@@ -124,6 +124,21 @@ class CommandTests(unittest.TestCase):
             "thread \'main\' panicked at \'cannot load compiler config from a file.",
             str(result.stderr))
 
+    def test_compile_batch(self):
+        output_dir = '/tmp/{}'.format(uuid.uuid4())
+        result = subprocess.run(['furiosa',
+                                 'compile',
+                                 '--batch', test_data('*.tflite'),
+                                 '--config', self.compiler_config,
+                                 '-j', '2',
+                                 '-o', output_dir,
+                                 ],
+                                capture_output=True)
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertIn('1 of 1 models compiled', str(result.stdout))
+        self.assert_file_created('{}/MNISTnet_uint8_quant_without_softmax.enf'.format(output_dir))
+        os.rmdir(output_dir)
+
     def test_perfeye(self):
         output_path = '/tmp/{}.html'.format(uuid.uuid4())
         result = subprocess.run(['furiosa',
@@ -191,6 +206,22 @@ class CommandTests(unittest.TestCase):
         self.assert_file_created(optimized_model_path)
         self.assert_file_created(quantized_model_path)
 
+    def test_pipeline(self):
+        output_path = '/tmp/{}.enf'.format(uuid.uuid4())
+        perfeye_path = '/tmp/{}.html'.format(uuid.uuid4())
+        result = subprocess.run(['furiosa',
+                                 'pipeline',
+                                 self.test_onnx_model,
+                                 '--dynamic-ranges', self.test_dynamic_ranges,
+                                 '--perfeye', perfeye_path,
+                                 '-o', output_path,
+                                 ],
+                                capture_output=True)
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertIn('{} has been generated'.format(output_path), str(result.stdout))
+        self.assert_file_created(output_path)
+        self.assert_file_created(perfeye_path)
+
     def test_build_calibration_model(self):
         output_path = '/tmp/{}.onnx'.format(uuid.uuid4())
         result = subprocess.run(['furiosa',
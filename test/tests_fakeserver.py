@@ -0,0 +1,70 @@
+import json
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from furiosacli import consts
+from furiosacli.fakeserver import FakeApiServer
+
+
+class FakeApiServerTests(unittest.TestCase):
+    def request(self, server, path, method='GET', data=None):
+        request = urllib.request.Request('{}/{}'.format(server.endpoint, path), data=data, method=method)
+        with urllib.request.urlopen(request) as r:
+            return r.read()
+
+    def test_version(self):
+        with FakeApiServer() as server:
+            self.assertIn('version', json.loads(self.request(server, 'version')))
+
+    def test_payload_size(self):
+        with FakeApiServer(payload_size=100 * 1024) as server:
+            body = self.request(server, 'api/v1/dss/optimize', 'POST', b'model')
+            self.assertEqual(100 * 1024, len(body))
+            self.assertTrue(body.startswith(b'fake result of /api/v1/dss/optimize'))
+
+    def test_failure_rate(self):
+        with FakeApiServer(failure_rate=1.0) as server:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.request(server, 'version')
+            self.assertEqual(503, context.exception.code)
+
+    def test_compile_task(self):
+        with FakeApiServer(compile_time=0.2) as server:
+            task = json.loads(self.request(server, consts.COMPILE_TASKS_API_PATH, 'POST', b'model'))
+            self.assertEqual('running', task['phase'])
+            task_path = '{}/{}'.format(consts.COMPILE_TASKS_API_PATH, task['task_id'])
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.request(server, task_path + '/ir')
+            self.assertEqual(409, context.exception.code)
+
+            time.sleep(0.3)
+            self.assertEqual('succeeded', json.loads(self.request(server, task_path))['phase'])
+            for artifact in consts.COMPILE_TASK_ARTIFACTS:
+                self.assertTrue(self.request(server, '{}/{}'.format(task_path, artifact)))
+
+    def test_cancel_compile_task(self):
+        with FakeApiServer(compile_time=10) as server:
+            task = json.loads(self.request(server, consts.COMPILE_TASKS_API_PATH, 'POST', b'model'))
+            task_path = '{}/{}'.format(consts.COMPILE_TASKS_API_PATH, task['task_id'])
+            self.assertEqual('cancelled', json.loads(self.request(server, task_path, 'DELETE'))['phase'])
+            self.assertEqual('cancelled', json.loads(self.request(server, task_path))['phase'])
+
+    def test_compile_tasks_api(self):
+        with FakeApiServer() as server:
+            task = json.loads(self.request(server, consts.COMPILE_TASKS_API_PATH, 'POST', b'model'))
+            self.assertEqual([task['task_id']],
+                             [listed['task_id'] for listed in json.loads(self.request(server,
+                                                                                      consts.COMPILE_TASKS_API_PATH))])
+        with FakeApiServer(compile_tasks_api=False) as server:
+            for method, body in (('GET', None), ('POST', b'model')):
+                with self.assertRaises(urllib.error.HTTPError) as context:
+                    self.request(server, consts.COMPILE_TASKS_API_PATH, method, body)
+                self.assertEqual(404, context.exception.code)
+
+    def test_failed_compile_task(self):
+        with FakeApiServer(task_failure_rate=1.0) as server:
+            task = json.loads(self.request(server, consts.COMPILE_TASKS_API_PATH, 'POST', b'model'))
+            self.assertEqual('failed', task['phase'])
+            self.assertTrue(task['error_message'])
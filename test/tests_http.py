@@ -0,0 +1,267 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import NewConnectionError
+
+from furiosacli import compression, consts, http
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver, Session
+from furiosacli.exceptions import ApiError
+from furiosacli.fakeserver import FakeApiServer, fake_perf_csv
+from test import EnvironTestCase
+
+
+class FakeResponse(object):
+    def __init__(self, chunks, fail_after: int = None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for idx, chunk in enumerate(self.chunks):
+            if self.fail_after is not None and idx >= self.fail_after:
+                raise ConnectionError('connection reset')
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class SaveResponseTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.tmp_dir.name, 'output.onnx')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_response(self):
+        response = FakeResponse([b'a' * 10, b'b' * 10, b'c'])
+        self.assertEqual(21, http.save_response(response, self.output_path))
+        self.assertTrue(response.closed)
+        with open(self.output_path, 'rb') as file:
+            self.assertEqual(b'a' * 10 + b'b' * 10 + b'c', file.read())
+        self.assertEqual(['output.onnx'], os.listdir(self.tmp_dir.name))
+
+    def test_keep_previous_output_on_failure(self):
+        with open(self.output_path, 'wb') as file:
+            file.write(b'previous')
+
+        response = FakeResponse([b'a', b'b'], fail_after=1)
+        with self.assertRaises(ConnectionError):
+            http.save_response(response, self.output_path)
+
+        self.assertTrue(response.closed)
+        with open(self.output_path, 'rb') as file:
+            self.assertEqual(b'previous', file.read())
+        self.assertEqual(['output.onnx'], os.listdir(self.tmp_dir.name))
+
+
+class RetryPolicyTests(EnvironTestCase):
+    def setUp(self):
+        super().setUp()
+        os.environ[consts.FURIOSA_HTTP_RETRY_BACKOFF_ENV] = '0.01'
+
+    def session(self, server) -> Session:
+        self.use_server(server)
+        return Session()
+
+    def test_backoff(self):
+        policy = http.RetryPolicy(max_retries=5, backoff_factor=1.0, max_backoff=3.0)
+        self.assertTrue(1.0 <= policy.backoff(1) <= 2.0)
+        self.assertTrue(2.0 <= policy.backoff(2) <= 3.0)
+        self.assertEqual(3.0, policy.backoff(5))
+        self.assertEqual(7.0, http.parse_retry_after('7'))
+        self.assertEqual(0.0, http.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+        self.assertIsNone(http.parse_retry_after('soon'))
+
+    def test_retry_upload_with_the_same_request_id(self):
+        with FakeApiServer(fail_first=2, retry_after=0) as server, self.session(server) as session:
+            r = http.post_model(session, 'api/v1/perfeye', b'model', 'model.onnx', 'estimate the performance')
+            self.assertEqual(200, r.status_code)
+            self.assertEqual(3, len(server.request_ids))
+            self.assertEqual(1, len(set(server.request_ids)))
+            self.assertEqual(['503', '503'], [retry['reason'] for retry in session.metrics.retries])
+            # every attempt uploads the model again
+            self.assertEqual(3, len([phase for phase in session.metrics.phases if phase['phase'] == 'upload']))
+
+    def test_give_up(self):
+        with FakeApiServer(fail_first=10) as server, self.session(server) as session:
+            with self.assertRaises(ApiError):
+                http.post_model(session, 'api/v1/perfeye', b'model', 'model.onnx', 'estimate the performance')
+            self.assertEqual(consts.DEFAULT_HTTP_MAX_RETRIES + 1, len(server.request_ids))
+
+    def test_connect_retries_of_uploads(self):
+        # a refused connection is retried by send() alone for an upload, and by the adapter for anything else
+        attempts = []
+
+        def refuse(connection):
+            attempts.append(connection.host)
+            raise NewConnectionError(connection, 'refused')
+
+        with FakeApiServer() as server, self.session(server) as session, \
+                mock.patch.object(HTTPConnection, '_new_conn', refuse):
+            with self.assertRaises(requests.ConnectionError):
+                http.post_model(session, 'api/v1/perfeye', b'model', 'model.onnx', 'estimate the performance')
+            self.assertEqual(consts.DEFAULT_HTTP_MAX_RETRIES + 1, len(attempts))
+            self.assertEqual(consts.DEFAULT_HTTP_MAX_RETRIES, len(session.metrics.retries))
+
+            del attempts[:]
+            with self.assertRaises(requests.ConnectionError):
+                session.http.get('{}/version'.format(server.endpoint))
+            self.assertEqual(consts.DEFAULT_HTTP_MAX_RETRIES + 1, len(attempts))
+
+    def test_retry_get(self):
+        with FakeApiServer(fail_first=2) as server, self.session(server) as session:
+            self.assertEqual(200, session.http.get('{}/version'.format(server.endpoint)).status_code)
+            self.assertEqual(1, len(set(server.request_ids)))
+            self.assertEqual(2, len(session.metrics.retries))
+
+
+class UploadDedupTests(EnvironTestCase):
+    def setUp(self):
+        super().setUp()
+        # a server of its own for every test, as the tests count the bytes it receives and the blobs it has
+        self.server = FakeApiServer().start()
+        self.addCleanup(self.server.stop)
+        self.use_server(self.server)
+        os.environ[consts.FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV] = '1K'
+        self.model = os.urandom(1024 * 1024)
+
+    def post(self, session, model=None):
+        return http.post_model(session, 'api/v1/perfeye', self.model if model is None else model, 'model.onnx',
+                               'estimate the performance')
+
+    def test_upload_once(self):
+        with Session() as session:
+            self.post(session)
+            uploaded = self.server.received_bytes
+            self.assertGreater(uploaded, len(self.model))
+            self.post(session)
+            self.assertLess(self.server.received_bytes - uploaded, 4096)
+
+        # another process asks the server first
+        with Session() as session:
+            self.post(session)
+            self.assertLess(self.server.received_bytes - uploaded, 2 * 4096)
+
+    def test_upload_again_when_the_server_lost_the_model(self):
+        with Session() as session:
+            self.post(session)
+            self.server.blobs.clear()
+            uploaded = self.server.received_bytes
+            self.assertEqual(200, self.post(session).status_code)
+            self.assertGreater(self.server.received_bytes - uploaded, len(self.model))
+
+    def test_small_models_and_off(self):
+        with Session() as session:
+            self.post(session, b'small model')
+            self.assertEqual(set(), self.server.blobs)
+
+        os.environ[consts.FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV] = 'off'
+        with Session() as session:
+            self.post(session)
+            self.post(session)
+            self.assertEqual(set(), self.server.blobs)
+            self.assertGreater(self.server.received_bytes, 2 * len(self.model))
+
+    def test_server_without_blob_api(self):
+        self.server.blobs_api = False
+        with Session() as session:
+            for _ in range(3):
+                self.assertEqual(200, self.post(session).status_code)
+            # the api is probed once, no model is checked for, and no digest is sent
+            heads = [request['url'] for request in session.metrics.requests if request['method'] == 'HEAD']
+            self.assertEqual(['{}/{}'.format(self.server.endpoint, consts.BLOBS_API_PATH)], heads)
+            self.assertEqual([None] * 3, self.server.source_digests)
+            self.assertGreater(self.server.received_bytes, 3 * len(self.model))
+
+
+class CompressionTests(EnvironTestCase):
+    def setUp(self):
+        super().setUp()
+        os.environ[consts.FURIOSA_UPLOAD_DEDUP_MIN_SIZE_ENV] = 'off'
+        self.model = b'\0\1\2\3' * 256 * 1024
+
+    def session(self, server, compression: str) -> Session:
+        self.use_server(server)
+        session = Session()
+        session.compression = compression
+        return session
+
+    def post(self, session):
+        return http.post_model(session, 'api/v1/perf', self.model, 'model.onnx', 'estimate the performance',
+                               fields={'compiler_config': 'a: 1'})
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual({'gzip', 'zstd'}, compression.parse_accept_encoding('zstd, gzip;q=0.5, br;q=0'))
+        self.assertEqual('gzip', compression.upload_encoding('gzip', None))
+        self.assertIsNone(compression.upload_encoding('auto', None))
+        self.assertEqual('gzip', compression.upload_encoding('auto', {'gzip'}))
+        self.assertIsNone(compression.upload_encoding('gzip', {'identity'}))
+        self.assertIsNone(compression.upload_encoding('none', {'gzip'}))
+
+    def test_compressed_upload_and_download(self):
+        with FakeApiServer(encodings=['gzip'], payload_size=1024 * 1024) as server, \
+                self.session(server, 'gzip') as session:
+            r = self.post(session)
+            self.assertEqual(200, r.status_code)
+            self.assertEqual(1024 * 1024, len(r.content))
+            self.assertEqual('gzip', r.headers['Content-Encoding'])
+            # the form fields survive the compression
+            self.assertEqual(fake_perf_csv('a: 1', '{}'), r.content[:len(fake_perf_csv('a: 1', '{}'))])
+            self.assertLess(server.received_bytes, len(self.model) // 10)
+            upload = next(phase for phase in session.metrics.phases if phase['phase'] == 'upload')
+            self.assertEqual('gzip', upload['encoding'])
+            self.assertLess(upload['wire_bytes'], upload['bytes'])
+
+    def test_auto_compresses_once_the_server_has_told(self):
+        with FakeApiServer(encodings=['gzip']) as server, self.session(server, 'auto') as session:
+            self.post(session)
+            self.assertGreater(server.received_bytes, len(self.model))
+            self.post(session)
+            self.assertLess(server.received_bytes, len(self.model) * 1.1)
+
+    def test_fall_back_on_unsupported_encoding(self):
+        with FakeApiServer(encodings=[]) as server, self.session(server, 'gzip') as session:
+            self.assertEqual(200, self.post(session).status_code)
+            self.assertEqual([415, 200], [request['status'] for request in session.metrics.requests])
+            # the server has told it accepts no encodings
+            self.post(session)
+            self.assertEqual([415, 200, 200], [request['status'] for request in session.metrics.requests])
+
+    def test_accept_encoding(self):
+        # zstd is only asked for when urllib3 decodes it, which it may not even with zstandard installed
+        self.assertEqual(', '.join(compression.decodable_encodings()), compression.accept_encoding('auto'))
+        self.assertEqual('gzip', compression.accept_encoding('gzip'))
+        self.assertEqual('identity', compression.accept_encoding('none'))
+
+    @unittest.skipUnless(compression.zstd_available(), 'zstd needs the zstandard package')
+    def test_zstd_artifacts_are_decoded(self):
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                FakeApiServer(payload_size=1024 * 1024) as server:
+            self.use_server(server)
+            model_path = os.path.join(tmp_dir, 'model.onnx')
+            with open(model_path, 'wb') as model_file:
+                model_file.write(self.model)
+            for compression_mode in ('auto', 'zstd'):
+                for argv, output_path in ((['compile', model_path, '--poll-interval', '0.05'], 'output.enf'),
+                                          (['perfeye', model_path], 'output.html')):
+                    output_path = os.path.join(tmp_dir, output_path)
+                    args = create_argparser().parse_args(['-q', '--no-cache', '--compression', compression_mode]
+                                                         + argv + ['-o', output_path])
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        self.assertEqual(0, CLIDriver(args, vars(args)).run())
+                    self.assertEqual(1024 * 1024, os.path.getsize(output_path))
+
+    def test_no_compression(self):
+        with FakeApiServer(payload_size=1024 * 1024) as server, self.session(server, 'none') as session:
+            r = self.post(session)
+            self.assertNotIn('Content-Encoding', r.headers)
+            self.assertGreater(server.received_bytes, len(self.model))
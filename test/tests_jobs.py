@@ -0,0 +1,119 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from furiosacli import consts, jobs
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver
+from furiosacli.exceptions import CliError
+from furiosacli.jobs import JobLedger
+from test import FakeServerTestCase
+
+
+class JobLedgerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.ledger = JobLedger(os.path.join(self.tmp_dir.name, 'furiosa', 'jobs.jsonl'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_record(self):
+        self.ledger.record('abc123', phase='running', source='a.onnx', submitted_at=1)
+        self.ledger.record('def456', phase='running', source='b.onnx', submitted_at=2)
+        self.ledger.record('abc123', phase='succeeded')
+
+        self.assertEqual(['abc123', 'def456'], [job['job_id'] for job in self.ledger.list()])
+        job = self.ledger.get('abc123')
+        self.assertEqual('succeeded', job['phase'])
+        self.assertEqual('a.onnx', job['source'])
+
+    def test_prefix(self):
+        self.ledger.record('abc123')
+        self.ledger.record('abd456')
+        self.assertEqual('abc123', self.ledger.get('abc')['job_id'])
+        with self.assertRaises(CliError):
+            self.ledger.get('ab')
+        with self.assertRaises(CliError):
+            self.ledger.get('xyz')
+
+    def test_prune(self):
+        for idx, phase in enumerate(['running', 'succeeded', 'failed', 'succeeded']):
+            self.ledger.record('job{}'.format(idx), phase='running', source='{}.onnx'.format(idx), submitted_at=idx)
+            self.ledger.record('job{}'.format(idx), phase=phase)
+
+        # the unfinished job is kept however old it is
+        self.assertEqual(2, self.ledger.prune(1))
+        self.assertEqual(['job0', 'job3'], [job['job_id'] for job in self.ledger.list()])
+        self.assertEqual('3.onnx', self.ledger.get('job3')['source'])
+        with open(self.ledger.path, 'r') as ledger:
+            self.assertEqual(2, len(ledger.readlines()))
+
+    def test_prune_on_write(self):
+        ledger = jobs.JobLedger(self.ledger.path, max_jobs=2)
+        prune_size = jobs.PRUNE_SIZE
+        jobs.PRUNE_SIZE = 4096
+        try:
+            for idx in range(100):
+                ledger.record('job{:03d}'.format(idx), phase='succeeded', submitted_at=idx)
+        finally:
+            jobs.PRUNE_SIZE = prune_size
+        self.assertLessEqual(os.path.getsize(ledger.path), 4096)
+        self.assertEqual('job099', ledger.list()[-1]['job_id'])
+
+    def test_skip_corrupted_lines(self):
+        self.ledger.record('abc123', phase='running')
+        with open(self.ledger.path, 'a') as ledger:
+            ledger.write('{"job_id": "trunc')
+        self.assertEqual(['abc123'], [job['job_id'] for job in self.ledger.list()])
+
+
+class DetachedJobTests(FakeServerTestCase):
+    server_options = {'compile_time': 0.3}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as model:
+            model.write(b'model')
+        os.environ[consts.FURIOSA_JOBS_FILE_ENV] = os.path.join(self.tmp_dir.name, 'jobs.jsonl')
+        os.environ[consts.FURIOSA_CACHE_DIR_ENV] = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def furiosa(self, *argv) -> (int, str):
+        args = create_argparser().parse_args(argv)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = CLIDriver(args, vars(args)).run()
+        return exit_code, stdout.getvalue()
+
+    def test_detach_wait_fetch(self):
+        output_path = os.path.join(self.tmp_dir.name, 'model.enf')
+        exit_code, job_id = self.furiosa('compile', self.model_path, '-o', output_path, '--detach')
+        job_id = job_id.strip()
+        self.assertEqual(0, exit_code)
+        self.assertFalse(os.path.exists(output_path))
+
+        with self.assertRaises(CliError):
+            self.furiosa('jobs', 'fetch', job_id)
+
+        exit_code, listed = self.furiosa('jobs', 'list')
+        self.assertIn(job_id, listed)
+        self.assertEqual(0, self.furiosa('jobs', 'wait', job_id[:8], '--poll-interval', '0.05')[0])
+        self.assertIn('succeeded', self.furiosa('jobs', 'status', job_id)[1])
+
+        self.assertEqual(0, self.furiosa('jobs', 'fetch', job_id)[0])
+        for path in (output_path,
+                     os.path.join(self.tmp_dir.name, 'model.compiler_report.txt'),
+                     os.path.join(self.tmp_dir.name, 'model.mem_alloc_report.html')):
+            self.assertTrue(os.path.isfile(path), path)
+
+        exit_code, output = self.furiosa('jobs', 'prune', '--keep', '0')
+        self.assertEqual(0, exit_code)
+        self.assertIn('1 jobs have been removed', output)
+        self.assertNotIn(job_id, self.furiosa('jobs', 'list')[1])
@@ -0,0 +1,73 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver
+from furiosacli.metrics import Metrics
+from test import FakeServerTestCase
+
+
+class MetricsTests(unittest.TestCase):
+    def test_phases(self):
+        metrics = Metrics()
+        with metrics.phase('download', path='a') as phase:
+            phase['bytes'] += 10
+        metrics.add_phase('download', 0.5, 5)
+        metrics.add_phase('upload', 0.25, 100)
+
+        totals = metrics.totals()
+        self.assertEqual(15, totals['download']['bytes'])
+        self.assertEqual(2, totals['download']['count'])
+        self.assertEqual(0.25, totals['upload']['elapsed_secs'])
+        self.assertEqual('a', metrics.phases[0]['path'])
+
+    def test_openmetrics(self):
+        metrics = Metrics()
+        metrics.add_phase('upload', 0.25, 100)
+        metrics.add_request('POST', 'http://localhost/api/v1/perf', 200, 'id', 0.3, 100)
+        text = metrics.to_openmetrics('perf', 0)
+        self.assertIn('furiosa_phase_bytes_total{command="perf",phase="upload"} 100', text)
+        self.assertIn('furiosa_http_requests_total{command="perf",status="200"} 1', text)
+        self.assertTrue(text.endswith('# EOF\n'))
+
+
+class CommandMetricsTests(FakeServerTestCase):
+    server_options = {'compile_time': 0.2, 'payload_size': 1024 * 1024}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as model:
+            model.write(b'\0' * 4096)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_compile_metrics(self):
+        metrics_path = os.path.join(self.tmp_dir.name, 'metrics.json')
+        openmetrics_path = os.path.join(self.tmp_dir.name, 'metrics.txt')
+        args = create_argparser().parse_args([
+            '-q', '--no-cache', '--metrics-json', metrics_path, '--metrics-openmetrics', openmetrics_path,
+            'compile', self.model_path, '-o', os.path.join(self.tmp_dir.name, 'output.enf'),
+            '--poll-interval', '0.05'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(0, CLIDriver(args, vars(args)).run())
+
+        with open(metrics_path) as metrics_file:
+            metrics = json.load(metrics_file)
+        self.assertEqual('compile', metrics['command'])
+        self.assertEqual(0, metrics['exit_code'])
+        for phase in ('config', 'upload', 'server', 'download'):
+            self.assertIn(phase, metrics['totals'])
+        self.assertGreaterEqual(metrics['totals']['server']['elapsed_secs'], 0.2)
+        self.assertGreaterEqual(metrics['totals']['download']['bytes'], 1024 * 1024)
+        self.assertGreater(metrics['totals']['upload']['bytes'], 4096)
+        self.assertTrue(all(request['request_id'] for request in metrics['requests']))
+
+        with open(openmetrics_path) as openmetrics_file:
+            self.assertIn('furiosa_command_duration_seconds{command="compile"}', openmetrics_file.read())
@@ -0,0 +1,146 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli import __version__, consts, perfdata
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver
+from furiosacli.exceptions import CliError
+from furiosacli.perfdata import PerfTable
+from test import FakeServerTestCase
+
+PERF_CSV = b'operator,op_type,cycles,latency_us\nconv_0,Conv,1000,1.5\nrelu_1,Relu,500,0.5\nadd_2,Add,,\n'
+
+
+class PerfTableTests(unittest.TestCase):
+    def test_from_csv(self):
+        table = PerfTable.from_csv(PERF_CSV)
+        self.assertEqual(3, len(table))
+        self.assertEqual(['operator', 'op_type', 'cycles', 'latency_us'], table.names)
+        self.assertTrue(table.is_numeric('cycles'))
+        self.assertFalse(table.is_numeric('op_type'))
+        self.assertEqual('latency_us', table.latency_column())
+        self.assertEqual(2.0, table.total('latency_us'))
+        self.assertEqual([0, 1], table.top_k('latency_us', 5))
+        self.assertEqual({'operator': 'add_2', 'op_type': 'Add', 'cycles': None, 'latency_us': None}, table.row(2))
+        with self.assertRaises(CliError):
+            table.column('unknown')
+
+    def test_total_row(self):
+        table = PerfTable.from_csv(PERF_CSV + b'total,,1600,2.1\n')
+        self.assertEqual(3, len(table))
+        self.assertEqual(2.1, table.total('latency_us'))
+
+    def test_json_round_trip(self):
+        table = PerfTable.from_json(json.dumps(PerfTable.from_csv(PERF_CSV).to_dict()).encode())
+        self.assertEqual(3, len(table))
+        self.assertEqual(1500.0, table.total('cycles'))
+        self.assertEqual('Conv', table.row(0)['op_type'])
+
+
+class PerfDiffTests(unittest.TestCase):
+    def test_diff_tables(self):
+        baseline = PerfTable.from_csv(PERF_CSV)
+        candidate = PerfTable.from_csv(b'operator,cycles,latency_us\nconv_0,1000,3.0\nmul_3,10,0.1\n')
+        diff = perfdata.diff_tables(baseline, candidate)
+        self.assertEqual(['cycles', 'latency_us'], diff['columns'])
+        self.assertEqual({'baseline': 2, 'candidate': 3.1, 'change': 0.55}, diff['totals']['latency_us'])
+        self.assertEqual(['conv_0'], [operator['operator'] for operator in diff['operators']])
+        self.assertEqual(1.0, diff['operators'][0]['latency_us']['change'])
+        self.assertEqual(['mul_3'], diff['added'])
+        self.assertEqual(['add_2', 'relu_1'], diff['removed'])
+
+        self.assertEqual(['latency_us'], perfdata.regressions(diff, ['latency_us', 'cycles'], 0.5))
+        self.assertEqual([], perfdata.regressions(diff, ['latency_us'], 0.6))
+
+
+class PerfCommandTests(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as model:
+            model.write(b'model')
+        os.environ[consts.FURIOSA_CACHE_DIR_ENV] = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def furiosa(self, *argv) -> (int, str):
+        args = create_argparser().parse_args(argv)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = CLIDriver(args, vars(args)).run()
+        return exit_code, stdout.getvalue()
+
+    def test_perf(self):
+        csv_path = os.path.join(self.tmp_dir.name, 'perf.csv')
+        json_path = os.path.join(self.tmp_dir.name, 'perf.json')
+        self.assertEqual(0, self.furiosa('perf', self.model_path, '-o', csv_path)[0])
+        exit_code, output = self.furiosa('perf', self.model_path, '-o', json_path, '--top', '3')
+        self.assertEqual(0, exit_code)
+        self.assertIn('(cached)', output)
+        self.assertIn('total latency_us', output)
+
+        csv_table = PerfTable.load(csv_path)
+        json_table = PerfTable.load(json_path)
+        self.assertEqual(len(csv_table), len(json_table))
+        self.assertAlmostEqual(csv_table.total('latency_us'), json_table.total('latency_us'))
+
+    def test_perf_diff(self):
+        baseline_path = os.path.join(self.tmp_dir.name, 'baseline.json')
+        diff_path = os.path.join(self.tmp_dir.name, 'diff.json')
+        exit_code, output = self.furiosa('perf-diff', self.model_path, '--baseline-toolchain', __version__,
+                                         '--candidate-toolchain', __version__ + '-next', '--threshold', '10000',
+                                         '--baseline-file', baseline_path, '-o', diff_path)
+        self.assertEqual(0, exit_code)
+        self.assertIn('no regression', output)
+        with open(diff_path, 'r') as diff_file:
+            self.assertEqual(['latency_us', 'sram_bytes'], json.load(diff_file)['gated'])
+
+        # a stored baseline twice as fast makes the candidate regress
+        with open(baseline_path, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        for operator in baseline['operators']:
+            operator['latency_us'] /= 2
+        baseline['totals']['latency_us'] /= 2
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file)
+        exit_code, output = self.furiosa('perf-diff', self.model_path, '--baseline-file', baseline_path,
+                                         '--candidate-toolchain', __version__)
+        self.assertEqual(1, exit_code)
+        self.assertIn('REGRESSION: latency_us', output)
+
+    def test_mismatched_baseline(self):
+        baseline_path = os.path.join(self.tmp_dir.name, 'baseline.json')
+        exit_code, _ = self.furiosa('perf-diff', self.model_path, '--baseline-toolchain', __version__,
+                                    '--candidate-toolchain', __version__ + '-next', '--threshold', '10000',
+                                    '--baseline-file', baseline_path)
+        self.assertEqual(0, exit_code)
+        with open(baseline_path, 'r') as baseline_file:
+            self.assertEqual(__version__, json.load(baseline_file)['metadata']['toolchain'])
+
+        with self.assertRaisesRegex(CliError, 'toolchain'):
+            self.furiosa('perf-diff', self.model_path, '--baseline-toolchain', __version__ + '-next',
+                         '--baseline-file', baseline_path)
+        config_path = os.path.join(self.tmp_dir.name, 'compiler_config.yml')
+        with open(config_path, 'w') as config_file:
+            config_file.write('keep_unsignedness: true\n')
+        with self.assertRaisesRegex(CliError, 'compiler config'):
+            self.furiosa('perf-diff', self.model_path, '--config', config_path, '--baseline-file', baseline_path)
+        with open(self.model_path, 'wb') as model:
+            model.write(b'another model')
+        with self.assertRaisesRegex(CliError, 'model digest'):
+            self.furiosa('perf-diff', self.model_path, '--baseline-file', baseline_path)
+
+    def test_unknown_toolchain(self):
+        with self.assertRaises(CliError):
+            self.furiosa('perf', self.model_path, '--toolchain', 'unknown', '-o',
+                         os.path.join(self.tmp_dir.name, 'perf.csv'))
+
+
+if __name__ == '__main__':
+    unittest.main()
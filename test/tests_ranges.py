@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli import ranges
+from furiosacli.exceptions import CliError
+
+
+class RangesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_json(self, name: str, content) -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as file:
+            json.dump(content, file)
+        return path
+
+    def test_merge_minmax(self):
+        shard_a = self.write_json('a.json', {'input': [0.0, 0.5], '5': [-1.0, 1.0]})
+        shard_b = self.write_json('b.json', {'input': [-0.5, 0.25], 'output': [0.0, 2.0]})
+
+        merged, histograms = ranges.merge_dynamic_ranges([shard_a, shard_b, {'5': (-2.0, 0.0)}])
+        self.assertEqual({'input': (-0.5, 0.5), '5': (-2.0, 1.0), 'output': (0.0, 2.0)}, merged)
+        self.assertEqual({}, histograms)
+
+    def test_rebin_keeps_counts(self):
+        histogram = {'range': [0.0, 4.0], 'counts': [1, 2, 3, 4]}
+        self.assertEqual([1.0, 2.0, 3.0, 4.0], ranges.rebin(histogram, 0.0, 4.0, 4))
+        self.assertEqual([3.0, 7.0], ranges.rebin(histogram, 0.0, 4.0, 2))
+        self.assertEqual([0.0, 0.0, 1.0, 2.0, 3.0, 4.0, 0.0, 0.0], ranges.rebin(histogram, -2.0, 6.0, 8))
+
+    def test_merge_percentile(self):
+        shard_a = self.write_json('a.json', {'x': {'range': [0.0, 10.0], 'counts': [100] * 10}})
+        shard_b = self.write_json('b.json', {'x': {'range': [0.0, 100.0], 'counts': [0] * 9 + [1]}})
+
+        minmax, histograms = ranges.merge_dynamic_ranges([shard_a, shard_b])
+        self.assertEqual({'x': (0.0, 100.0)}, minmax)
+        self.assertAlmostEqual(1001, sum(histograms['x']['counts']))
+
+        clipped, _ = ranges.merge_dynamic_ranges([shard_a, shard_b], method='percentile', percentile=99.0)
+        low, high = clipped['x']
+        self.assertLess(low, 1.0)
+        self.assertLess(high, 20.0)
+
+    def test_percentile_requires_histograms(self):
+        shard = self.write_json('a.json', {'x': [0.0, 1.0]})
+        with self.assertRaises(CliError):
+            ranges.merge_dynamic_ranges([shard], method='percentile')
@@ -0,0 +1,115 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli import reports
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver
+
+MEMORY_REPORT = '''<html><body>
+<div>computation/total: 750/1000(=0.75)</div>
+<script>
+var data = [
+  {"name": "pe#0:exe#0", "text": ["[pe#0:exe#0:T1] [0, 100) [0, 64)", "[pe#0:exe#0:T2] [50, 200) [64, 192)"]},
+  {"name": "weight tensors", "text": ["[pe#0:exe#0:T3] [100, 300) [0, 32)", "[pe#0:exe#0:T1] [0, 100) [0, 64)"]}
+];
+</script>
+</body></html>
+'''
+
+COMPILER_REPORT = '''compiler passes
+| ConvertToLir | 1.5 ms |
+LowerLoops: 2 s
+Schedule elapsed 250 us
+total passes: 3
+'''
+
+
+class ParseReportTests(unittest.TestCase):
+    def test_memory_report(self):
+        table = reports.parse_memory_report(MEMORY_REPORT)
+        self.assertEqual(['pe#0:exe#0:T1', 'pe#0:exe#0:T2', 'pe#0:exe#0:T3'], table.column('tensor'))
+        self.assertEqual([64, 128, 32], list(table.column('size')))
+        self.assertEqual([100, 150, 200], list(table.column('lifetime')))
+        self.assertIsNone(reports.parse_memory_report(COMPILER_REPORT))
+
+    def test_peak_usage(self):
+        usage = reports.peak_usage(reports.parse_memory_report(MEMORY_REPORT))
+        # T1 [0, 100) and T2 [50, 200) are live at once from cycle 50, so the peak is T1 + T2 = 192 bytes at cycle 50;
+        # T1 is freed at cycle 100 before T3 is allocated, and T2 + T3 = 160 bytes stay below it
+        self.assertEqual(192, usage['peak_bytes'])
+        self.assertEqual(50, usage['peak_cycle'])
+        self.assertEqual(192, usage['footprint_bytes'])
+        self.assertEqual(0.0, usage['fragmentation'])
+
+    def test_compiler_report(self):
+        table = reports.parse_compiler_report(COMPILER_REPORT)
+        self.assertEqual(['ConvertToLir', 'LowerLoops', 'Schedule'], table.column('pass'))
+        self.assertEqual([1.5, 2000.0, 0.25], list(table.column('elapsed_ms')))
+        self.assertIsNone(reports.parse_compiler_report('no passes here'))
+
+
+class ReportSummarizeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for idx in range(3):
+            self.write('model{}.mem_alloc_report.html'.format(idx), MEMORY_REPORT.replace('[64, 192)', '[64, {})'
+                                                                                          .format(192 + idx)))
+            self.write('model{}.compiler_report.txt'.format(idx), COMPILER_REPORT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name: str, content: str) -> str:
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as report_file:
+            report_file.write(content)
+        return path
+
+    def summarize(self, *argv) -> (int, str):
+        args = create_argparser().parse_args(('-q', 'report', 'summarize') + argv)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = CLIDriver(args, vars(args)).run()
+        return exit_code, stdout.getvalue()
+
+    def test_json(self):
+        output_path = os.path.join(self.tmp_dir.name, 'summary.json')
+        exit_code, _ = self.summarize(os.path.join(self.tmp_dir.name, '*'), '-o', output_path, '-k', '2', '-j', '2')
+        self.assertEqual(0, exit_code)
+        with open(output_path, 'r') as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(6, summary['summary']['reports'])
+        self.assertEqual(194, summary['summary']['max_peak_bytes'])
+        self.assertEqual([130, 129], [buffer['size'] for buffer in summary['summary']['top_buffers']])
+        self.assertEqual(['LowerLoops', 'ConvertToLir'],
+                         [total['pass'] for total in summary['summary']['slowest_passes']])
+        self.assertEqual(6000.0, summary['summary']['slowest_passes'][0]['total_ms'])
+        memory = [report for report in summary['reports'] if report['kind'] == 'memory']
+        self.assertEqual(0.75, memory[0]['utilization'])
+
+    def test_csv_and_errors(self):
+        self.write('empty.txt', 'nothing to see')
+        output_path = os.path.join(self.tmp_dir.name, 'summary.csv')
+        exit_code, _ = self.summarize(os.path.join(self.tmp_dir.name, '*.*'), '-o', output_path, '-j', '1')
+        self.assertEqual(1, exit_code)
+        with open(output_path, 'r', newline='') as summary_file:
+            rows = list(csv.DictReader(summary_file))
+        self.assertEqual(7, len(rows))
+        self.assertEqual(['', 'compiler', 'memory', 'compiler', 'memory', 'compiler', 'memory'],
+                         [row['kind'] for row in rows])
+        self.assertTrue(rows[0]['error'])
+
+    def test_table(self):
+        exit_code, output = self.summarize(os.path.join(self.tmp_dir.name, 'model0.mem_alloc_report.html'))
+        self.assertEqual(0, exit_code)
+        self.assertIn('largest buffers:', output)
+        self.assertIn('pe#0:exe#0:T2', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,19 @@
+import unittest
+
+from test import importtime
+
+# Cumulative import time of furiosacli up to argument parsing, in microseconds
+STARTUP_BUDGET_US = 100 * 1000
+
+
+class StartupTests(unittest.TestCase):
+    def test_no_heavy_imports_on_startup(self):
+        imports = importtime.measure_imports()
+        self.assertEqual([], importtime.heavy_imports(imports))
+
+    def test_startup_budget(self):
+        # the fastest of a few runs, to keep the budget stable on noisy machines
+        elapsed = min(importtime.package_import_time(importtime.measure_imports()) for _ in range(3))
+        self.assertLess(elapsed, STARTUP_BUDGET_US,
+                        'importing furiosacli takes {:.1f} ms, over the budget of {:.1f} ms'
+                        .format(elapsed / 1000, STARTUP_BUDGET_US / 1000))
@@ -0,0 +1,101 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from furiosacli import consts, perfdata, sweep
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import CLIDriver
+from furiosacli.exceptions import CliError
+from test import FakeServerTestCase
+
+
+class SweepGridTests(unittest.TestCase):
+    def test_expand_grid(self):
+        points = sweep.expand_grid({'compiler_config.a': [1, 2], 'target_npu_spec.b.c': [True, False, None]})
+        self.assertEqual(6, len(points))
+        self.assertEqual({'compiler_config.a': 1, 'target_npu_spec.b.c': True}, points[0])
+
+    def test_apply_point(self):
+        point = {'compiler_config.a': 1, 'target_npu_spec.b.c': 2}
+        base = {'b': {'d': 3}}
+        self.assertEqual({'b': {'c': 2, 'd': 3}}, sweep.apply_point(base, 'target_npu_spec', point))
+        self.assertEqual({'b': {'d': 3}}, base)
+        self.assertEqual({'a': 1}, sweep.apply_point({}, 'compiler_config', point))
+
+    def test_total_latency(self):
+        data = b'operator,op_type,cycles,latency_us\nconv_0,Conv,1000,1.5\nrelu_1,Relu,500,0.5\n'
+        self.assertEqual(('latency_us', 2.0), perfdata.total_latency(data))
+        self.assertEqual(('cycles', 1500.0), perfdata.total_latency(data, 'cycles'))
+        self.assertEqual(('latency_us', 7.0), perfdata.total_latency(data + b'total,,,7.0\n'))
+        with self.assertRaises(CliError):
+            perfdata.total_latency(data, 'unknown')
+
+
+class SweepCommandTests(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(self.model_path, 'wb') as model:
+            model.write(b'model')
+        self.grid_path = os.path.join(self.tmp_dir.name, 'sweep.yml')
+        with open(self.grid_path, 'w') as grid:
+            grid.write('compiler_config:\n  a: [1, 2, 3]\ntarget_npu_spec:\n  dram.bandwidth: [32, 64]\n')
+        os.environ[consts.FURIOSA_CACHE_DIR_ENV] = os.path.join(self.tmp_dir.name, 'cache')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def furiosa(self, *argv) -> (int, str):
+        args = create_argparser().parse_args(argv)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = CLIDriver(args, vars(args)).run()
+        return exit_code, stdout.getvalue()
+
+    def test_grid(self):
+        output_path = os.path.join(self.tmp_dir.name, 'sweep.csv')
+        self.assertEqual(0, self.furiosa('sweep', self.model_path, '--grid', self.grid_path, '-o', output_path)[0])
+        with open(output_path, 'r') as output:
+            rows = list(csv.DictReader(output))
+        self.assertEqual(6, len(rows))
+        latencies = [float(row['latency_us']) for row in rows]
+        self.assertEqual(sorted(latencies), latencies)
+        self.assertEqual(['1', '2', '3', '4', '5', '6'], [row['rank'] for row in rows])
+
+        # every point is cached now
+        json_path = os.path.join(self.tmp_dir.name, 'sweep.json')
+        self.assertEqual(0, self.furiosa('sweep', self.model_path, '--grid', self.grid_path, '-o', json_path)[0])
+        with open(json_path, 'r') as output:
+            results = json.load(output)['results']
+        self.assertTrue(all(result['cached'] for result in results))
+        self.assertEqual(latencies, [result['latency'] for result in results])
+
+    def test_greedy(self):
+        output_path = os.path.join(self.tmp_dir.name, 'sweep.json')
+        self.assertEqual(0, self.furiosa('--no-cache', 'sweep', self.model_path, '--grid', self.grid_path,
+                                         '-o', output_path, '--search', 'greedy')[0])
+        with open(output_path, 'r') as output:
+            results = json.load(output)['results']
+        # 3 + 2 values, of which the starting point is shared
+        self.assertEqual(4, len(results))
+
+    def test_samples_and_patience(self):
+        output_path = os.path.join(self.tmp_dir.name, 'sweep.json')
+        self.furiosa('--no-cache', 'sweep', self.model_path, '--grid', self.grid_path, '-o', output_path,
+                     '--samples', '3', '--seed', '1')
+        with open(output_path, 'r') as output:
+            self.assertEqual(3, len(json.load(output)['results']))
+
+        self.furiosa('--no-cache', 'sweep', self.model_path, '--grid', self.grid_path, '-o', output_path,
+                     '--patience', '1', '-j', '1')
+        with open(output_path, 'r') as output:
+            self.assertLess(len(json.load(output)['results']), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
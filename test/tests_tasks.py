@@ -0,0 +1,211 @@
+import importlib.util
+import os
+import tempfile
+import threading
+
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import Session
+from furiosacli.commands import Compile
+from furiosacli.exceptions import CliError
+from furiosacli.fakeserver import FakeApiServer
+from furiosacli.tasks import ClientCompileTask, TaskPoller, compile_tasks_api, submit_compile
+from test import EnvironTestCase, FakeServerTestCase
+
+
+class TaskPollerTests(FakeServerTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.model_path = os.path.join(cls.tmp_dir.name, 'model.onnx')
+        with open(cls.model_path, 'wb') as model:
+            model.write(b'model')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        self.session = Session()
+        self.server.compile_time = 0.2
+        self.server.task_failure_rate = 0.0
+
+    def tearDown(self):
+        self.session.close()
+
+    def submit(self):
+        return submit_compile(self.session, self.model_path, '~', '~', 'enf')
+
+    def test_submit_and_wait(self):
+        task = Compile.submit_and_wait(self.session, self.model_path, '~', '~', 'enf',
+                                       poller=TaskPoller(interval=0.05, quiet=True))
+        self.assertTrue(task.is_succeeded())
+
+        output_path = os.path.join(self.tmp_dir.name, 'output.enf')
+        Compile.write_outputs(task, {'enf': output_path})
+        with open(output_path, 'rb') as output:
+            self.assertEqual('fake ir of {} (enf)'.format(task.task_id).encode(), output.read())
+
+    def test_multiple_target_irs(self):
+        num_tasks = len(self.server.compile_tasks)
+        task = Compile.submit_and_wait(self.session, self.model_path, '~', '~', 'lir,enf',
+                                       poller=TaskPoller(interval=0.05, quiet=True))
+        self.assertEqual(num_tasks + 1, len(self.server.compile_tasks))
+
+        ir_paths = Compile.ir_paths('lir,enf', os.path.join(self.tmp_dir.name, 'model.enf'))
+        self.assertEqual({'lir': os.path.join(self.tmp_dir.name, 'model.lir'),
+                          'enf': os.path.join(self.tmp_dir.name, 'model.enf')}, ir_paths)
+        Compile.write_outputs(task, ir_paths)
+        for target_ir, path in ir_paths.items():
+            with open(path, 'rb') as output:
+                self.assertEqual('fake ir of {} ({})'.format(task.task_id, target_ir).encode(), output.read())
+
+    def test_wait_many(self):
+        tasks = [self.submit() for _ in range(10)]
+        finished = []
+        TaskPoller(interval=0.05, quiet=True).wait(tasks, on_finished=finished.append)
+        self.assertEqual(sorted(task.task_id for task in tasks), sorted(task.task_id for task in finished))
+        self.assertTrue(all(task.is_succeeded() for task in tasks))
+
+    def test_batch_bounded_by_jobs(self):
+        batch_dir = os.path.join(self.tmp_dir.name, 'batch')
+        os.makedirs(batch_dir)
+        for idx in range(5):
+            with open(os.path.join(batch_dir, 'model{}.onnx'.format(idx)), 'wb') as model:
+                model.write('model {}'.format(idx).encode())
+        args = create_argparser().parse_args(['-q', '--no-cache', 'compile', '--batch',
+                                              os.path.join(batch_dir, '*.onnx'), '-j', '2', '-o', batch_dir,
+                                              '--poll-interval', '0.05'])
+        num_tasks = len(self.server.compile_tasks)
+        self.assertEqual(0, Compile(self.session, args, vars(args)).run())
+
+        # a model is only submitted once the outputs of another one are written, so -j tasks run at most at once
+        tasks = list(self.server.compile_tasks.values())[num_tasks:]
+        self.assertEqual(5, len(tasks))
+        for task in tasks:
+            running = [other for other in tasks
+                       if other.submitted_at <= task.submitted_at < other.submitted_at + other.duration]
+            self.assertLessEqual(len(running), 2)
+        for idx in range(5):
+            self.assertTrue(os.path.isfile(os.path.join(batch_dir, 'model{}.enf'.format(idx))))
+
+    def test_failed_task(self):
+        self.server.task_failure_rate = 1.0
+        task = Compile.submit_and_wait(self.session, self.model_path, '~', '~', 'enf',
+                                       poller=TaskPoller(interval=0.05, quiet=True))
+        self.assertFalse(task.is_succeeded())
+        with self.assertRaises(CliError):
+            Compile.write_outputs(task, {'enf': os.path.join(self.tmp_dir.name, 'failed.enf')})
+
+    def test_timeout_cancels_tasks(self):
+        self.server.compile_time = 10
+        tasks = [self.submit() for _ in range(2)]
+        with self.assertRaises(CliError):
+            TaskPoller(interval=0.05, timeout=0.2, quiet=True).wait(tasks)
+        for task in tasks:
+            self.assertEqual('cancelled', task.refresh()['phase'])
+
+    def test_invalid_options(self):
+        with self.assertRaises(CliError):
+            TaskPoller(interval=0)
+        with self.assertRaises(CliError):
+            TaskPoller(interval=2, max_interval=1)
+        with self.assertRaises(CliError):
+            TaskPoller(timeout=0)
+
+
+class ClientTask(object):
+    # the task interface of furiosa.client the CLI relies on
+    def __init__(self, succeed: bool = True, cancellable: bool = True):
+        self.task_id = 'client-task'
+        self.succeed = succeed
+        self.done = threading.Event()
+        self.cancelled = False
+        if cancellable:
+            self.cancel = self.cancel_task
+
+    def wait_for_complete(self):
+        self.done.wait(10)
+
+    def cancel_task(self):
+        self.cancelled = True
+        self.done.set()
+
+    def is_succeeded(self) -> bool:
+        return self.succeed
+
+    def get_error_message(self) -> str:
+        return 'compile error'
+
+    def get_ir(self) -> bytes:
+        return b'ir'
+
+    def get_compiler_report(self) -> str:
+        return 'compiler report'
+
+    def get_memory_alloc_report(self) -> str:
+        return 'memory allocation report'
+
+
+class ClientCompileTaskTests(EnvironTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_probe(self):
+        for compile_tasks, expected in ((True, True), (False, False)):
+            with FakeApiServer(compile_tasks_api=compile_tasks) as server:
+                self.use_server(server)
+                with Session() as session:
+                    self.assertEqual(expected, compile_tasks_api(session))
+                    self.assertEqual(expected, compile_tasks_api(session))
+                    # probed once per session
+                    self.assertEqual(1, len(server.request_ids))
+                    if importlib.util.find_spec('furiosa') is None and not compile_tasks:
+                        with self.assertRaises(CliError):
+                            submit_compile(session, b'model', '~', '~', 'enf')
+
+    def test_succeeded(self):
+        client_task = ClientTask()
+        task = ClientCompileTask(None, client_task, 'model.onnx')
+        self.assertEqual('model.onnx', task.model_path)
+        self.assertEqual('running', task.refresh()['phase'])
+        client_task.done.set()
+        TaskPoller(interval=0.01, quiet=True).wait([task])
+        self.assertTrue(task.is_succeeded())
+
+        ir_paths = {'enf': os.path.join(self.tmp_dir.name, 'model.enf')}
+        report_path = os.path.join(self.tmp_dir.name, 'compiler_report.txt')
+        Compile.write_outputs(task, ir_paths, compiler_report_path=report_path)
+        with open(ir_paths['enf'], 'rb') as output:
+            self.assertEqual(b'ir', output.read())
+        with open(report_path, 'r') as output:
+            self.assertEqual('compiler report', output.read())
+
+    def test_failed(self):
+        client_task = ClientTask(succeed=False)
+        client_task.done.set()
+        task = ClientCompileTask(None, client_task)
+        TaskPoller(interval=0.01, quiet=True).wait([task])
+        self.assertEqual('failed', task.phase)
+        self.assertEqual('compile error', task.get_error_message())
+
+    def test_cancel(self):
+        client_task = ClientTask()
+        task = ClientCompileTask(None, client_task)
+        with self.assertRaises(CliError):
+            TaskPoller(interval=0.01, timeout=0.1, quiet=True).wait([task])
+        self.assertTrue(client_task.cancelled)
+        self.assertEqual('cancelled', task.refresh()['phase'])
+
+        # a client without cancel leaves the task running
+        client_task = ClientTask(cancellable=False)
+        task = ClientCompileTask(None, client_task)
+        with self.assertRaises(CliError):
+            task.cancel()
+        client_task.done.set()
@@ -0,0 +1,142 @@
+import io
+import mmap
+import os
+import tempfile
+import tracemalloc
+
+from furiosacli import consts
+from furiosacli.clidriver import Session
+from furiosacli.commands import Optimize
+from furiosacli.exceptions import ApiError
+from furiosacli.fakeserver import FakeApiServer
+from test import EnvironTestCase, FakeServerTestCase
+
+MODEL_SIZE = 64 * 1024 * 1024
+MAX_PEAK_MEMORY = 16 * 1024 * 1024
+
+
+class StreamingUploadTests(FakeServerTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.model_path = os.path.join(cls.tmp_dir.name, 'large.onnx')
+        with open(cls.model_path, 'wb') as model:
+            model.truncate(MODEL_SIZE)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.tmp_dir.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        # the streamed single-request upload is measured, so chunked uploads (and their state files) stay off
+        self.uploads_dir = tempfile.TemporaryDirectory()
+        os.environ[consts.FURIOSA_UPLOAD_CHUNKED_MIN_SIZE_ENV] = 'off'
+        os.environ[consts.FURIOSA_UPLOADS_DIR_ENV] = self.uploads_dir.name
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.uploads_dir.cleanup()
+
+    def assert_bounded_upload(self, model):
+        tracemalloc.start()
+        try:
+            result = Optimize.optimize(self.session, model, model_path='large.onnx')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(b'fake result of /api/v1/dss/optimize', result)
+        self.assertLess(peak, MAX_PEAK_MEMORY)
+
+    def test_upload_from_path(self):
+        self.assert_bounded_upload(self.model_path)
+
+    def test_upload_from_file(self):
+        with open(self.model_path, 'rb') as model:
+            self.assert_bounded_upload(model)
+
+    def test_upload_from_memoryview(self):
+        with open(self.model_path, 'rb') as model, \
+                mmap.mmap(model.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                self.assert_bounded_upload(view)
+            finally:
+                view.release()
+
+    def test_upload_from_bytes(self):
+        self.assertEqual(b'fake result of /api/v1/dss/optimize',
+                         Optimize.optimize(self.session, b'small model'))
+        self.assertEqual(b'fake result of /api/v1/dss/optimize',
+                         Optimize.optimize(self.session, io.BytesIO(b'small model')))
+
+
+class ChunkedUploadTests(EnvironTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.environ[consts.FURIOSA_UPLOAD_CHUNKED_MIN_SIZE_ENV] = '1M'
+        os.environ[consts.FURIOSA_UPLOAD_PART_SIZE_ENV] = '256K'
+        os.environ[consts.FURIOSA_UPLOADS_DIR_ENV] = os.path.join(self.tmp_dir.name, 'uploads')
+        # 9 parts, the last of them short
+        self.model = os.urandom(2 * 1024 * 1024 + 1000)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def session(self, server) -> Session:
+        self.use_server(server)
+        return Session()
+
+    @staticmethod
+    def part_puts(session) -> int:
+        return sum(1 for request in session.metrics.requests if request['method'] == 'PUT')
+
+    def checkpoints(self):
+        uploads_dir = os.environ[consts.FURIOSA_UPLOADS_DIR_ENV]
+        return os.listdir(uploads_dir) if os.path.isdir(uploads_dir) else []
+
+    def model_path(self) -> str:
+        path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        with open(path, 'wb') as model_file:
+            model_file.write(self.model)
+        return path
+
+    def test_upload_in_parts(self):
+        for model in (self.model_path(), self.model):
+            with FakeApiServer() as server, self.session(server) as session:
+                self.assertEqual(b'fake result of /api/v1/dss/optimize', Optimize.optimize(session, model))
+                self.assertEqual(9, self.part_puts(session))
+                self.assertEqual(1, len(server.blobs))
+                self.assertEqual([], self.checkpoints())
+
+    def test_resume_from_checkpoint(self):
+        os.environ[consts.FURIOSA_HTTP_MAX_RETRIES_ENV] = '0'
+        with FakeApiServer(failing_parts=[4]) as server:
+            with self.session(server) as session, self.assertRaises(ApiError):
+                Optimize.optimize(session, self.model)
+            self.assertEqual(1, len(self.checkpoints()))
+            received = len(next(iter(server.uploads.values())).parts)
+            self.assertGreater(received, 0)
+
+            server.failing_parts.clear()
+            with self.session(server) as session, open(self.model_path(), 'rb') as model:
+                self.assertEqual(b'fake result of /api/v1/dss/optimize', Optimize.optimize(session, model))
+                self.assertEqual(9 - received, self.part_puts(session))
+            self.assertEqual([], self.checkpoints())
+
+    def test_corrupted_part_is_sent_again(self):
+        with FakeApiServer(corrupt_parts=1) as server, self.session(server) as session:
+            Optimize.optimize(session, self.model)
+            self.assertEqual(10, self.part_puts(session))
+            self.assertEqual(['CHECKSUM_MISMATCH'], [retry['reason'] for retry in session.metrics.retries])
+
+    def test_server_without_chunked_uploads(self):
+        with FakeApiServer(chunked_uploads=False) as server, self.session(server) as session:
+            self.assertEqual(b'fake result of /api/v1/dss/optimize', Optimize.optimize(session, self.model))
+            self.assertEqual(0, self.part_puts(session))
+            self.assertGreater(server.received_bytes, len(self.model))
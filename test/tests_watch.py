@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from furiosacli.argparser import create_argparser
+from furiosacli.clidriver import Session
+from furiosacli.commands import Compile
+from furiosacli.watch import InotifyWatcher, PollingWatcher, WatchLoop, content_digest
+from test import FakeServerTestCase
+
+
+def write(path: str, data: bytes):
+    with open(path, 'wb') as output:
+        output.write(data)
+
+
+class WatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        write(self.model_path, b'model')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_watcher(self, watcher):
+        try:
+            self.assertEqual(set(), watcher.wait(0.05))
+            write(os.path.join(self.tmp_dir.name, 'output.enf'), b'not watched')
+            self.assertEqual(set(), watcher.wait(0.05))
+
+            # an editor saving into a new file and renaming it over the model
+            time.sleep(0.01)
+            write(self.model_path + '.swp', b'model v2')
+            os.replace(self.model_path + '.swp', self.model_path)
+            self.assertEqual({os.path.abspath(self.model_path)}, watcher.wait(2))
+        finally:
+            watcher.close()
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is only available on linux')
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher([self.model_path]))
+
+    def test_polling(self):
+        self.check_watcher(PollingWatcher([self.model_path], interval=0.01))
+
+    def test_skips_unchanged_content(self):
+        builds = []
+        loop = WatchLoop([self.model_path], lambda stop: builds.append(stop), debounce=0.05, quiet=True,
+                         watcher=PollingWatcher([self.model_path], interval=0.01))
+        loop.start_build(content_digest(loop.paths))
+        loop.thread.join()
+
+        time.sleep(0.01)
+        write(self.model_path, b'model')
+        self.assertFalse(loop.poll())
+        write(self.model_path, b'model v2')
+        self.assertTrue(loop.poll())
+        loop.thread.join()
+        self.assertEqual(2, len(builds))
+
+
+class CompileWatchTests(FakeServerTestCase):
+    server_options = {'compile_time': 0.5}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.session = Session()
+
+    def tearDown(self):
+        self.session.close()
+        self.tmp_dir.cleanup()
+
+    def test_newer_version_cancels_task(self):
+        model_path = os.path.join(self.tmp_dir.name, 'model.onnx')
+        output_path = os.path.join(self.tmp_dir.name, 'model.enf')
+        write(model_path, b'model')
+        args = create_argparser().parse_args(['-q', '--no-cache', 'compile', model_path, '-o', output_path,
+                                              '--poll-interval', '0.05', '--watch', '--debounce', '0.05'])
+        self.assertTrue(args.watch)
+        cmd = Compile(self.session, args, vars(args))
+
+        def build(stop):
+            cmd.stop = stop
+            cmd.run_once()
+
+        num_tasks = len(self.server.compile_tasks)
+        loop = WatchLoop([model_path], build, debounce=0.05, quiet=True,
+                         watcher=PollingWatcher([model_path], interval=0.01))
+        thread = threading.Thread(target=loop.run, kwargs={'max_builds': 2})
+        thread.start()
+
+        deadline = time.monotonic() + 5
+        while len(self.server.compile_tasks) == num_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        write(model_path, b'model v2')
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+        tasks = list(self.server.compile_tasks.values())[num_tasks:]
+        self.assertEqual(['cancelled', 'succeeded'], [task.phase for task in tasks])
+        with open(output_path, 'rb') as output:
+            self.assertIn(tasks[1].task_id.encode(), output.read())
+
+
+if __name__ == '__main__':
+    unittest.main()